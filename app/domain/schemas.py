@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 # class PlotData(BaseModel):
 #     lot_no: Optional[str] = Field(None, description="The lot number of the property")
@@ -26,4 +26,103 @@ class PlotData(BaseModel):
 class DocumentExtraction(BaseModel):
     # global_elevation: Optional[str] = Field(None, description="Elevation applying to all lots if global")
     # global_notes: Optional[str] = Field(None, description="Notes applying to entire document")
-    plots: List[PlotData] = Field(..., description="One entry per detected lot block")
\ No newline at end of file
+    plots: List[PlotData] = Field(..., description="One entry per detected lot block")
+
+# ---------------- API response (never sent to the model as a schema) ----------------
+
+class PayloadStats(BaseModel):
+    page: Optional[int] = Field(None, description="1-based PDF page, None for image uploads")
+    source_bytes: int = Field(..., description="Upload size, or raw pixmap size for PDF pages")
+    payload_bytes: int = Field(..., description="Encoded image bytes (or text layer bytes) sent to the model")
+    format: str = Field(..., description="jpeg | png | webp, or text for the PDF text-layer path")
+    color_mode: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    dpi: Optional[int] = Field(None, description="Render resolution of a rasterized PDF page")
+
+
+class NearDuplicateMatch(BaseModel):
+    page: Optional[int] = Field(None, description="1-based PDF page, None for image uploads")
+    distance: int = Field(..., description="Hamming distance (of 256 bits) to the previously extracted page")
+
+
+class RulePage(BaseModel):
+    page: int = Field(..., description="1-based PDF page")
+    llm_skipped: bool = Field(..., description="Every lot was read by the rules; no provider call was made")
+    # Per lot, confidence (0-1) of each field the rules found
+    confidence: List[Dict[str, float]] = Field(default_factory=list)
+    context: Optional[str] = Field(None, description="Page text outside the lot sections, not read into any plot (skipped pages)")
+
+
+class LotRetry(BaseModel):
+    page: Optional[int] = Field(None, description="1-based PDF page, None for image uploads")
+    lot_no: Optional[str] = Field(None, description="Lot number after the retry")
+    problems: List[str] = Field(..., description="What was missing or invalid in the first reading")
+    retried: bool = Field(..., description="False when the document's retry budget was already spent")
+    resolved: bool = Field(False, description="The lot passed validation after the retry")
+
+
+class PageTier(BaseModel):
+    page: Optional[int] = Field(None, description="1-based PDF page, None for image uploads")
+    tier: str = Field(..., description="Model tier the page was sent to: fast | standard | strong")
+    score: float = Field(..., description="Complexity score, 0 (typed single-lot text) to 1")
+    signals: Dict[str, float] = Field(default_factory=dict, description="Measures the score was computed from")
+
+
+class ExtractionMeta(BaseModel):
+    cached: bool = False
+    # False when a page / lot call failed at the provider (such results are never cached)
+    complete: bool = True
+    source_bytes: int = 0
+    payload_bytes: int = 0
+    # Prompt template id ("name@version") the document was extracted with
+    prompt_version: Optional[str] = None
+    images: List[PayloadStats] = Field(default_factory=list)
+    # Pages whose result was reused from a near-identical page seen before (no provider call)
+    near_duplicates: List[NearDuplicateMatch] = Field(default_factory=list)
+    # Text-layer pages the rule-based pre-extractor read
+    rules: List[RulePage] = Field(default_factory=list)
+    # Lots re-read at higher resolution because they came back incomplete or invalid
+    retries: List[LotRetry] = Field(default_factory=list)
+    # 1-based page each plot starts on, in plots order (PDFs; empty for image uploads)
+    pages: List[Optional[int]] = Field(default_factory=list)
+    # Model tier each page was sent to, from its complexity score (MODEL_TIERING)
+    tiers: List[PageTier] = Field(default_factory=list)
+
+
+class ExtractionResult(DocumentExtraction):
+    meta: ExtractionMeta = Field(default_factory=ExtractionMeta)
+
+
+class JobStatus(BaseModel):
+    id: str
+    # queued | running | done | failed
+    status: str
+    priority: int = 0
+    filename: str
+    attempts: int = 0
+    max_attempts: int = 0
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+    # Set when done; a failed job keeps its last partial result, if any
+    result: Optional[ExtractionResult] = None
+
+
+class StoredPlot(PlotData):
+    page: Optional[int] = Field(None, description="1-based PDF page the lot starts on, None for image uploads")
+    document_sha256: str = Field(..., description="SHA-256 of the uploaded document")
+    filename: Optional[str] = None
+    pages: str = Field(..., description="Page range the document was extracted with ('all' by default)")
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    prompt_version: Optional[str] = None
+    stored_at: float
+
+
+class PlotQueryResult(BaseModel):
+    # Matches overall, before limit / offset
+    total: int
+    limit: int
+    offset: int
+    plots: List[StoredPlot] = Field(default_factory=list)
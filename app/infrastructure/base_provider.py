@@ -0,0 +1,131 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, NamedTuple, Optional
+from app.domain.schemas import DocumentExtraction
+from app.infrastructure import metrics, model_tiers
+from app.infrastructure.prompt_registry import PROMPTS
+
+
+# Retries inside the LangChain / SDK clients. Rate limits and overload are
+# retried by the router's ProviderScheduler, which needs to see them.
+CLIENT_MAX_RETRIES = int(os.getenv("LLM_CLIENT_MAX_RETRIES", "0"))
+
+
+class ProviderError(Exception):
+    """Raised by every provider when a query fails; the original error is `cause`."""
+
+    def __init__(self, provider: str, cause: Exception):
+        super().__init__(f"{provider}: {cause}")
+        self.provider = provider
+        self.cause = cause
+
+
+class ModelRunnables(NamedTuple):
+    model: str
+    # Returns {"raw", "parsed", "parsing_error"} (include_raw=True), or a plain AIMessage
+    structured: Any
+    # Chat model whose text is the DocumentExtraction JSON, for astream
+    streaming: Any
+
+
+class BaseProvider(ABC):
+    """
+    Common interface of the LLM services.
+
+    query_document / aquery_document take LangChain content blocks (images or
+    text) and return a DocumentExtraction, or raise ProviderError. They never
+    return a placeholder result on failure; deciding what to do about a
+    failure is up to the caller (router / extractor).
+
+    `instructions` replaces the provider's default full-document prompt.
+    Prompts come from the shared PromptRegistry (app/prompts/).
+
+    astream_document yields the same DocumentExtraction as JSON text while
+    the model writes it; providers without streaming yield it in one piece.
+    """
+
+    provider_name: str = "base"
+    # Registry template used when no `instructions` are given
+    default_prompt: str = "extraction_full"
+    # Id of that template ("name@version"); part of the cache key and result meta
+    prompt_version: str = "v1"
+    model_name: str = ""
+
+    def _load_prompt(self):
+        self.prompt = PROMPTS.get(self.default_prompt)
+        self.prompt_version = self.prompt.id
+
+    def _prompt_block(self, instructions: Optional[str] = None) -> dict:
+        """Pre-built text block for the instructions, or for the default prompt."""
+        if not instructions:
+            return self.prompt.content_block
+        return PROMPTS.content_block(instructions)
+
+    def _unwrap_structured(self, result, model: Optional[str] = None) -> DocumentExtraction:
+        """
+        Structured LLMs are built with include_raw=True so token usage can be
+        read off the raw AIMessage; this returns the parsed DocumentExtraction.
+        """
+        metrics.record_token_usage(self.provider_name, result.get("raw"), model)
+        if result.get("parsing_error") is not None:
+            raise result["parsing_error"]
+        if result.get("parsed") is None:
+            raise ValueError("Model returned no structured output")
+        return result["parsed"]
+
+    async def _stream_text(self, runnable, messages, model: Optional[str] = None) -> AsyncIterator[str]:
+        """Text of a LangChain chat stream; token usage is recorded once it ends."""
+        message = None
+        async for chunk in runnable.astream(messages):
+            message = chunk if message is None else message + chunk
+            if chunk.text:
+                yield chunk.text
+        metrics.record_token_usage(self.provider_name, message, model)
+
+    @abstractmethod
+    def query_document(self, image_parts, instructions: Optional[str] = None) -> DocumentExtraction:
+        ...
+
+    @abstractmethod
+    async def aquery_document(self, image_parts, instructions: Optional[str] = None) -> DocumentExtraction:
+        ...
+
+    async def astream_document(self, image_parts, instructions: Optional[str] = None) -> AsyncIterator[str]:
+        result = await self.aquery_document(image_parts, instructions)
+        yield result.model_dump_json()
+
+
+class ChatModelProvider(BaseProvider):
+    """
+    A provider backed by LangChain chat models, one per model tier.
+
+    The model is chosen per call from the model tier of the page being
+    extracted (model_tiers.current(), set by the extractor): tier_models
+    maps fast / strong to a cheaper / stronger model, <PROVIDER>_MODEL_<TIER>
+    (e.g. GEMINI_MODEL_STRONG) overrides it, and model_name is the standard
+    tier. Subclasses build a model's runnables in _build_runnables;
+    _runnables() keeps one set per model.
+    """
+
+    # tier -> model; tiers not listed use model_name
+    tier_models: Dict[str, str] = {}
+    # model -> ModelRunnables, filled by _runnables()
+    _models: Dict[str, ModelRunnables]
+
+    def model_for(self, tier: Optional[str]) -> str:
+        if not tier:
+            return self.model_name
+        override = os.getenv(f"{self.provider_name.upper()}_MODEL_{tier.upper()}")
+        return override or self.tier_models.get(tier) or self.model_name
+
+    @abstractmethod
+    def _build_runnables(self, model: str) -> ModelRunnables:
+        ...
+
+    def _runnables(self) -> ModelRunnables:
+        """Runnables of the current tier's model, built on first use."""
+        model = self.model_for(model_tiers.current())
+        runnables = self._models.get(model)
+        if runnables is None:
+            runnables = self._models[model] = self._build_runnables(model)
+        return runnables
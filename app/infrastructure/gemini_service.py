@@ -1,18 +1,27 @@
 import os
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage
+from google.genai import Client
+from google.genai.types import HttpOptions
 from dotenv import load_dotenv
 from app.domain.schemas import PlotData, DocumentExtraction
+from app.infrastructure.base_provider import ChatModelProvider, ModelRunnables, ProviderError, CLIENT_MAX_RETRIES
+from app.infrastructure.http_clients import HTTP_CLIENTS
 
 load_dotenv()
 
-class GeminiService:
+class GeminiService(ChatModelProvider):
     _instance = None
+    provider_name = "gemini"
+    model_name = "gemini-flash-latest"
+    tier_models = {"fast": "gemini-flash-lite-latest", "strong": "gemini-pro-latest"}
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(GeminiService, cls).__new__(cls)
-            cls._instance._initialize_model()
+            # Only a fully initialized instance is kept, so a failed init is retried
+            instance = super(GeminiService, cls).__new__(cls)
+            instance._initialize_model()
+            cls._instance = instance
         return cls._instance
 
     def _initialize_model(self):
@@ -21,187 +30,80 @@ class GeminiService:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
         
         print(f"--- Configuring Gemini with Key: {self.api_key[:5]}... ---")
-        
+
+        # Standard tier now; fast / strong models on their first page
+        self._models = {self.model_name: self._build_runnables(self.model_name)}
+        self._load_prompt()
+
+    def _build_runnables(self, model: str) -> ModelRunnables:
         # Initialize LangChain Chat Model
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-flash-latest",
-            google_api_key=self.api_key
+        llm = ChatGoogleGenerativeAI(
+            model=model,
+            google_api_key=self.api_key,
+            max_retries=CLIENT_MAX_RETRIES,
         )
-        
+        # The wrapper only takes client kwargs; swap in a client on the shared connection pool
+        llm.client = Client(
+            api_key=self.api_key,
+            http_options=HttpOptions(
+                httpx_client=HTTP_CLIENTS.sync_client(),
+                httpx_async_client=HTTP_CLIENTS.async_client(),
+            ),
+        )
+
         # Configure structured output
-        # self.structured_llm = self.llm.with_structured_output(PlotData)
-        self.structured_llm = self.llm.with_structured_output(DocumentExtraction)
+        # structured_llm = llm.with_structured_output(PlotData)
+        structured_llm = llm.with_structured_output(DocumentExtraction, include_raw=True)
+        # Same JSON-schema mode, left unparsed so the text can be read as it streams
+        streaming_llm = llm.bind(
+            response_mime_type="application/json",
+            response_json_schema=DocumentExtraction.model_json_schema(),
+        )
+        return ModelRunnables(model, structured_llm, streaming_llm)
 
 
-    def query_document(self, image_parts):
+    def _build_messages(self, image_parts, instructions=None):
         """
         image_parts: List of base64 encoded image data dicts or PIL Images.
         LangChain handles PIL images in HumanMessage content blocks.
+        instructions: replaces the default full-document prompt when given.
         """
-        # Prompt to steer the model
-        # prompt_text = (
-        #     "Analyze this document. Extract: "
-        #     "1. Lot Number "
-        #     "2. Block Number "
-        #     "3. Full Property Address "
-        #     "4. House Model/Plan Name "
-        #     "5. Elevation "
-        #     "6. Garage Swing (Left, Right, Straight) "
-        #     "7. External Structure materials "
-        #     "8. Any relevant notes."
-        # )
-
-        prompt_text = """
-            You are an expert real-estate and construction document analysis system.
-
-These images may include:
-- Lot Specific Order Forms
-- Spec Request Forms
-- Builder Configuration Sheets
-- Construction Option Lists
-- Scanned PDFs and photos
-
-Documents often contain MULTIPLE LOT SECTIONS in a single page.
-
-Each lot section must be extracted as a SEPARATE structured record.
-
-The document may be rotated, blurry, handwritten, or partially cropped.
-
-Your task is to perform FORENSIC-LEVEL multi-entity extraction.
-
-Follow these rules strictly:
-
-------------------------------------------------------------------
-
-### 1. GLOBAL vs LOT-SPECIFIC DATA
-
-First identify:
-
-GLOBAL fields (apply to all lots unless overridden):
-- Project-wide elevation
-- Community name
-- Builder name
-- Global notes
-
-Then identify REPEATING LOT BLOCKS.
-
-A LOT BLOCK is defined by patterns such as:
-- "Lot 116 - 1685"
-- "Lot 117:"
-- "Homesite 118"
-- "Lot #119"
-
-Each detected lot block represents ONE independent property.
-
-------------------------------------------------------------------
-
-### 2. LOT BLOCK DETECTION RULES
-
-You MUST:
-
-- Scan the entire page top to bottom
-- Identify EVERY lot header
-- Split the document into logical LOT SECTIONS
-- Extract each lot independently
-
-NEVER merge data across different lots.
-
-If 6 lots appear → output 6 plot objects.
-
-------------------------------------------------------------------
-
-### 3. HIERARCHICAL INHERITANCE
-
-If a field appears globally and not repeated inside a lot block:
-
-- Inherit it into each lot ONLY if clearly global
-
-Example:
-"Elevation B" at top of page → applies to all lots
+        content = [self._prompt_block(instructions)]
 
-But:
-
-If a lot block overrides it → use the lot value.
-
-------------------------------------------------------------------
-
-### 4. FIELD NORMALIZATION
-
-Normalize strictly:
-
-- LotNumber → numeric only
-- BlockNumber → numeric only
-- GarageSwing → Left | Right | Straight
-- Elevation → Single letter/code only
-
-------------------------------------------------------------------
-
-### 5. LOT-SPECIFIC NOTES HANDLING
-
-For each lot block:
-
-Capture bullet items such as:
-
-- Garage Left / Right
-- Dual sinks
-- Shower in lieu of tub
-- Patio slab
-- Vanity upgrades
-
-These MUST go into:
-
-optional_notes (lot-specific only)
-
-------------------------------------------------------------------
-
-### 6. STRICT ANTI-HALLUCINATION RULES
-
-- Do NOT guess missing values
-- Do NOT copy values between lots
-- Do NOT invent addresses or models
-- Only extract what is visible
-
-------------------------------------------------------------------
-
-### 7. REQUIRED OUTPUT FORMAT (STRICT JSON)
-
-Return JSON matching this structure:
-
-{
-  "global_elevation": "... or null",
-  "global_notes": "... or null",
-  "plots": [
-    {
-      "lot_no": "...",
-      "block": "...",
-      "address": "...",
-      "model_selected": "...",
-      "elevation": "...",
-      "garage_swing": "...",
-      "external_structure": "...",
-      "optional_notes": "..."
-    }
-  ]
-}
-
-There must be ONE plots[] entry PER detected lot block.
+        return [
+            HumanMessage(content=content + image_parts)
+        ]
 
-------------------------------------------------------------------
+    def query_document(self, image_parts, instructions=None):
+        messages = self._build_messages(image_parts, instructions)
 
-Extract now.
+        try:
+            runnables = self._runnables()
+            # include_raw=True returns {"raw", "parsed", "parsing_error"}
+            result = runnables.structured.invoke(messages)
+            return self._unwrap_structured(result, runnables.model)
+        except Exception as e:
+            print(f"Gemini API Error: {e}")
+            raise ProviderError(self.provider_name, e) from e
 
-        """
+    async def aquery_document(self, image_parts, instructions=None):
+        messages = self._build_messages(image_parts, instructions)
 
-        content = [{"type": "text", "text": prompt_text}]
+        try:
+            runnables = self._runnables()
+            result = await runnables.structured.ainvoke(messages)
+            return self._unwrap_structured(result, runnables.model)
+        except Exception as e:
+            print(f"Gemini API Error: {e}")
+            raise ProviderError(self.provider_name, e) from e
 
-        messages = [
-            HumanMessage(content=content + image_parts)
-        ]
+    async def astream_document(self, image_parts, instructions=None):
+        messages = self._build_messages(image_parts, instructions)
 
         try:
-            # Invoking with structured output returns a Pydantic object directly
-            result = self.structured_llm.invoke(messages)
-            return result
+            runnables = self._runnables()
+            async for text in self._stream_text(runnables.streaming, messages, runnables.model):
+                yield text
         except Exception as e:
             print(f"Gemini API Error: {e}")
-            raise e
+            raise ProviderError(self.provider_name, e) from e
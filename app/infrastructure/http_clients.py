@@ -0,0 +1,241 @@
+import os
+import asyncio
+import weakref
+import threading
+import importlib.util
+from collections import Counter
+from typing import Optional
+import httpx
+
+# Connections per worker process, shared by every provider (pools are per host)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+# Per-phase timeouts (seconds). read covers the whole wait for the model's answer.
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "30"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+# auto: HTTP/2 when the h2 package is installed
+HTTP_HTTP2 = os.getenv("HTTP_HTTP2", "auto").lower()
+
+_PHASES = ("connect", "read", "write", "pool")
+
+
+def _capped(requested: Optional[dict], limits: dict) -> dict:
+    """Per-phase timeouts no looser than ours; SDKs pass None (no limit) or several minutes."""
+    requested = requested or {}
+    return {
+        phase: limits[phase] if requested.get(phase) is None else min(requested[phase], limits[phase])
+        for phase in _PHASES
+    }
+
+
+class _Traffic:
+    """Request / connection counters fed by httpcore trace events."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def event(self, name: str):
+        if name == "connection.connect_tcp.complete":
+            self.count("new_connections")
+        elif name == "connection.start_tls.complete":
+            self.count("tls_handshakes")
+
+
+class _SharedTransport(httpx.BaseTransport):
+    """
+    The process-wide sync transport behind every client handed out. Applies
+    the timeout caps and counts traffic; closing a client does not close it.
+    """
+
+    def __init__(self, transport: httpx.HTTPTransport, timeouts: dict, traffic: _Traffic):
+        self.transport = transport
+        self.timeouts = timeouts
+        self.traffic = traffic
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["timeout"] = _capped(request.extensions.get("timeout"), self.timeouts)
+        request.extensions["trace"] = lambda name, info: self.traffic.event(name)
+        self.traffic.count("requests")
+        try:
+            return self.transport.handle_request(request)
+        except httpx.TransportError as e:
+            self.traffic.count(type(e).__name__)
+            raise
+
+    def close(self):
+        pass
+
+
+class _SharedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    Async counterpart. Connections belong to the event loop that opened
+    them and DocumentExtractor.process() runs each call in its own
+    asyncio.run, so there is one pool per running loop; pools of closed
+    loops are dropped.
+    """
+
+    def __init__(self, factory, timeouts: dict, traffic: _Traffic):
+        self.factory = factory
+        self.timeouts = timeouts
+        self.traffic = traffic
+        self._pools = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncHTTPTransport
+        self._lock = threading.Lock()
+
+    @property
+    def transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for closed in [other for other in self._pools if other.is_closed()]:
+                del self._pools[closed]
+            transport = self._pools.get(loop)
+            if transport is None:
+                transport = self._pools[loop] = self.factory()
+            return transport
+
+    async def close_pools(self):
+        """Closes the running loop's pool; other loops' connections go with their loop."""
+        with self._lock:
+            pools, self._pools = self._pools, weakref.WeakKeyDictionary()
+        pool = pools.get(asyncio.get_running_loop())
+        if pool is not None:
+            await pool.aclose()
+
+    def transports(self) -> list:
+        with self._lock:
+            return [transport for loop, transport in self._pools.items() if not loop.is_closed()]
+
+    async def _trace(self, name: str, info):
+        self.traffic.event(name)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["timeout"] = _capped(request.extensions.get("timeout"), self.timeouts)
+        request.extensions["trace"] = self._trace
+        self.traffic.count("requests")
+        try:
+            return await self.transport.handle_async_request(request)
+        except httpx.TransportError as e:
+            self.traffic.count(type(e).__name__)
+            raise
+
+    async def aclose(self):
+        pass
+
+
+def _pool_stats(*transports) -> dict:
+    pools = [getattr(transport, "_pool", None) for transport in transports]
+    connections = [c for pool in pools for c in getattr(pool, "connections", ())]
+    requests = [r for pool in pools for r in getattr(pool, "_requests", ())]
+    idle = sum(1 for c in connections if c.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "http2": sum(1 for c in connections if "HTTP/2" in c.info()),
+        "queued_requests": sum(1 for r in requests if r.is_queued()),
+    }
+
+
+class HttpClients:
+    """
+    One keep-alive connection pool per worker process for all provider SDKs.
+
+    The OpenAI, Gemini and Hugging Face clients are built on httpx; each gets
+    clients from here that share a single sync transport and an async one
+    (a pool per event loop),
+    so TLS connections to a provider are reused across requests and
+    providers, the total is bounded (HTTP_MAX_CONNECTIONS) and HTTP/2 is used
+    when available. Connect / read / write / pool timeouts are enforced at
+    the transport, because SDKs pass their own per-request timeouts (or
+    none at all). stats() reports pool occupancy and how many requests
+    needed a new connection or TLS handshake.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        keepalive_seconds: float = HTTP_KEEPALIVE_SECONDS,
+        timeouts: Optional[dict] = None,
+        http2: Optional[bool] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_seconds,
+        )
+        self.timeouts = timeouts or {
+            "connect": HTTP_CONNECT_TIMEOUT,
+            "read": HTTP_READ_TIMEOUT,
+            "write": HTTP_WRITE_TIMEOUT,
+            "pool": HTTP_POOL_TIMEOUT,
+        }
+        if http2 is None:
+            http2 = HTTP_HTTP2 in ("1", "true", "yes") or (
+                HTTP_HTTP2 == "auto" and importlib.util.find_spec("h2") is not None
+            )
+        self.http2 = http2
+
+        self.traffic = _Traffic()
+        self._transport = None
+        self._async_transport = None
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(**self.timeouts)
+
+    def _transports(self):
+        # Built on first use: the SSL context costs tens of milliseconds
+        with self._lock:
+            if self._transport is None:
+                self._transport = _SharedTransport(
+                    httpx.HTTPTransport(limits=self.limits, http2=self.http2), self.timeouts, self.traffic
+                )
+                self._async_transport = _SharedAsyncTransport(
+                    lambda: httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2), self.timeouts, self.traffic
+                )
+            return self._transport, self._async_transport
+
+    def sync_client(self, **kwargs) -> httpx.Client:
+        return httpx.Client(transport=self._transports()[0], timeout=self.timeout, **kwargs)
+
+    def async_client(self, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=self._transports()[1], timeout=self.timeout, **kwargs)
+
+    def stats(self) -> dict:
+        with self.traffic._lock:
+            counts = dict(self.traffic.counts)
+        requests = counts.pop("requests", 0)
+        new_connections = counts.pop("new_connections", 0)
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "timeouts": self.timeouts,
+            "requests": requests,
+            "new_connections": new_connections,
+            "tls_handshakes": counts.pop("tls_handshakes", 0),
+            "reused_ratio": round(1 - new_connections / requests, 3) if requests else None,
+            "errors": counts,
+            "sync_pool": _pool_stats(self._transport.transport) if self._transport else None,
+            "async_pool": _pool_stats(*self._async_transport.transports()) if self._async_transport else None,
+        }
+
+    async def aclose(self):
+        with self._lock:
+            transport, async_transport = self._transport, self._async_transport
+            self._transport = self._async_transport = None
+        if transport is not None:
+            transport.transport.close()
+            await async_transport.close_pools()
+
+
+HTTP_CLIENTS = HttpClients()
@@ -1,15 +1,28 @@
 import os
 from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
 from langchain_core.messages import HumanMessage
-from app.domain.schemas import DocumentExtraction, PlotData
+from huggingface_hub import set_client_factory, set_async_client_factory
+from app.domain.schemas import DocumentExtraction
+from app.infrastructure.base_provider import ChatModelProvider, ModelRunnables, ProviderError
+from app.infrastructure import metrics
+from app.infrastructure.http_clients import HTTP_CLIENTS
 
-class HuggingFaceService:
+class HuggingFaceService(ChatModelProvider):
     _instance = None
+    provider_name = "huggingface"
+    # Reverting to Instruct model (User set to Embedding model previously which is invalid for chat)
+    model_name = "Qwen/Qwen2-VL-7B-Instruct"
+    # No structured output here, so the default prompt spells out the JSON
+    default_prompt = "extraction_json"
+    # One hosted model for every tier unless HUGGINGFACE_MODEL_<TIER> names another
+    tier_models = {}
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(HuggingFaceService, cls).__new__(cls)
-            cls._instance._initialize_model()
+            # Only a fully initialized instance is kept, so a failed init is retried
+            instance = super(HuggingFaceService, cls).__new__(cls)
+            instance._initialize_model()
+            cls._instance = instance
         return cls._instance
 
     def _initialize_model(self):
@@ -19,75 +32,86 @@ class HuggingFaceService:
         
         print(f"--- Configuring Hugging Face Service (ChatHuggingFace) ---")
         
-        # Reverting to Instruct model (User set to Embedding model previously which is invalid for chat)
-        self.repo_id = "Qwen/Qwen2-VL-7B-Instruct"
+        self.repo_id = self.model_name
+
+        # huggingface_hub builds its clients through these factories; point them at the shared pool
+        set_client_factory(lambda: HTTP_CLIENTS.sync_client(follow_redirects=True))
+        set_async_client_factory(lambda: HTTP_CLIENTS.async_client(follow_redirects=True))
         
+        # Standard tier now; other tiers' models on their first page
+        self._models = {self.model_name: self._build_runnables(self.repo_id)}
+        self._load_prompt()
+
+    def _build_runnables(self, model: str) -> ModelRunnables:
         # Initialize Endpoint (Remote Inference API)
-        self.llm = HuggingFaceEndpoint(
-            repo_id=self.repo_id,
+        llm = HuggingFaceEndpoint(
+            repo_id=model,
             huggingfacehub_api_token=self.api_key,
             task="text-generation",
             temperature=0.1,
             max_new_tokens=4096
         )
-        
-        # Initialize Chat Interface
-        self.chat_model = ChatHuggingFace(llm=self.llm)
-        aa = self.chat_model.invoke('what is the capital of india')
-        print('0---------------------------------',aa)
 
-    def query_document(self, image_parts):
+        # Initialize Chat Interface; plain text out, parsed by _parse_response
+        chat_model = ChatHuggingFace(llm=llm)
+        return ModelRunnables(model, chat_model, chat_model)
+
+    def _build_message(self, image_parts, instructions=None):
         """
+        instructions: replaces the default full-document prompt when given.
         image_parts: List of dicts with "type": "image_url" and "image_url": {"url": "data:..."}
         """
-        prompt_text = """
-            You are an expert real-estate and construction document analysis system.
-            Return JSON matching this structure perfectly:
-            {
-              "global_elevation": "... or null",
-              "global_notes": "... or null",
-              "plots": [
-                {
-                  "lot_no": "...",
-                  "block": "...",
-                  "address": "...",
-                  "model_selected": "...",
-                  "elevation": "...",
-                  "garage_swing": "...",
-                  "external_structure": "...",
-                  "optional_notes": "..."
-                }
-              ]
-            }
-            Strictly output VALID JSON ONLY. No markdown blocks.
-            """
+        content = [
+            self._prompt_block(instructions),
+        ]
+        content.extend(image_parts)
 
-        try:
-            content = [
-                {"type": "text", "text": prompt_text},
-            ]
-            content.extend(image_parts)
+        return HumanMessage(content=content)
+
+    def _parse_response(self, raw_response: str) -> DocumentExtraction:
+        # Clean response
+        if "```json" in raw_response:
+            raw_response = raw_response.split("```json")[1].split("```")[0].strip()
+        elif "```" in raw_response:
+            raw_response = raw_response.split("```")[1].split("```")[0].strip()
             
-            message = HumanMessage(content=content)
+        return DocumentExtraction.model_validate_json(raw_response)
+
+    def query_document(self, image_parts, instructions=None):
+        try:
+            message = self._build_message(image_parts, instructions)
             
             # Invoke
-            result = self.chat_model.invoke([message])
-            
-            raw_response = result.content
+            runnables = self._runnables()
+            result = runnables.structured.invoke([message])
+            metrics.record_token_usage(self.provider_name, result, runnables.model)
             
-            # Clean response
-            if "```json" in raw_response:
-                raw_response = raw_response.split("```json")[1].split("```")[0].strip()
-            elif "```" in raw_response:
-                raw_response = raw_response.split("```")[1].split("```")[0].strip()
-                
-            return DocumentExtraction.model_validate_json(raw_response)
+            return self._parse_response(result.content)
+
+        except Exception as e:
+            print(f"HF Error: {repr(e)}")
+            raise ProviderError(self.provider_name, e) from e
+
+    async def aquery_document(self, image_parts, instructions=None):
+        try:
+            message = self._build_message(image_parts, instructions)
+            runnables = self._runnables()
+            result = await runnables.structured.ainvoke([message])
+            metrics.record_token_usage(self.provider_name, result, runnables.model)
+            return self._parse_response(result.content)
+
+        except Exception as e:
+            print(f"HF Error: {repr(e)}")
+            raise ProviderError(self.provider_name, e) from e
+
+    async def astream_document(self, image_parts, instructions=None):
+        # Code fences around the JSON are skipped by the stream parser
+        try:
+            message = self._build_message(image_parts, instructions)
+            runnables = self._runnables()
+            async for text in self._stream_text(runnables.streaming, [message], runnables.model):
+                yield text
 
         except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return DocumentExtraction(
-                global_elevation=None, 
-                global_notes=None, 
-                plots=[PlotData(optional_notes=f"HF Error: {repr(e)}")]
-            )
+            print(f"HF Error: {repr(e)}")
+            raise ProviderError(self.provider_name, e) from e
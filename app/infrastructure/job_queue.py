@@ -0,0 +1,228 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from typing import Optional
+
+class JobQueue:
+    """
+    Persistent extraction job queue in SQLite.
+    Job states: queued -> running -> done | failed (back to queued on retry).
+
+    Uploads are moved into `store_dir` and a row records everything needed to
+    run the job, so queued work survives a restart. Every uvicorn worker on
+    the box can share the file: claims happen in an IMMEDIATE transaction and
+    carry a lease, and a job whose lease ran out (its worker died) is handed
+    to the next claimer.
+    """
+
+    def __init__(self, db_path: str, store_dir: str, lease_seconds: float = 300, retention_seconds: float = 7 * 86400):
+        self.db_path = db_path
+        self.store_dir = store_dir
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+
+        for directory in (os.path.dirname(db_path), store_dir):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=10.0, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                filename TEXT NOT NULL,
+                path TEXT,
+                size INTEGER NOT NULL DEFAULT 0,
+                sha256 TEXT,
+                kind TEXT,
+                pages TEXT,
+                quality TEXT,
+                use_cache INTEGER NOT NULL DEFAULT 1,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                available_at REAL NOT NULL,
+                lease_until REAL,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        # Queues created before per-job render quality
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "quality" not in columns:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN quality TEXT")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, created_at)"
+        )
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        return cls(
+            db_path=os.getenv("JOB_DB", ".cache/jobs.sqlite3"),
+            store_dir=os.getenv("JOB_STORE_DIR", ".cache/jobs"),
+            lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "300")),
+            retention_seconds=float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400))),
+        )
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            self._db.execute(sql, params)
+
+    def _query(self, sql: str, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # ---------------- producer side ----------------
+
+    def enqueue(self, source, filename: str, priority: int = 0, pages: Optional[str] = None,
+                use_cache: bool = True, max_attempts: int = 3, quality: Optional[str] = None) -> str:
+        """Takes ownership of the spooled DocumentSource's file."""
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.store_dir, job_id)
+        shutil.move(source.path, path)
+        source.path = None
+
+        now = time.time()
+        try:
+            self._execute(
+                """
+                INSERT INTO jobs (id, status, priority, filename, path, size, sha256, kind, pages, quality,
+                                  use_cache, max_attempts, available_at, created_at, updated_at)
+                VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, priority, filename, path, source.size, source.sha256, source.kind, pages, quality,
+                 int(use_cache), max_attempts, now, now, now),
+            )
+        except sqlite3.Error:
+            os.unlink(path)
+            raise
+        return job_id
+
+    def queued_count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM jobs WHERE status = 'queued'")[0][0]
+
+    # ---------------- worker side ----------------
+
+    def claim(self) -> Optional[sqlite3.Row]:
+        """Highest-priority ready job (oldest first), now leased to the caller."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    """
+                    SELECT id FROM jobs
+                    WHERE (status = 'queued' AND available_at <= ?)
+                       OR (status = 'running' AND lease_until < ?)
+                    ORDER BY priority DESC, created_at
+                    LIMIT 1
+                    """,
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+
+                job = self._db.execute(
+                    """
+                    UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                                    lease_until = ?, updated_at = ?
+                    WHERE id = ?
+                    RETURNING *
+                    """,
+                    (now + self.lease_seconds, now, row["id"]),
+                ).fetchone()
+                self._db.execute("COMMIT")
+                return job
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def extend_lease(self, job_id: str):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+            (now + self.lease_seconds, now, job_id),
+        )
+
+    def complete(self, job_id: str, result_json: str):
+        self._finish(job_id, "done", result_json, None)
+
+    def fail(self, job_id: str, error: str, result_json: Optional[str] = None):
+        self._finish(job_id, "failed", result_json, error)
+
+    def retry(self, job_id: str, error: str, delay_seconds: float):
+        now = time.time()
+        self._execute(
+            """
+            UPDATE jobs SET status = 'queued', error = ?, available_at = ?,
+                            lease_until = NULL, updated_at = ?
+            WHERE id = ?
+            """,
+            (error, now + delay_seconds, now, job_id),
+        )
+
+    def release(self, job_id: str):
+        """Hand a job back untouched (worker shutting down); the attempt is not counted."""
+        now = time.time()
+        self._execute(
+            """
+            UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0),
+                            lease_until = NULL, updated_at = ?
+            WHERE id = ? AND status = 'running'
+            """,
+            (now, job_id),
+        )
+
+    def _finish(self, job_id: str, status: str, result_json: Optional[str], error: Optional[str]):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self._db.execute(
+                """
+                UPDATE jobs SET status = ?, result = ?, error = ?, path = NULL,
+                                lease_until = NULL, updated_at = ?
+                WHERE id = ?
+                """,
+                (status, result_json, error, now, job_id),
+            )
+        # The stored upload is only needed until the job is settled
+        if row is not None and row["path"]:
+            try:
+                os.unlink(row["path"])
+            except FileNotFoundError:
+                pass
+
+    def purge(self):
+        """Drop settled jobs older than the retention window."""
+        cutoff = time.time() - self.retention_seconds
+        self._execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)
+        )
+
+    # ---------------- reads ----------------
+
+    def get(self, job_id: str) -> Optional[sqlite3.Row]:
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return rows[0] if rows else None
+
+    def stats(self) -> dict:
+        counts = {status: 0 for status in ("queued", "running", "done", "failed")}
+        for row in self._query("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        oldest = self._query("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'")[0][0]
+        return {
+            "jobs": counts,
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+        }
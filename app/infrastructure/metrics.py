@@ -0,0 +1,305 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import defaultdict
+from typing import Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+
+# Adds a Server-Timing header with per-stage durations to /extract responses
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+
+_STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_BYTE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7)
+
+STAGE_SECONDS = Histogram(
+    "extraction_stage_seconds",
+    "Time spent in one pipeline stage, observed once per page / lot section",
+    ["stage", "file_type", "provider"],
+    buckets=_STAGE_BUCKETS,
+)
+EXTRACTION_SECONDS = Histogram(
+    "extraction_seconds",
+    "End-to-end extraction time per document",
+    ["file_type", "outcome"],
+    buckets=_STAGE_BUCKETS,
+)
+PROVIDER_CALL_SECONDS = Histogram(
+    "provider_call_seconds",
+    "Latency of one LLM provider call",
+    ["provider", "outcome"],
+    buckets=_STAGE_BUCKETS,
+)
+PROVIDER_QUEUE_SECONDS = Histogram(
+    "provider_queue_seconds",
+    "Time a provider call waited for a concurrency slot, throttle pause or rate token",
+    ["provider"],
+    buckets=_STAGE_BUCKETS,
+)
+PAYLOAD_BYTES = Histogram(
+    "extraction_payload_bytes",
+    "Bytes per document before (source) and after (payload) shaping",
+    ["file_type", "kind"],
+    buckets=_BYTE_BUCKETS,
+)
+PLOTS_PER_DOCUMENT = Histogram(
+    "extraction_plots_per_document",
+    "Plots returned per document",
+    ["file_type"],
+    buckets=(0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 48),
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported by LangChain usage metadata",
+    ["provider", "direction"],
+)
+EXTRACTIONS = Counter(
+    "extractions_total",
+    "Documents processed",
+    ["file_type", "outcome"],
+)
+JOBS = Counter(
+    "extraction_jobs_total",
+    "Job lifecycle events in the worker pool (started, done, retried, failed)",
+    ["outcome"],
+)
+JOB_WAIT_SECONDS = Histogram(
+    "extraction_job_wait_seconds",
+    "Time a job spent queued before a worker picked it up",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+NEAR_DUPLICATES = Counter(
+    "near_duplicate_pages_total",
+    "Near-duplicate index lookups per page (hit, miss, expired)",
+    ["outcome"],
+)
+RULE_PAGES = Counter(
+    "rule_extraction_pages_total",
+    "Text-layer pages by rule-based pre-extraction outcome (skipped_llm, hinted, no_match)",
+    ["outcome"],
+)
+LOT_RETRIES = Counter(
+    "lot_retries_total",
+    "Lots re-read because they came back incomplete or invalid (resolved, unresolved, failed, over_budget)",
+    ["outcome"],
+)
+MODEL_TIER_PAGES = Counter(
+    "model_tier_pages_total",
+    "Pages sent to the provider per model tier (fast, standard, strong)",
+    ["tier"],
+)
+# Per model, so the cost of each tier can be read off token counts
+MODEL_TOKENS = Counter(
+    "llm_model_tokens_total",
+    "Tokens reported by LangChain usage metadata per model",
+    ["provider", "model", "direction"],
+)
+RENDER_POOL_WAIT_SECONDS = Histogram(
+    "render_pool_wait_seconds",
+    "Time a page waited for a render-pool process before rasterizing / encoding started",
+    buckets=_STAGE_BUCKETS,
+)
+# Per prompt arm, so a compact-vs-full A/B can be read as tokens per document
+PROMPT_DOCUMENTS = Counter(
+    "prompt_documents_total",
+    "Documents processed per prompt version",
+    ["prompt", "outcome"],
+)
+PROMPT_TOKENS = Counter(
+    "prompt_tokens_total",
+    "Provider tokens per prompt version of the document",
+    ["prompt", "direction"],
+)
+
+
+def file_type_label(is_pdf: bool) -> str:
+    return "pdf" if is_pdf else "image"
+
+
+class StageTimer:
+    """Per-request accumulator of stage durations, summed over pages (feeds the Server-Timing header)."""
+
+    def __init__(self, file_type: str):
+        self.file_type = file_type
+        self.prompt = None
+        self.durations = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, stage_name: str, seconds: float):
+        with self._lock:
+            self.durations[stage_name] += seconds
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(
+                f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.durations.items()
+            )
+
+
+# asyncio.to_thread copies the context, so worker threads see the same timer
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+# Innermost provider stage (provider_call, lot_retry) of this request: a
+# one-item list naming the provider that answered, set by record_provider_call.
+# Tasks copy the context, so hedged calls update the same list.
+_provider_cell: ContextVar[Optional[list]] = ContextVar("stage_provider", default=None)
+# False in render-pool processes: their stages are handed back to the parent
+# (merge_stages) instead of being observed twice
+_observe_stages = True
+
+
+def begin_request(filename: str) -> StageTimer:
+    # Guessed from the name until the upload is sniffed (set_file_type)
+    timer = StageTimer(file_type_label((filename or "").lower().endswith(".pdf")))
+    _current_timer.set(timer)
+    return timer
+
+
+def ensure_request(filename: str) -> StageTimer:
+    """Current request's timer, or a new one for callers outside the API (scripts, jobs)."""
+    return _current_timer.get() or begin_request(filename)
+
+
+def set_file_type(is_pdf: bool):
+    """File type from the upload's magic bytes, replacing the filename guess."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.file_type = file_type_label(is_pdf)
+
+
+def current_file_type() -> str:
+    timer = _current_timer.get()
+    return timer.file_type if timer else "unknown"
+
+
+def record_stage(stage_name: str, seconds: float, provider: Optional[str] = None):
+    """provider: the LLM provider the stage belongs to; local stages have none."""
+    timer = _current_timer.get()
+    if _observe_stages:
+        STAGE_SECONDS.labels(stage_name, timer.file_type if timer else "unknown", provider or "none").observe(seconds)
+    if timer is not None:
+        timer.add(stage_name, seconds)
+
+
+def collect_stages_only():
+    """Render-pool processes: time stages on the request timer only."""
+    global _observe_stages
+    _observe_stages = False
+
+
+def merge_stages(durations: dict):
+    """Stage durations measured in a render-pool process, recorded as if measured here."""
+    for stage_name, seconds in durations.items():
+        record_stage(stage_name, seconds)
+
+
+@contextmanager
+def stage(stage_name: str, provider: Optional[str] = None):
+    """
+    provider marks a stage that queries the LLM provider: it is labelled
+    with the provider that answered (through a router), else with provider.
+    """
+    start = time.perf_counter()
+    cell = token = None
+    if provider is not None:
+        cell = [provider]
+        token = _provider_cell.set(cell)
+    try:
+        yield
+    finally:
+        if token is not None:
+            _provider_cell.reset(token)
+        record_stage(stage_name, time.perf_counter() - start, cell[0] if cell else None)
+
+
+def set_prompt(prompt_id: str):
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.prompt = prompt_id
+
+
+def record_provider_call(provider: str, seconds: float, ok: bool):
+    PROVIDER_CALL_SECONDS.labels(provider, "ok" if ok else "error").observe(seconds)
+    cell = _provider_cell.get()
+    if ok and cell is not None:
+        cell[0] = provider
+
+
+def record_provider_throttled(provider: str, seconds: float):
+    PROVIDER_CALL_SECONDS.labels(provider, "throttled").observe(seconds)
+
+
+def record_provider_queue(provider: str, seconds: float):
+    PROVIDER_QUEUE_SECONDS.labels(provider).observe(seconds)
+    record_stage("provider_queue", seconds, provider)
+
+
+def record_token_usage(provider: str, message, model: Optional[str] = None):
+    """message: LangChain AIMessage; usage_metadata is absent for some providers."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    timer = _current_timer.get()
+    prompt = timer.prompt if timer else None
+    for direction in ("input", "output"):
+        tokens = usage.get(f"{direction}_tokens")
+        if tokens:
+            LLM_TOKENS.labels(provider, direction).inc(tokens)
+            if model:
+                MODEL_TOKENS.labels(provider, model, direction).inc(tokens)
+            if prompt:
+                PROMPT_TOKENS.labels(prompt, direction).inc(tokens)
+
+
+def record_document(file_type: str, outcome: str, seconds: float, plots: int, source_bytes: int, payload_bytes: int,
+                    prompt: Optional[str] = None):
+    EXTRACTIONS.labels(file_type, outcome).inc()
+    if prompt:
+        PROMPT_DOCUMENTS.labels(prompt, outcome).inc()
+    EXTRACTION_SECONDS.labels(file_type, outcome).observe(seconds)
+    PLOTS_PER_DOCUMENT.labels(file_type).observe(plots)
+    if outcome != "cached":
+        PAYLOAD_BYTES.labels(file_type, "source").observe(source_bytes)
+        PAYLOAD_BYTES.labels(file_type, "payload").observe(payload_bytes)
+
+
+def record_job(outcome: str, waited_seconds: Optional[float] = None):
+    JOBS.labels(outcome).inc()
+    if waited_seconds is not None:
+        JOB_WAIT_SECONDS.observe(waited_seconds)
+
+
+def record_near_duplicate(outcome: str):
+    NEAR_DUPLICATES.labels(outcome).inc()
+
+
+def record_rule_page(outcome: str):
+    RULE_PAGES.labels(outcome).inc()
+
+
+def record_lot_retry(outcome: str):
+    LOT_RETRIES.labels(outcome).inc()
+
+
+def record_page_tier(tier: str):
+    MODEL_TIER_PAGES.labels(tier).inc()
+
+
+def record_render_wait(seconds: float):
+    RENDER_POOL_WAIT_SECONDS.observe(seconds)
+    record_stage("pool_wait", seconds)
+
+
+def render_latest():
+    """(body, content_type) for /metrics; aggregates workers in multiprocess mode."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,60 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# off (default): every call uses the provider's default model
+# auto: per page, from its complexity score (app.services.page_complexity)
+# fast / standard / strong: every call uses that tier
+MODEL_TIERING = os.getenv("MODEL_TIERING", "off").strip().lower()
+# Pages scoring below FAST_MAX go to the fast tier, at or above STRONG_MIN to the strong one
+MODEL_TIER_FAST_MAX = float(os.getenv("MODEL_TIER_FAST_MAX", "0.25"))
+MODEL_TIER_STRONG_MIN = float(os.getenv("MODEL_TIER_STRONG_MIN", "0.6"))
+
+# Cheapest first; "standard" is each provider's model_name
+TIERS = ("fast", "standard", "strong")
+
+# Set around a page's provider calls; tasks created inside (lot sections, hedges) inherit it
+_current: ContextVar[Optional[str]] = ContextVar("model_tier", default=None)
+
+
+def enabled() -> bool:
+    return MODEL_TIERING != "off"
+
+
+def tier_for(score: float) -> Optional[str]:
+    """Tier for a page's complexity score; None when tiering is off."""
+    if not enabled():
+        return None
+    if MODEL_TIERING in TIERS:
+        return MODEL_TIERING
+    if score < MODEL_TIER_FAST_MAX:
+        return "fast"
+    if score >= MODEL_TIER_STRONG_MIN:
+        return "strong"
+    return "standard"
+
+
+def escalated(tier: Optional[str]) -> Optional[str]:
+    """The tier above (re-reading what the first call got wrong); None when tiering is off."""
+    if not enabled():
+        return None
+    index = TIERS.index(tier) if tier in TIERS else TIERS.index("standard")
+    return TIERS[min(index + 1, len(TIERS) - 1)]
+
+
+@contextmanager
+def using(tier: Optional[str]):
+    token = _current.set(tier)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def current() -> Optional[str]:
+    return _current.get()
+
+
+def pipeline_key() -> str:
+    return f"{MODEL_TIERING}/{MODEL_TIER_FAST_MAX:g}/{MODEL_TIER_STRONG_MIN:g}"
@@ -0,0 +1,218 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from itertools import combinations
+from typing import Optional, Tuple
+
+# Page fingerprints are 256-bit integers (see app.services.near_duplicates)
+HASH_BITS = 256
+_CHUNK_BITS = 16
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+
+
+class NearDuplicateIndex:
+    """
+    Recent page fingerprints -> result-cache key, searchable by Hamming distance.
+
+    Multi-index hashing: the 256-bit hash is cut into 16 chunks of 16 bits,
+    each with its own table (chunk value -> fingerprints). Two hashes within
+    max_distance bits differ by at most max_distance // 16 bits in at least
+    one chunk (pigeonhole), so a lookup probes every value within that radius
+    in every chunk table and verifies the few candidates with a popcount.
+    The work per lookup depends on bucket sizes, not on how many pages are
+    indexed, which keeps it well under a millisecond at a few hundred
+    thousand entries.
+
+    Entries are scoped by a namespace (provider, model, prompt, pipeline
+    settings) and evicted least-recently-matched first. With db_path set they
+    are also written to SQLite, so a restarted worker starts warm; entries
+    added by other workers are only seen after their restart.
+    """
+
+    def __init__(self, max_distance: int = 30, max_entries: int = 200_000, db_path: Optional[str] = None):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.db_path = db_path
+
+        self.chunks = HASH_BITS // _CHUNK_BITS
+        self.radius = max_distance // self.chunks
+        # XOR masks of every chunk value within `radius` bits, the exact value first
+        self._probes = [0] + [
+            sum(1 << bit for bit in bits)
+            for r in range(1, self.radius + 1)
+            for bits in combinations(range(_CHUNK_BITS), r)
+        ]
+
+        self._tables = {}  # namespace -> per-chunk {chunk value: {fingerprint}}
+        self._entries = OrderedDict()  # (namespace, fingerprint) -> result key
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if db_path:
+            self._init_db(db_path)
+
+    @classmethod
+    def from_env(cls) -> Optional["NearDuplicateIndex"]:
+        # Opt-in: a match reuses another scan's extraction. Rescans of one page land
+        # within ~30 of 256 bits; forms sharing a template but not their entries ~55+.
+        if os.getenv("NEAR_DUP_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+
+        return cls(
+            max_distance=int(os.getenv("NEAR_DUP_MAX_DISTANCE", "30")),
+            max_entries=int(os.getenv("NEAR_DUP_MAX_ENTRIES", "200000")),
+            # Empty string keeps the index in memory only
+            db_path=os.getenv("NEAR_DUP_DB", ".cache/near_duplicates.sqlite3") or None,
+        )
+
+    # ---------------- persistence ----------------
+
+    def _init_db(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS near_duplicates (
+                namespace TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                added_at REAL NOT NULL,
+                PRIMARY KEY (namespace, fingerprint)
+            )
+            """
+        )
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT namespace, fingerprint, key FROM near_duplicates ORDER BY added_at DESC LIMIT ?",
+            (self.max_entries,),
+        ).fetchall()
+        for namespace, fingerprint, key in reversed(rows):
+            self._insert((namespace, int(fingerprint, 16)), key)
+
+        if len(rows) == self.max_entries:
+            self._db.execute(
+                """
+                DELETE FROM near_duplicates WHERE added_at < (
+                    SELECT MIN(added_at) FROM (
+                        SELECT added_at FROM near_duplicates ORDER BY added_at DESC LIMIT ?
+                    )
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def _disk_write(self, sql: str, params):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(sql, params)
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Near-duplicate index write error: {e}")
+
+    # ---------------- tables ----------------
+
+    def _chunk_values(self, fingerprint: int):
+        return [(fingerprint >> (i * _CHUNK_BITS)) & _CHUNK_MASK for i in range(self.chunks)]
+
+    def _insert(self, entry: Tuple[str, int], key: str):
+        if entry in self._entries:
+            self._entries[entry] = key
+            self._entries.move_to_end(entry)
+            return
+
+        self._entries[entry] = key
+        namespace, fingerprint = entry
+        if namespace not in self._tables:
+            self._tables[namespace] = [dict() for _ in range(self.chunks)]
+        for table, value in zip(self._tables[namespace], self._chunk_values(fingerprint)):
+            table.setdefault(value, set()).add(fingerprint)
+
+        while len(self._entries) > self.max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            self._unlink(oldest)
+            self.evictions += 1
+
+    def _unlink(self, entry: Tuple[str, int]):
+        namespace, fingerprint = entry
+        tables = self._tables[namespace]
+        for table, value in zip(tables, self._chunk_values(fingerprint)):
+            bucket = table.get(value)
+            if bucket is not None:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del table[value]
+        if not any(tables):
+            del self._tables[namespace]
+
+    # ---------------- public API ----------------
+
+    def lookup(self, namespace: str, fingerprint: int) -> Optional[Tuple[int, str, int]]:
+        """Closest indexed page within max_distance: (its fingerprint, result key, distance)."""
+        with self._lock:
+            # Probing and verifying run as map() chains: ~1k candidates at 200k
+            # entries would cost several times more as Python-level loops
+            candidates = set()
+            for table, value in zip(self._tables.get(namespace, ()), self._chunk_values(fingerprint)):
+                candidates.update(*filter(None, map(table.get, map(value.__xor__, self._probes))))
+
+            best_distance = self.max_distance + 1
+            if candidates:
+                candidates = list(candidates)
+                distances = list(map(int.bit_count, map(fingerprint.__xor__, candidates)))
+                best_distance = min(distances)
+
+            if best_distance > self.max_distance:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            best = (namespace, candidates[distances.index(best_distance)])
+            self._entries.move_to_end(best)
+            return best[1], self._entries[best], best_distance
+
+    def add(self, namespace: str, fingerprint: int, key: str):
+        with self._lock:
+            self._insert((namespace, fingerprint), key)
+            self._disk_write(
+                "INSERT OR REPLACE INTO near_duplicates (namespace, fingerprint, key, added_at) VALUES (?, ?, ?, ?)",
+                (namespace, f"{fingerprint:064x}", key, time.time()),
+            )
+
+    def discard(self, namespace: str, fingerprint: int):
+        """Drop an entry whose cached result is gone."""
+        entry = (namespace, fingerprint)
+        with self._lock:
+            if self._entries.pop(entry, None) is None:
+                return
+            self._unlink(entry)
+            self._disk_write(
+                "DELETE FROM near_duplicates WHERE namespace = ? AND fingerprint = ?",
+                (namespace, f"{fingerprint:064x}"),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "probes_per_lookup": self.chunks * len(self._probes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_enabled": self._db is not None,
+            }
@@ -2,16 +2,23 @@
 import os
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
-from app.domain.schemas import DocumentExtraction, PlotData
+from app.domain.schemas import DocumentExtraction
+from app.infrastructure.base_provider import ChatModelProvider, ModelRunnables, ProviderError, CLIENT_MAX_RETRIES
+from app.infrastructure.http_clients import HTTP_CLIENTS
 # from openai.error import OpenAIError # Not extracting this anymore with langchain
 
-class OpenAIService:
+class OpenAIService(ChatModelProvider):
     _instance = None
+    provider_name = "openai"
+    model_name = "gpt-4o-mini"
+    tier_models = {"fast": "gpt-4.1-nano", "strong": "gpt-4o"}
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(OpenAIService, cls).__new__(cls)
-            cls._instance._initialize_model()
+            # Only a fully initialized instance is kept, so a failed init is retried
+            instance = super(OpenAIService, cls).__new__(cls)
+            instance._initialize_model()
+            cls._instance = instance
         return cls._instance
 
     def _initialize_model(self):
@@ -20,184 +27,87 @@ class OpenAIService:
             raise ValueError("OPENAI_API_KEY not found in environment variables")
         
         print(f"--- Configuring OpenAI (LangChain) with Key: {self.api_key[:5]}... ---")
-        
+
+        # Standard tier now; fast / strong models on their first page
+        self._models = {self.model_name: self._build_runnables(self.model_name)}
+        self._load_prompt()
+
+    def _build_runnables(self, model: str) -> ModelRunnables:
         # Initialize LangChain Chat Model
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
+        llm = ChatOpenAI(
+            model=model,
             api_key=self.api_key,
             temperature=0.0,
-            max_tokens=4096
+            max_tokens=4096,
+            max_retries=CLIENT_MAX_RETRIES,
+            # Shared keep-alive pool; per-phase timeouts are enforced by its transport
+            http_client=HTTP_CLIENTS.sync_client(),
+            http_async_client=HTTP_CLIENTS.async_client(),
+            timeout=HTTP_CLIENTS.timeout,
         )
         
         # Configure structured output
-        self.structured_llm = self.llm.with_structured_output(DocumentExtraction)
+        structured_llm = llm.with_structured_output(DocumentExtraction, include_raw=True)
+        # Same JSON-schema response format, left unparsed so the text can be read as it streams
+        streaming_llm = llm.bind(
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "DocumentExtraction", "schema": DocumentExtraction.model_json_schema()},
+            },
+            stream_usage=True,
+        )
+        return ModelRunnables(model, structured_llm, streaming_llm)
 
-    def query_document(self, image_parts):
+    def _build_message(self, image_parts, instructions=None):
         """
+        instructions: replaces the default full-document prompt when given.
         image_parts: List of dicts with "type": "image_url" and "image_url": {"url": ...}
         
         LangChain OpenAI adapter expects content blocks similar to the raw API, 
         but wrapped in a HumanMessage.
         """
 
-        prompt_text = """
-            You are an expert real-estate and construction document analysis system.
-
-            These images may include:
-            - Lot Specific Order Forms
-            - Spec Request Forms
-            - Builder Configuration Sheets
-            - Construction Option Lists
-            - Scanned PDFs and photos
-
-            Documents often contain MULTIPLE LOT SECTIONS in a single page.
-
-            Each lot section must be extracted as a SEPARATE structured record.
-
-            The document may be rotated, blurry, handwritten, or partially cropped.
-
-            Your task is to perform FORENSIC-LEVEL multi-entity extraction.
-
-            Follow these rules strictly:
-
-            ------------------------------------------------------------------
-
-            ### 1. GLOBAL vs LOT-SPECIFIC DATA
-
-            First identify:
-
-            GLOBAL fields (apply to all lots unless overridden):
-            - Project-wide elevation
-            - Community name
-            - Builder name
-            - Global notes
-
-            Then identify REPEATING LOT BLOCKS.
-
-            A LOT BLOCK is defined by patterns such as:
-            - "Lot 116 - 1685"
-            - "Lot 117:"
-            - "Homesite 118"
-            - "Lot #119"
-
-            Each detected lot block represents ONE independent property.
-
-            ------------------------------------------------------------------
-
-            ### 2. LOT BLOCK DETECTION RULES
-
-            You MUST:
-
-            - Scan the entire page top to bottom
-            - Identify EVERY lot header
-            - Split the document into logical LOT SECTIONS
-            - Extract each lot independently
-
-            NEVER merge data across different lots.
-
-            If 6 lots appear → output 6 plot objects.
-
-            ------------------------------------------------------------------
-
-            ### 3. HIERARCHICAL INHERITANCE
-
-            If a field appears globally and not repeated inside a lot block:
-
-            - Inherit it into each lot ONLY if clearly global
+        # Prepare content for LangChain
+        # For OpenAI, LangChain passes the list of dicts directly in content
+        content = [
+            self._prompt_block(instructions),
+        ]
+        content.extend(image_parts)
 
-            Example:
-            "Elevation B" at top of page → applies to all lots
+        return HumanMessage(content=content)
 
-            But:
-
-            If a lot block overrides it → use the lot value.
-
-            ------------------------------------------------------------------
-
-            ### 4. FIELD NORMALIZATION
-
-            Normalize strictly:
-
-            - LotNumber → numeric only
-            - BlockNumber → numeric only
-            - GarageSwing → Left | Right | Straight
-            - Elevation → Single letter/code only
-
-            ------------------------------------------------------------------
-
-            ### 5. LOT-SPECIFIC NOTES HANDLING
-
-            For each lot block:
-
-            Capture bullet items such as:
-            - Garage Left / Right
-            - Dual sinks
-            - Shower in lieu of tub
-            - Patio slab
-            - Vanity upgrades
-
-            These MUST go into:
-
-            optional_notes (lot-specific only)
-
-            ------------------------------------------------------------------
-
-            ### 6. STRICT ANTI-HALLUCINATION RULES
-
-            - Do NOT guess missing values
-            - Do NOT copy values between lots
-            - Do NOT invent addresses or models
-            - Only extract what is visible
-
-            ------------------------------------------------------------------
-
-            ### 7. REQUIRED OUTPUT FORMAT (STRICT JSON)
-
-            Return JSON matching this structure:
-
-            {
-              "global_elevation": "... or null",
-              "global_notes": "... or null",
-              "plots": [
-                {
-                  "lot_no": "...",
-                  "block": "...",
-                  "address": "...",
-                  "model_selected": "...",
-                  "elevation": "...",
-                  "garage_swing": "...",
-                  "external_structure": "...",
-                  "optional_notes": "..."
-                }
-              ]
-            }
-
-            There must be ONE plots[] entry PER detected lot block.
+    def query_document(self, image_parts, instructions=None):
+        try:
+            message = self._build_message(image_parts, instructions)
 
-            ------------------------------------------------------------------
+            # Invoke structured LLM
+            runnables = self._runnables()
+            # include_raw=True returns {"raw", "parsed", "parsing_error"}
+            result = runnables.structured.invoke([message])
+            return self._unwrap_structured(result, runnables.model)
 
-            Extract now.
-            """
+        except Exception as e:
+            print(f"OpenAI LangChain Error: {e}")
+            raise ProviderError(self.provider_name, e) from e
 
+    async def aquery_document(self, image_parts, instructions=None):
         try:
-            # Prepare content for LangChain
-            # For OpenAI, LangChain passes the list of dicts directly in content
-            content = [
-                {"type": "text", "text": prompt_text},
-            ]
-            content.extend(image_parts)
+            message = self._build_message(image_parts, instructions)
+            runnables = self._runnables()
+            result = await runnables.structured.ainvoke([message])
+            return self._unwrap_structured(result, runnables.model)
 
-            message = HumanMessage(content=content)
+        except Exception as e:
+            print(f"OpenAI LangChain Error: {e}")
+            raise ProviderError(self.provider_name, e) from e
 
-            # Invoke structured LLM
-            # Returns a Pydantic object directly
-            result = self.structured_llm.invoke([message])
-            return result
+    async def astream_document(self, image_parts, instructions=None):
+        try:
+            message = self._build_message(image_parts, instructions)
+            runnables = self._runnables()
+            async for text in self._stream_text(runnables.streaming, [message], runnables.model):
+                yield text
 
         except Exception as e:
             print(f"OpenAI LangChain Error: {e}")
-            return DocumentExtraction(
-                global_elevation=None, 
-                global_notes=None, 
-                plots=[PlotData(optional_notes=f"Processing Error: {str(e)}")]
-            )
+            raise ProviderError(self.provider_name, e) from e
@@ -0,0 +1,239 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import Optional
+from app.domain.schemas import ExtractionResult, PlotData, PlotQueryResult, StoredPlot
+
+# Largest page of GET /plots results
+PLOT_STORE_MAX_LIMIT = int(os.getenv("PLOT_STORE_MAX_LIMIT", "200"))
+
+_PLOT_FIELDS = tuple(PlotData.model_fields)
+
+
+def _fts_query(q: str) -> str:
+    """Free text as an FTS5 query: every word must appear (as a word prefix); no operators."""
+    terms = ['"' + term.replace('"', '""') + '"*' for term in q.split()]
+    return " ".join(terms)
+
+
+class PlotStore:
+    """
+    Every extracted lot, kept in SQLite so a processed lot is an index lookup
+    instead of another extraction.
+
+    `documents` has one row per extracted document (upload SHA-256 and page
+    range) with its filename, provider / model / prompt and when it was
+    stored; extracting it again replaces its plots. `plots` has one row per
+    lot with the page it starts on, indexed on (lot_no, block) and block
+    (case-insensitive). address and optional_notes are full-text searchable
+    through an FTS5 index kept in sync by triggers; without FTS5 in the
+    SQLite build, search falls back to LIKE. Like the result cache's disk
+    tier, the file is shared by every worker on the box (WAL).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.fts = True
+
+        self.stored = 0
+        self.queries = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False)
+        self._init_db()
+
+    @classmethod
+    def from_env(cls) -> Optional["PlotStore"]:
+        if os.getenv("PLOT_STORE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+
+        # Empty string disables the store
+        db_path = os.getenv("PLOT_STORE_DB", ".cache/plots.sqlite3")
+        if not db_path:
+            return None
+        try:
+            return cls(db_path)
+        except sqlite3.Error as e:
+            print(f"Plot store unavailable: {e}")
+            return None
+
+    def _init_db(self):
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                pages TEXT NOT NULL,
+                filename TEXT,
+                provider TEXT,
+                model TEXT,
+                prompt_version TEXT,
+                plot_count INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                UNIQUE (sha256, pages)
+            );
+            CREATE TABLE IF NOT EXISTS plots (
+                id INTEGER PRIMARY KEY,
+                document_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                page INTEGER,
+                lot_no TEXT COLLATE NOCASE,
+                block TEXT COLLATE NOCASE,
+                {", ".join(f"{field} TEXT" for field in _PLOT_FIELDS if field not in ("lot_no", "block"))}
+            );
+            CREATE INDEX IF NOT EXISTS plots_lot ON plots (lot_no, block);
+            CREATE INDEX IF NOT EXISTS plots_block ON plots (block);
+            CREATE INDEX IF NOT EXISTS plots_document ON plots (document_id, position);
+            """
+        )
+        try:
+            self._db.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS plots_fts USING fts5(
+                    address, optional_notes, content='plots', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS plots_fts_insert AFTER INSERT ON plots BEGIN
+                    INSERT INTO plots_fts (rowid, address, optional_notes)
+                    VALUES (new.id, new.address, new.optional_notes);
+                END;
+                CREATE TRIGGER IF NOT EXISTS plots_fts_delete AFTER DELETE ON plots BEGIN
+                    INSERT INTO plots_fts (plots_fts, rowid, address, optional_notes)
+                    VALUES ('delete', old.id, old.address, old.optional_notes);
+                END;
+                """
+            )
+        except sqlite3.OperationalError as e:
+            print(f"Plot store: no full-text index ({e}); text search uses LIKE")
+            self.fts = False
+        self._db.commit()
+
+    # ---------------- writes ----------------
+
+    def save(self, sha256: str, pages: Optional[str], filename: Optional[str], result: ExtractionResult,
+             provider: Optional[str] = None, model: Optional[str] = None, prompt_version: Optional[str] = None,
+             replace: bool = True):
+        """
+        Stores a complete extraction's plots. replace=False keeps a document
+        that is already stored (a cache hit re-serving the same result).
+        """
+        pages = pages or "all"
+        plot_pages = result.meta.pages
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT id FROM documents WHERE sha256 = ? AND pages = ?", (sha256, pages)
+                ).fetchone()
+                if row is not None and not replace:
+                    return
+
+                with self._db:
+                    if row is not None:
+                        self._db.execute("DELETE FROM plots WHERE document_id = ?", (row[0],))
+                        self._db.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+                    document_id = self._db.execute(
+                        """
+                        INSERT INTO documents
+                            (sha256, pages, filename, provider, model, prompt_version, plot_count, stored_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (sha256, pages, filename, provider, model, prompt_version, len(result.plots), time.time()),
+                    ).lastrowid
+                    self._db.executemany(
+                        f"""
+                        INSERT INTO plots (document_id, position, page, {", ".join(_PLOT_FIELDS)})
+                        VALUES (?, ?, ?, {", ".join("?" for _ in _PLOT_FIELDS)})
+                        """,
+                        [
+                            (document_id, i, plot_pages[i] if i < len(plot_pages) else None,
+                             *(getattr(plot, field) for field in _PLOT_FIELDS))
+                            for i, plot in enumerate(result.plots)
+                        ],
+                    )
+                self.stored += 1
+        except sqlite3.Error as e:
+            print(f"Plot store write error: {e}")
+
+    # ---------------- queries ----------------
+
+    def search(self, lot_no: Optional[str] = None, block: Optional[str] = None, q: Optional[str] = None,
+               limit: int = 50, offset: int = 0) -> PlotQueryResult:
+        """
+        Plots matching every given filter: exact lot_no / block (case-
+        insensitive) and q, words that must all occur in address or
+        optional_notes. Best text matches first, otherwise newest first.
+        """
+        limit = max(1, min(limit, PLOT_STORE_MAX_LIMIT))
+        offset = max(0, offset)
+
+        joins = "JOIN documents d ON d.id = p.document_id"
+        where, params = [], []
+        order = "d.stored_at DESC, p.document_id DESC, p.position"
+        if lot_no:
+            where.append("p.lot_no = ?")
+            params.append(lot_no.strip())
+        if block:
+            where.append("p.block = ?")
+            params.append(block.strip())
+        if q and q.strip():
+            if self.fts:
+                joins += " JOIN plots_fts f ON f.rowid = p.id"
+                where.append("plots_fts MATCH ?")
+                params.append(_fts_query(q))
+                order = "f.rank, " + order
+            else:
+                for term in q.split():
+                    where.append("(p.address LIKE ? OR p.optional_notes LIKE ?)")
+                    params.extend([f"%{term}%"] * 2)
+        condition = f"WHERE {' AND '.join(where)}" if where else ""
+
+        columns = ", ".join(f"p.{field}" for field in _PLOT_FIELDS)
+        with self._lock:
+            self.queries += 1
+            total = self._db.execute(f"SELECT COUNT(*) FROM plots p {joins} {condition}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"""
+                SELECT {columns}, p.page, d.sha256, d.filename, d.pages, d.provider, d.model,
+                       d.prompt_version, d.stored_at
+                FROM plots p {joins} {condition}
+                ORDER BY {order}
+                LIMIT ? OFFSET ?
+                """,
+                (*params, limit, offset),
+            ).fetchall()
+
+        n = len(_PLOT_FIELDS)
+        plots = [
+            StoredPlot(
+                **dict(zip(_PLOT_FIELDS, row[:n])),
+                page=row[n],
+                document_sha256=row[n + 1],
+                filename=row[n + 2],
+                pages=row[n + 3],
+                provider=row[n + 4],
+                model=row[n + 5],
+                prompt_version=row[n + 6],
+                stored_at=row[n + 7],
+            )
+            for row in rows
+        ]
+        return PlotQueryResult(total=total, limit=limit, offset=offset, plots=plots)
+
+    def stats(self) -> dict:
+        with self._lock:
+            documents, plots = self._db.execute(
+                "SELECT (SELECT COUNT(*) FROM documents), (SELECT COUNT(*) FROM plots)"
+            ).fetchone()
+            return {
+                "documents": documents,
+                "plots": plots,
+                "stored": self.stored,
+                "queries": self.queries,
+                "full_text": self.fts,
+                "db_path": self.db_path,
+            }
@@ -0,0 +1,139 @@
+import os
+import hashlib
+import threading
+from typing import Dict, Optional
+
+# Templates are <name>.<version>.txt files; the highest version of a name is used
+PROMPT_DIR = os.getenv("PROMPT_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "prompts"))
+# A/B test: this share of documents (picked by content hash, so a document
+# always gets the same arm) uses PROMPT_AB_VARIANT instead of the provider default.
+PROMPT_AB_VARIANT = os.getenv("PROMPT_AB_VARIANT", "extraction_compact")
+PROMPT_AB_FRACTION = float(os.getenv("PROMPT_AB_FRACTION", "0"))
+# tiktoken encoding used to size prompts; falls back to chars / 4 when the
+# encoding cannot be loaded (offline without a TIKTOKEN_CACHE_DIR copy)
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "o200k_base")
+
+
+def _version_key(version: str):
+    digits = version.lstrip("v")
+    return (0, int(digits)) if digits.isdigit() else (1, version)
+
+
+class PromptTemplate:
+    """One prompt version; the LangChain text block is built once and reused by every call."""
+
+    def __init__(self, name: str, version: str, text: str):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.content_block = {"type": "text", "text": text}
+        self._tokens = None
+
+    @property
+    def id(self) -> str:
+        # Stamped on results and part of the cache key
+        return f"{self.name}@{self.version}"
+
+    @property
+    def tokens(self):
+        """(count, tokenizer name). Sized on first use, not at import: loading the
+        tokenizer may download its encoding, and every worker imports the registry."""
+        if self._tokens is None:
+            self._tokens = count_tokens(self.text)
+        return self._tokens
+
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def count_tokens(text: str):
+    """Returns (token count, tokenizer name)."""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(PROMPT_TOKENIZER)
+            except Exception as e:
+                print(f"Prompt tokenizer unavailable ({type(e).__name__}); estimating tokens from length")
+                _encoding = False
+    if _encoding is False:
+        return max(1, len(text) // 4), "chars/4"
+    return len(_encoding.encode(text)), PROMPT_TOKENIZER
+
+
+class PromptRegistry:
+    """
+    Loads every prompt template once and shares it across providers.
+
+    Providers take their default template from here and pre-built content
+    blocks are looked up by text, so `instructions` passed down from the
+    extractor (lot-section prompt, A/B variant) cost no rebuild either.
+    """
+
+    def __init__(self, directory: str = PROMPT_DIR, ab_variant: Optional[str] = None, ab_fraction: float = 0.0):
+        self.directory = directory
+        self._templates: Dict[str, Dict[str, PromptTemplate]] = {}
+        self._by_text: Dict[str, PromptTemplate] = {}
+        self._load()
+
+        self.ab_fraction = max(0.0, min(1.0, ab_fraction))
+        self.ab_variant = self.get(ab_variant) if ab_variant and self.ab_fraction > 0 else None
+
+    @classmethod
+    def from_env(cls) -> "PromptRegistry":
+        return cls(PROMPT_DIR, PROMPT_AB_VARIANT, PROMPT_AB_FRACTION)
+
+    def _load(self):
+        for filename in sorted(os.listdir(self.directory)):
+            stem, ext = os.path.splitext(filename)
+            if ext != ".txt" or "." not in stem:
+                continue
+            name, version = stem.rsplit(".", 1)
+            with open(os.path.join(self.directory, filename), encoding="utf-8") as f:
+                template = PromptTemplate(name, version, f.read().strip())
+            self._templates.setdefault(name, {})[version] = template
+            self._by_text[template.text] = template
+
+    def get(self, name: str, version: Optional[str] = None) -> PromptTemplate:
+        versions = self._templates.get(name)
+        if not versions:
+            raise KeyError(f"Unknown prompt '{name}'")
+        if version is None:
+            version = max(versions, key=_version_key)
+        return versions[version]
+
+    def content_block(self, text: str) -> dict:
+        template = self._by_text.get(text)
+        return template.content_block if template else {"type": "text", "text": text}
+
+    def choose(self, digest: str) -> Optional[PromptTemplate]:
+        """The A/B variant for this document, or None to use the provider default."""
+        if self.ab_variant is None:
+            return None
+        bucket = int(hashlib.sha256(f"prompt-ab:{digest}".encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return self.ab_variant if bucket < self.ab_fraction else None
+
+    def stats(self) -> dict:
+        prompts = []
+        for name in sorted(self._templates):
+            for version in sorted(self._templates[name], key=_version_key):
+                template = self._templates[name][version]
+                tokens, tokenizer = template.tokens
+                prompts.append({
+                    "id": template.id,
+                    "chars": len(template.text),
+                    "tokens": tokens,
+                    "tokenizer": tokenizer,
+                })
+        return {
+            "prompts": prompts,
+            "ab_test": {
+                "variant": self.ab_variant.id if self.ab_variant else None,
+                "fraction": self.ab_fraction,
+            },
+        }
+
+
+PROMPTS = PromptRegistry.from_env()
@@ -0,0 +1,576 @@
+import os
+import time
+import asyncio
+import importlib
+import threading
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Union
+from app.domain.schemas import DocumentExtraction
+from app.infrastructure.base_provider import BaseProvider, ProviderError
+from app.infrastructure.prompt_registry import PROMPTS
+from app.infrastructure.provider_scheduler import ProviderScheduler, throttle_info
+from app.infrastructure import metrics
+
+# name -> "module:Class"; imported only when listed in LLM_PROVIDERS
+PROVIDER_CLASSES = {
+    "gemini": "app.infrastructure.gemini_service:GeminiService",
+    "openai": "app.infrastructure.openai_service:OpenAIService",
+    "huggingface": "app.infrastructure.huggingface_service:HuggingFaceService",
+}
+
+
+# Warm-up retries a provider that failed to initialize with this backoff (seconds)
+PROVIDER_RETRY_SECONDS = float(os.getenv("PROVIDER_RETRY_SECONDS", "2"))
+PROVIDER_RETRY_MAX_SECONDS = float(os.getenv("PROVIDER_RETRY_MAX_SECONDS", "60"))
+# How long an extraction waits for the first provider to come up
+PROVIDER_READY_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_READY_TIMEOUT_SECONDS", "30"))
+
+
+def provider_class(name: str):
+    """The provider's class; importing its module pulls in its LangChain integration."""
+    try:
+        module_name, class_name = PROVIDER_CLASSES[name].split(":")
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider '{name}'. Choose from: {', '.join(PROVIDER_CLASSES)}")
+
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+def load_provider(name: str) -> BaseProvider:
+    return provider_class(name)()
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures.
+    open -> half-open once `cooldown_seconds` have passed; one trial call is
+    let through, and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self):
+        """A call that was let through ended without an outcome (cancelled)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class LatencyWindow:
+    """Sliding window of recent successful call latencies (seconds)."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class _Route:
+    """One configured provider; `provider` stays None until warm-up has loaded it."""
+
+    def __init__(self, provider: Union[BaseProvider, str], breaker: CircuitBreaker):
+        if isinstance(provider, str):
+            self.name, self.provider = provider, None
+        else:
+            self.name, self.provider = provider.provider_name, provider
+        self.breaker = breaker
+        self.scheduler = ProviderScheduler.from_env(self.name)
+        self.latency = LatencyWindow()
+        self.calls = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+        self.load_attempts = 0
+        self.load_error: Optional[str] = None
+        self._load_lock = threading.Lock()
+        self._identity = None
+
+    @property
+    def state(self) -> str:
+        if self.provider is not None:
+            return "ready"
+        return "failed" if self.load_error else "loading"
+
+    def load(self):
+        """Blocking; run in a worker thread."""
+        with self._load_lock:
+            if self.provider is not None:
+                return
+            self.load_attempts += 1
+            try:
+                self.provider = load_provider(self.name)
+            except Exception as e:
+                self.load_error = f"{type(e).__name__}: {e}"
+                raise
+            self.load_error = None
+
+    def identity(self):
+        """
+        (model_name, prompt_version) from the class, known before the provider
+        is loaded, so cache keys do not move as providers come up.
+        The first call imports the provider module; keep it off the event loop.
+        """
+        if self._identity is None:
+            if self.provider is not None:
+                self._identity = (self.provider.model_name, self.provider.prompt_version)
+            else:
+                try:
+                    cls = provider_class(self.name)
+                    self._identity = (cls.model_name, PROMPTS.get(cls.default_prompt).id)
+                except Exception:
+                    # Module cannot be imported in this process, so it never serves
+                    self._identity = ("unavailable", "unavailable")
+        return self._identity
+
+
+class ProviderRouter(BaseProvider):
+    """
+    Routes extraction calls over an ordered list of providers.
+
+    - failover: a failing provider hands the request to the next one
+    - circuit breakers: a provider that keeps failing is skipped for a cooldown
+    - hedging: when the current call runs past the provider's latency
+      percentile (LLM_HEDGE_PERCENTILE), the next provider is raced against
+      it and the first success wins
+    - outbound scheduling: each provider's calls go through a
+      ProviderScheduler (adaptive concurrency, rate quota, Retry-After);
+      throttled calls are queued and retried there (LLM_THROTTLE_RETRIES
+      times) before they count as a failure and fail over
+    - streaming: astream_document fails over only until the first text
+      arrives
+
+    Configured by LLM_PROVIDERS (e.g. "gemini,openai"), LLM_BREAKER_FAILURES,
+    LLM_BREAKER_COOLDOWN_SECONDS, LLM_HEDGE_PERCENTILE (0 disables) and
+    LLM_HEDGE_MIN_SAMPLES.
+
+    Providers given by name are loaded lazily: `warm_up` imports and
+    initializes them in worker threads after the server is up, retrying
+    failures with backoff. Calls only go to loaded providers; `ready` is
+    True once at least one is loaded.
+    """
+
+    def __init__(
+        self,
+        providers: List[Union[BaseProvider, str]],
+        breaker_failures: int = 5,
+        breaker_cooldown_seconds: float = 30.0,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+    ):
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+
+        self.routes = [
+            _Route(p, CircuitBreaker(breaker_failures, breaker_cooldown_seconds))
+            for p in providers
+        ]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._warming = False
+
+        self.provider_name = "router:" + ",".join(route.name for route in self.routes)
+
+    @property
+    def model_name(self) -> str:
+        return ",".join(route.identity()[0] for route in self.routes)
+
+    @property
+    def prompt_version(self) -> str:
+        return ",".join(route.identity()[1] for route in self.routes)
+
+    @classmethod
+    def from_env(cls) -> "ProviderRouter":
+        """Cheap: providers are only named here and loaded by warm_up / ensure_ready."""
+        names = [n.strip() for n in os.getenv("LLM_PROVIDERS", "gemini").split(",") if n.strip()]
+        unknown = [name for name in names if name not in PROVIDER_CLASSES]
+        if unknown or not names:
+            raise ValueError(
+                f"Unknown LLM provider(s) {', '.join(unknown) or '(none)'}. Choose from: {', '.join(PROVIDER_CLASSES)}"
+            )
+
+        return cls(
+            names,
+            breaker_failures=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            breaker_cooldown_seconds=float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30")),
+            hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0")),
+            hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        )
+
+    # ---------------- warm-up ----------------
+
+    @property
+    def ready(self) -> bool:
+        return any(route.provider is not None for route in self.routes)
+
+    async def warm_up(self):
+        """
+        Loads every provider, retrying failures with capped exponential backoff.
+        Meant to run as a background task for the life of the app; returns
+        once all providers are loaded (one that never loads keeps retrying).
+        """
+        self._warming = True
+        try:
+            await asyncio.to_thread(self._resolve_identity)
+            await asyncio.gather(*(self._warm_route(route) for route in self.routes))
+        finally:
+            self._warming = False
+
+    def _resolve_identity(self):
+        for route in self.routes:
+            route.identity()
+
+    async def _warm_route(self, route: _Route):
+        delay = PROVIDER_RETRY_SECONDS
+        while route.provider is None:
+            try:
+                await asyncio.to_thread(route.load)
+            except Exception:
+                print(f"--- Provider '{route.name}' unavailable ({route.load_error}); retrying in {delay:.0f}s ---")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, PROVIDER_RETRY_MAX_SECONDS)
+            else:
+                print(f"--- Provider '{route.name}' ready ---")
+
+    async def ensure_ready(self, timeout: float = PROVIDER_READY_TIMEOUT_SECONDS):
+        """
+        Waits (up to `timeout`) for a running warm-up to load a provider;
+        without one (scripts), loads the providers once right here.
+        """
+        if self.ready:
+            return
+        if not self._warming:
+            await asyncio.to_thread(self._resolve_identity)
+            await asyncio.gather(
+                *(asyncio.to_thread(route.load) for route in self.routes if route.provider is None),
+                return_exceptions=True,
+            )
+
+        deadline = time.monotonic() + timeout
+        while not self.ready and self._warming and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        if not self.ready:
+            errors = "; ".join(f"{route.name}: {route.load_error or 'loading'}" for route in self.routes)
+            raise ProviderError(self.provider_name, RuntimeError(f"no provider is ready ({errors})"))
+
+    def readiness(self) -> dict:
+        return {
+            route.name: {
+                "state": route.state,
+                "load_attempts": route.load_attempts,
+                "error": route.load_error,
+            }
+            for route in self.routes
+        }
+
+    # ---------------- helpers ----------------
+
+    def _candidates(self) -> List[_Route]:
+        # Breaker slots are only taken (allow()) right before a call is made
+        return [
+            route for route in self.routes
+            if route.provider is not None and route.breaker.state != "open"
+        ]
+
+    def _no_provider_error(self, errors: List[Exception]) -> ProviderError:
+        if errors:
+            return ProviderError(self.provider_name, errors[-1])
+        if not self.ready:
+            return ProviderError(self.provider_name, RuntimeError("no provider is ready yet"))
+        return ProviderError(self.provider_name, RuntimeError("all provider circuits are open"))
+
+    def _hedge_delay(self, route: _Route) -> Optional[float]:
+        if not self.hedge_percentile or len(route.latency) < self.hedge_min_samples:
+            return None
+        return route.latency.percentile(self.hedge_percentile)
+
+    async def _acquire(self, route: _Route, deadline: float):
+        """A scheduler slot for one call attempt; a call that cannot start counts as a failure."""
+        name = route.provider.provider_name
+        queued = time.perf_counter()
+        try:
+            await route.scheduler.acquire(deadline)
+        except asyncio.CancelledError:
+            route.breaker.release()
+            raise
+        except TimeoutError as e:
+            route.failures += 1
+            route.breaker.record_failure()
+            raise ProviderError(name, e)
+        metrics.record_provider_queue(name, time.perf_counter() - queued)
+
+    def _throttled(self, route: _Route, retry_after: Optional[float], elapsed: float):
+        # Not (yet) a failure of the provider: slow down and queue the call again
+        scheduler = route.scheduler
+        name = route.provider.provider_name
+        scheduler.throttled_call(retry_after)
+        metrics.record_provider_throttled(name, elapsed)
+        print(f"--- {name} throttled; concurrency now {scheduler.slots}"
+              f"{f', retry after {retry_after:g}s' if retry_after is not None else ''} ---")
+
+    async def _timed_call(self, route: _Route, image_parts, instructions: Optional[str]) -> DocumentExtraction:
+        scheduler = route.scheduler
+        name = route.provider.provider_name
+        deadline = time.monotonic() + scheduler.queue_timeout
+        throttles = 0
+        while True:
+            await self._acquire(route, deadline)
+
+            route.calls += 1
+            start = time.perf_counter()
+            try:
+                result = await route.provider.aquery_document(image_parts, instructions)
+            except asyncio.CancelledError:
+                scheduler.release()
+                route.breaker.release()
+                raise
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                throttled, retry_after = throttle_info(e)
+                if throttled and throttles < scheduler.throttle_retries:
+                    throttles += 1
+                    self._throttled(route, retry_after, elapsed)
+                    continue
+
+                scheduler.release()
+                route.failures += 1
+                route.breaker.record_failure()
+                metrics.record_provider_call(name, elapsed, ok=False)
+                raise
+
+            elapsed = time.perf_counter() - start
+            scheduler.succeeded(elapsed)
+            route.latency.add(elapsed)
+            route.breaker.record_success()
+            metrics.record_provider_call(name, elapsed, ok=True)
+            return result
+
+    async def _timed_stream(self, route: _Route, image_parts, instructions: Optional[str]) -> AsyncIterator[str]:
+        """_timed_call for a streamed call; a throttle is only retried before any text has arrived."""
+        scheduler = route.scheduler
+        name = route.provider.provider_name
+        deadline = time.monotonic() + scheduler.queue_timeout
+        throttles = 0
+        while True:
+            await self._acquire(route, deadline)
+
+            route.calls += 1
+            start = time.perf_counter()
+            streaming = False
+            try:
+                async with aclosing(route.provider.astream_document(image_parts, instructions)) as stream:
+                    async for text in stream:
+                        streaming = True
+                        yield text
+            except (asyncio.CancelledError, GeneratorExit):
+                scheduler.release()
+                route.breaker.release()
+                raise
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                throttled, retry_after = throttle_info(e)
+                if throttled and not streaming and throttles < scheduler.throttle_retries:
+                    throttles += 1
+                    self._throttled(route, retry_after, elapsed)
+                    continue
+
+                scheduler.release()
+                route.failures += 1
+                route.breaker.record_failure()
+                metrics.record_provider_call(name, elapsed, ok=False)
+                raise
+
+            elapsed = time.perf_counter() - start
+            scheduler.succeeded(elapsed)
+            route.latency.add(elapsed)
+            route.breaker.record_success()
+            metrics.record_provider_call(name, elapsed, ok=True)
+            return
+
+    # ---------------- BaseProvider ----------------
+
+    def query_document(self, image_parts, instructions: Optional[str] = None) -> DocumentExtraction:
+        """Blocking path: plain failover, no hedging."""
+        errors = []
+        for route in self._candidates():
+            if not route.breaker.allow():
+                continue
+
+            route.calls += 1
+            start = time.perf_counter()
+            try:
+                result = route.provider.query_document(image_parts, instructions)
+            except Exception as e:
+                route.failures += 1
+                route.breaker.record_failure()
+                metrics.record_provider_call(route.provider.provider_name, time.perf_counter() - start, ok=False)
+                errors.append(e)
+                continue
+
+            elapsed = time.perf_counter() - start
+            route.latency.add(elapsed)
+            route.breaker.record_success()
+            metrics.record_provider_call(route.provider.provider_name, elapsed, ok=True)
+            return result
+
+        raise self._no_provider_error(errors)
+
+    async def aquery_document(self, image_parts, instructions: Optional[str] = None) -> DocumentExtraction:
+        candidates = self._candidates()
+        errors = []
+        pending: Dict[asyncio.Future, tuple] = {}  # task -> (route, started_at)
+        next_index = 0
+        hedged = False
+
+        def launch() -> bool:
+            nonlocal next_index
+            while next_index < len(candidates):
+                route = candidates[next_index]
+                next_index += 1
+                if route.breaker.allow():
+                    task = asyncio.ensure_future(self._timed_call(route, image_parts, instructions))
+                    pending[task] = (route, time.perf_counter())
+                    return True
+            return False
+
+        if not launch():
+            raise self._no_provider_error([])
+        primary = next(iter(pending.values()))[0]
+
+        try:
+            while pending:
+                timeout = None
+                if not hedged and len(pending) == 1 and next_index < len(candidates):
+                    route, started_at = next(iter(pending.values()))
+                    delay = self._hedge_delay(route)
+                    if delay is not None:
+                        timeout = max(0.0, delay - (time.perf_counter() - started_at))
+
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    # Slower than its usual tail: race the next provider
+                    hedged = True
+                    if launch():
+                        slow_route = next(iter(pending.values()))[0]
+                        print(f"--- Hedging {slow_route.provider.provider_name} (over "
+                              f"p{self.hedge_percentile:g}) with another provider ---")
+                    continue
+
+                for task in done:
+                    route, _ = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+
+                    if hedged and route is not primary:
+                        route.hedges_won += 1
+                    return result
+
+                # Failover: everything in flight failed, try the next provider
+                if not pending:
+                    launch()
+
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise self._no_provider_error(errors)
+
+    async def astream_document(self, image_parts, instructions: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Streamed path: failover until a provider's first text arrives, then
+        the request stays with it (a half-sent document cannot be replayed
+        elsewhere). No hedging.
+        """
+        errors = []
+        for route in self._candidates():
+            if not route.breaker.allow():
+                continue
+
+            streaming = False
+            try:
+                async with aclosing(self._timed_stream(route, image_parts, instructions)) as stream:
+                    async for text in stream:
+                        streaming = True
+                        yield text
+                return
+            except Exception as e:
+                if streaming:
+                    raise
+                errors.append(e)
+
+        raise self._no_provider_error(errors)
+
+    def stats(self) -> dict:
+        return {
+            route.name: {
+                "state": route.state,
+                "model": route.provider.model_name if route.provider else None,
+                "circuit": route.breaker.state,
+                "calls": route.calls,
+                "failures": route.failures,
+                "hedges_won": route.hedges_won,
+                "latency_p50": route.latency.percentile(50),
+                "latency_p95": route.latency.percentile(95),
+                "latency_p99": route.latency.percentile(99),
+                **route.scheduler.stats(),
+            }
+            for route in self.routes
+        }
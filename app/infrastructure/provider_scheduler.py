@@ -0,0 +1,265 @@
+import os
+import re
+import time
+import asyncio
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+# HTTP statuses that mean "slow down" rather than "broken": rate limited, overloaded
+_THROTTLE_STATUSES = (429, 503, 529)
+_THROTTLE_NAMES = ("RateLimitError", "ResourceExhausted", "TooManyRequests", "ServiceUnavailable")
+# "Please retry in 37.1s", "retryDelay": "12s"
+_RETRY_IN = re.compile(r"retry(?:\s+in|delay\W+)\s*(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return int(value)
+    return None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    match = _RETRY_IN.search(str(exc))
+    return float(match.group(1)) if match else None
+
+
+def throttle_info(exc: BaseException) -> Tuple[bool, Optional[float]]:
+    """
+    (throttled, retry-after seconds) for a provider error. Walks the cause
+    chain: ProviderError wraps the LangChain error, which wraps the SDK's.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if _status(exc) in _THROTTLE_STATUSES or type(exc).__name__ in _THROTTLE_NAMES:
+            return True, _retry_after(exc)
+        exc = getattr(exc, "cause", None) or exc.__cause__ or exc.__context__
+    return False, None
+
+
+class TokenBucket:
+    """Requests-per-minute quota; reserve() returns how long to wait before sending."""
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, per_minute / 10.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Tokens may go negative: later callers queue behind earlier reservations
+        self.tokens -= 1.0
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        """Returns a reservation that was not used."""
+        self.tokens = min(self.capacity, self.tokens + 1.0)
+
+
+class ProviderScheduler:
+    """
+    Outbound concurrency for one provider, adapted AIMD-style.
+
+    The number of calls in flight grows by one per round of successful calls
+    (additive increase) and is multiplied by `backoff` when the provider
+    throttles (429 / overloaded) or when recent latency climbs past
+    `latency_factor` times its long-run average (multiplicative decrease),
+    at most once per round trip. A throttled call pauses new calls for the
+    provider's Retry-After (or an exponential pause without one) and goes
+    back in the queue, at most `throttle_retries` times; after that it is a
+    failure (a provider answering 503 to everything is down, and the router
+    should fail over). Calls beyond the limit wait in FIFO order instead of
+    failing; one that cannot start within `queue_timeout` seconds fails.
+    An optional token bucket (`rpm`) keeps the send rate within the quota.
+
+    Lives on the event loop; the blocking query path is not scheduled.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int = 8,
+        minimum: int = 1,
+        maximum: int = 64,
+        rpm: float = 0.0,
+        burst: Optional[float] = None,
+        backoff: float = 0.5,
+        latency_factor: float = 2.0,
+        queue_timeout: float = 120.0,
+        pause_seconds: float = 1.0,
+        max_pause_seconds: float = 60.0,
+        throttle_retries: int = 2,
+    ):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.queue_timeout = queue_timeout
+        self.pause_seconds = pause_seconds
+        self.max_pause_seconds = max_pause_seconds
+        self.throttle_retries = max(0, throttle_retries)
+        self.bucket = TokenBucket(rpm, burst) if rpm > 0 else None
+
+        self.in_flight = 0
+        self._waiters = deque()
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._consecutive_throttles = 0
+        # Short / long exponential averages of call latency
+        self._recent_latency = None
+        self._baseline_latency = None
+
+        self.throttled = 0
+        self.decreases = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls, name: str) -> "ProviderScheduler":
+        """LLM_<NAME>_* per provider (e.g. LLM_GEMINI_RPM), falling back to LLM_*."""
+        def setting(key: str, default: str) -> str:
+            return os.getenv(f"LLM_{name.upper()}_{key}", os.getenv(f"LLM_{key}", default))
+
+        burst = setting("BURST", "")
+        return cls(
+            name,
+            initial=int(setting("INITIAL_CONCURRENCY", "8")),
+            minimum=int(setting("MIN_CONCURRENCY", "1")),
+            maximum=int(setting("MAX_CONCURRENCY", "64")),
+            rpm=float(setting("RPM", "0")),
+            burst=float(burst) if burst else None,
+            backoff=float(setting("BACKOFF", "0.5")),
+            latency_factor=float(setting("LATENCY_FACTOR", "2.0")),
+            queue_timeout=float(setting("QUEUE_TIMEOUT_SECONDS", "120")),
+            pause_seconds=float(setting("THROTTLE_PAUSE_SECONDS", "1")),
+            max_pause_seconds=float(setting("THROTTLE_MAX_PAUSE_SECONDS", "60")),
+            throttle_retries=int(setting("THROTTLE_RETRIES", "2")),
+        )
+
+    # ---------------- slots ----------------
+
+    @property
+    def slots(self) -> int:
+        return max(self.minimum, int(self.limit))
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.slots:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def _take_slot(self, timeout: float):
+        if self.in_flight < self.slots and not self._waiters:
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over as we gave up: pass it on
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    async def acquire(self, deadline: float):
+        """
+        Wait for a slot, the end of any throttle pause and a rate token.
+        Raises TimeoutError when the call cannot start before `deadline`
+        (time.monotonic()); on return the caller owns a slot.
+        """
+        try:
+            await self._take_slot(max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"{self.name}: waited over {self.queue_timeout:g}s for a provider slot")
+
+        reserved = False
+        try:
+            delay = self.paused_until - time.monotonic()
+            if self.bucket is not None:
+                delay = max(delay, self.bucket.reserve())
+                reserved = True
+            if time.monotonic() + delay > deadline:
+                self.timeouts += 1
+                raise TimeoutError(f"{self.name}: rate limited past the {self.queue_timeout:g}s queue timeout")
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            if reserved:
+                self.bucket.refund()
+            self.release()
+            raise
+
+    def release(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._wake()
+
+    # ---------------- feedback ----------------
+
+    def _decrease(self):
+        now = time.monotonic()
+        # One cut per round trip: a burst of 429s from one window is one signal
+        if now - self._last_decrease < (self._recent_latency or 1.0):
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * self.backoff)
+        self.decreases += 1
+
+    def succeeded(self, seconds: float):
+        self._consecutive_throttles = 0
+        if self._recent_latency is None:
+            self._recent_latency = self._baseline_latency = seconds
+        else:
+            self._recent_latency += 0.3 * (seconds - self._recent_latency)
+            self._baseline_latency += 0.02 * (seconds - self._baseline_latency)
+
+        if self._recent_latency > self.latency_factor * self._baseline_latency:
+            self._decrease()
+        else:
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+        self.release()
+
+    def throttled_call(self, retry_after: Optional[float]):
+        self.throttled += 1
+        self._consecutive_throttles += 1
+        self._decrease()
+        pause = retry_after if retry_after is not None else min(
+            self.max_pause_seconds, self.pause_seconds * 2 ** (self._consecutive_throttles - 1)
+        )
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        self.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": self.slots,
+            "in_flight": self.in_flight,
+            "queued": sum(1 for w in self._waiters if not w.done()),
+            "paused_seconds": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "rpm": round(self.bucket.rate * 60, 1) if self.bucket else None,
+            "throttled": self.throttled,
+            "decreases": self.decreases,
+            "queue_timeouts": self.timeouts,
+        }
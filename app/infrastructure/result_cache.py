@@ -0,0 +1,179 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+from app.domain.schemas import ExtractionResult
+
+# Expired disk rows are deleted at most this often (from the write path)
+_PURGE_INTERVAL_SECONDS = 600
+
+
+class ExtractionCache:
+    """
+    Two-tier cache of finished extractions, keyed on the upload content.
+
+    Tier 1 is an in-process LRU (bounded by entry count and TTL).
+    Tier 2 is a SQLite file that every uvicorn worker on the box can share,
+    so a document extracted by one worker is a hit for all of them.
+    Values are stored as serialized ExtractionResult JSON.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 86400, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+
+        self._memory = OrderedDict()  # key -> (expires_at, payload_json)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        self._next_purge = 0.0
+        if db_path:
+            self._init_db(db_path)
+
+    @classmethod
+    def from_env(cls) -> Optional["ExtractionCache"]:
+        if os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+            return None
+
+        return cls(
+            max_entries=int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "512")),
+            ttl_seconds=float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", "86400")),
+            # Empty string disables the shared disk tier
+            db_path=os.getenv("EXTRACTION_CACHE_DB", ".cache/extractions.sqlite3") or None,
+        )
+
+    @staticmethod
+    def make_key(digest: str, provider: str, model: str, prompt_version: str) -> str:
+        """digest is the SHA-256 hex of the upload (computed while it is spooled)."""
+        return f"{digest}:{provider}:{model}:{prompt_version}"
+
+    # ---------------- disk tier ----------------
+
+    def _init_db(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(db_path, timeout=5.0, check_same_thread=False)
+        # WAL lets several worker processes read while one writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS extraction_cache_expiry ON extraction_cache (expires_at)")
+        self._db.commit()
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        if self._db is None:
+            return None
+
+        try:
+            row = self._db.execute(
+                "SELECT payload, expires_at FROM extraction_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Cache read error: {e}")
+            return None
+
+        if row is None:
+            return None
+
+        if row[1] < time.time():
+            return None
+
+        return row
+
+    def _disk_set(self, key: str, payload: str, expires_at: float):
+        if self._db is None:
+            return
+
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, payload, expires_at) VALUES (?, ?, ?)",
+                (key, payload, expires_at),
+            )
+            now = time.time()
+            if now >= self._next_purge:
+                self._next_purge = now + _PURGE_INTERVAL_SECONDS
+                self._db.execute("DELETE FROM extraction_cache WHERE expires_at < ?", (now,))
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Cache write error: {e}")
+
+    # ---------------- public API ----------------
+
+    def get(self, key: str) -> Optional[ExtractionResult]:
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at >= now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return self._load(payload)
+
+                del self._memory[key]
+                self.evictions += 1
+
+            row = self._disk_get(key)
+            if row is None:
+                self.misses += 1
+                return None
+
+            payload, expires_at = row
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, payload, expires_at)
+
+        return self._load(payload)
+
+    def set(self, key: str, extraction: ExtractionResult):
+        payload = extraction.model_dump_json()
+        expires_at = time.time() + self.ttl_seconds
+
+        with self._lock:
+            self._remember(key, payload, expires_at)
+            self._disk_set(key, payload, expires_at)
+
+    def _load(self, payload: str) -> ExtractionResult:
+        result = ExtractionResult.model_validate_json(payload)
+        result.meta.cached = True
+        return result
+
+    def _remember(self, key: str, payload: str, expires_at: float):
+        self._memory[key] = (expires_at, payload)
+        self._memory.move_to_end(key)
+
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": self._db is not None,
+            }
@@ -1,37 +1,147 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from contextlib import aclosing, asynccontextmanager
+import os
+import asyncio
+import importlib
+import zipfile
 import uvicorn
+from typing import List, Optional
 from app.services.extractor_logic import DocumentExtractor
-from app.domain.schemas import DocumentExtraction
+from app.services.plot_stream import sse
+from app.services.page_raster import parse_quality
+from app.services.batch import BATCH_MAX_FILES, is_zip, zip_sources, stream_batch, upload_source
+from app.services.upload import (
+    MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, MULTIPART_SLACK_BYTES,
+    UploadTooLarge, UploadLimitMiddleware, spool_upload,
+)
+from app.infrastructure import metrics
+from app.infrastructure.job_queue import JobQueue
+from app.services.jobs import JOB_MAX_ATTEMPTS, JOB_QUEUE_MAX, JobWorkerPool
+from app.infrastructure.prompt_registry import PROMPTS
+from app.infrastructure.base_provider import ProviderError
+from app.infrastructure.http_clients import HTTP_CLIENTS
+from app.infrastructure.plot_store import PLOT_STORE_MAX_LIMIT
+from app.domain.schemas import ExtractionResult, JobStatus, PlotQueryResult
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Backoff for building the extractor when startup fails (seconds)
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", "2"))
+STARTUP_RETRY_MAX_SECONDS = float(os.getenv("STARTUP_RETRY_MAX_SECONDS", "60"))
+
 # Singleton logic layer
 extractor = None
+job_queue = None
+job_pool = None
+startup_task = None
+
+async def start_services():
+    """
+    Runs in the background once the server accepts connections: builds the
+    extractor (retried until it succeeds), starts the job workers, then
+    loads PyMuPDF, the render pool and the providers concurrently. /ready
+    turns 200 when a provider is up.
+    """
+    global extractor, job_pool
+    delay = STARTUP_RETRY_SECONDS
+    while extractor is None:
+        try:
+            extractor = await asyncio.to_thread(DocumentExtractor)
+        except Exception as e:
+            print(f"ERROR building extractor: {e}; retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STARTUP_RETRY_MAX_SECONDS)
+
+    if job_queue:
+        job_pool = JobWorkerPool(extractor, job_queue)
+        job_pool.start()
+
+    # Side by side: a slow or broken render pool must not hold up the providers
+    warm_ups = {"PyMuPDF": asyncio.to_thread(importlib.import_module, "pymupdf")}
+    if extractor.render_pool is not None:
+        warm_ups["render pool"] = extractor.render_pool.warm_up()
+    warm_up = getattr(extractor.ai, "warm_up", None)
+    if warm_up is not None:
+        warm_ups["providers"] = warm_up()
+    results = await asyncio.gather(*warm_ups.values(), return_exceptions=True)
+    for name, result in zip(warm_ups, results):
+        if isinstance(result, Exception):
+            print(f"ERROR warming up {name}: {result}")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global extractor
+    global job_queue, startup_task
     print("--- Startup: Loading Service ---")
     try:
-        extractor = DocumentExtractor()
+        job_queue = JobQueue.from_env()
     except Exception as e:
-        print(f"CRITICAL ERROR during model load: {e}")
+        print(f"ERROR starting job queue: {e}")
+
+    # Nothing slow happens before the server starts listening
+    startup_task = asyncio.create_task(start_services())
     yield
     print("--- Shutdown: Cleaning up ---")
+    startup_task.cancel()
+    await asyncio.gather(startup_task, return_exceptions=True)
+    if job_pool:
+        # Running jobs go back to the queue and resume after restart
+        await job_pool.stop()
+    if extractor and extractor.render_pool:
+        extractor.render_pool.close()
+    await HTTP_CLIENTS.aclose()
+
+def providers_ready() -> bool:
+    return extractor is not None and getattr(extractor.ai, "ready", True)
 
 app = FastAPI(title="Quickplot Extraction API", lifespan=lifespan)
+# Refuse oversized bodies before multipart parsing spools them
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/extract": MAX_UPLOAD_BYTES + MULTIPART_SLACK_BYTES,
+    "/extract/stream": MAX_UPLOAD_BYTES + MULTIPART_SLACK_BYTES,
+    "/extract/batch": MAX_BATCH_UPLOAD_BYTES,
+    "/jobs": MAX_UPLOAD_BYTES + MULTIPART_SLACK_BYTES,
+})
 
 @app.get("/")
 async def root():
-    status = "active" if extractor else "inactive"
+    status = "active" if providers_ready() else "inactive"
     return {"status": status, "service": "LangChain Service"}
 
+@app.get("/live")
+async def live():
+    """Liveness: the process is up and its event loop answers."""
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness: 200 once the extractor is built and at least one provider is loaded."""
+    providers = {}
+    if extractor is not None:
+        readiness = getattr(extractor.ai, "readiness", None)
+        providers = readiness() if readiness else {extractor.ai.provider_name: {"state": "ready"}}
+
+    is_ready = providers_ready()
+    if not is_ready:
+        response.status_code = 503
+    return {
+        "ready": is_ready,
+        "extractor": "ready" if extractor is not None else "starting",
+        "job_queue": "ready" if job_queue is not None else "unavailable",
+        "providers": providers,
+    }
+
 @app.post("/extract")
-async def extract_plot_data(file: UploadFile = File(...)):
-    if not extractor:
-        raise HTTPException(status_code=503, detail="Model initialization failed.")
+async def extract_plot_data(
+    response: Response,
+    file: UploadFile = File(...),
+    refresh: bool = Query(False, description="Bypass the result cache and re-extract"),
+    pages: Optional[str] = Query(None, description="1-based PDF page range, e.g. '1-3,5' (default: all pages)"),
+    quality: Optional[str] = Query(None, description="Scan render quality: low | standard | high (default: standard)"),
+):
+    if not providers_ready():
+        raise HTTPException(status_code=503, detail="Service is starting; no provider is ready yet.")
 
     try:
         # # Read file into memory
@@ -42,19 +152,256 @@ async def extract_plot_data(file: UploadFile = File(...)):
         # # Process through Service Logic
         # result = extractor.process(file_bytes, file.filename)
         # return result
-        file_bytes = await file.read()
-        if not file_bytes:
-            raise HTTPException(status_code=400, detail="Empty file uploaded.")
+        timer = metrics.begin_request(file.filename)
+
+        # Spool to disk (hash + type sniffing on the way) instead of holding the upload in memory
+        with metrics.stage("upload_read"):
+            document = await spool_upload(file)
+
+        with document:
+            if not document.size:
+                raise HTTPException(status_code=400, detail="Empty file uploaded.")
+
+            extraction: ExtractionResult = await extractor.aprocess(
+                document, file.filename, use_cache=not refresh, pages=pages, quality=quality
+            )
 
-        # Gemini returns DocumentExtraction
-        extraction: DocumentExtraction = extractor.process(file_bytes, file.filename)
+        if metrics.SERVER_TIMING_HEADER:
+            response.headers["Server-Timing"] = timer.server_timing()
 
         return extraction
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ProviderError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
          raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"API Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/extract/stream")
+async def extract_plot_stream(
+    file: UploadFile = File(...),
+    refresh: bool = Query(False, description="Bypass the result cache and re-extract"),
+    pages: Optional[str] = Query(None, description="1-based PDF page range, e.g. '1-3,5' (default: all pages)"),
+    quality: Optional[str] = Query(None, description="Scan render quality: low | standard | high (default: standard)"),
+):
+    """
+    Server-sent events, sent as the model writes its answer:
+    event: plot    {"page": ..., "plot": {...}} per lot as soon as it is complete
+    event: done    the ExtractionResult /extract returns (lots split across pages merged)
+    event: error   {"detail": "..."} when the extraction fails
+    """
+    if not providers_ready():
+        raise HTTPException(status_code=503, detail="Service is starting; no provider is ready yet.")
+    try:
+        quality = parse_quality(quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    metrics.begin_request(file.filename)
+    try:
+        with metrics.stage("upload_read"):
+            document = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not document.size:
+        document.close()
+        raise HTTPException(status_code=400, detail="Empty file uploaded.")
+
+    async def events():
+        stream = sse(extractor.astream(document, file.filename, use_cache=not refresh, pages=pages, quality=quality))
+        with document:
+            async with aclosing(stream):
+                async for frame in stream:
+                    yield frame
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/extract/batch")
+async def extract_batch(
+    files: List[UploadFile] = File(..., description="Documents and/or ZIP archives of documents"),
+    refresh: bool = Query(False, description="Bypass the result cache and re-extract"),
+    pages: Optional[str] = Query(None, description="1-based PDF page range applied to every PDF"),
+    quality: Optional[str] = Query(None, description="Scan render quality: low | standard | high (default: standard)"),
+):
+    """
+    Streams newline-delimited JSON, one line per document in completion order:
+    {"filename": ..., "status": "ok", "result": {...}} or
+    {"filename": ..., "status": "error", "error": "..."}
+    """
+    if not providers_ready():
+        raise HTTPException(status_code=503, detail="Service is starting; no provider is ready yet.")
+
+    sources = []
+    try:
+        quality = parse_quality(quality)
+        for upload in files:
+            head = await upload.read(4)
+            await upload.seek(0)
+
+            if is_zip(upload.filename or "", head):
+                try:
+                    archive = zipfile.ZipFile(upload.file)
+                except zipfile.BadZipFile:
+                    raise ValueError(f"'{upload.filename}' is not a valid ZIP archive.")
+                sources.extend(zip_sources(archive))
+            else:
+                sources.append((upload.filename, upload_source(upload)))
+
+        if not sources:
+            raise ValueError("No files found in batch.")
+        if len(sources) > BATCH_MAX_FILES:
+            raise ValueError(f"Batch has {len(sources)} files; the limit is {BATCH_MAX_FILES}.")
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        stream_batch(extractor, sources, use_cache=not refresh, pages=pages, quality=quality),
+        media_type="application/x-ndjson",
+    )
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    priority: int = Query(0, description="Higher runs first"),
+    refresh: bool = Query(False, description="Bypass the result cache and re-extract"),
+    pages: Optional[str] = Query(None, description="1-based PDF page range, e.g. '1-3,5' (default: all pages)"),
+    quality: Optional[str] = Query(None, description="Scan render quality: low | standard | high (default: standard)"),
+):
+    """
+    Queues a document and returns its job id at once; poll GET /jobs/{id}.
+    Jobs are stored on disk and survive restarts.
+    """
+    if not job_queue:
+        raise HTTPException(status_code=503, detail="Job queue unavailable.")
+    try:
+        quality = parse_quality(quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        if await asyncio.to_thread(job_queue.queued_count) >= JOB_QUEUE_MAX:
+            raise HTTPException(status_code=429, detail="Job queue is full; retry later.")
+
+        document = await spool_upload(file)
+        with document:
+            if not document.size:
+                raise HTTPException(status_code=400, detail="Empty file uploaded.")
+            job_id = await asyncio.to_thread(
+                job_queue.enqueue, document, file.filename, priority, pages, not refresh, JOB_MAX_ATTEMPTS, quality
+            )
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        print(f"API Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if job_pool:
+        job_pool.notify()
+    return {"id": job_id, "status": "queued", "priority": priority}
+
+@app.get("/jobs/stats")
+async def job_stats():
+    if not job_queue:
+        return {"enabled": False}
+    stats = await asyncio.to_thread(job_queue.stats)
+    return {"enabled": True, "workers": job_pool.workers if job_pool else 0, **stats}
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    if not job_queue:
+        raise HTTPException(status_code=503, detail="Job queue unavailable.")
+
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    return JobStatus(
+        id=job["id"],
+        status=job["status"],
+        priority=job["priority"],
+        filename=job["filename"],
+        attempts=job["attempts"],
+        max_attempts=job["max_attempts"],
+        error=job["error"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        result=ExtractionResult.model_validate_json(job["result"]) if job["result"] else None,
+    )
+
+@app.get("/plots", response_model=PlotQueryResult)
+async def query_plots(
+    lot_no: Optional[str] = Query(None, description="Lot number (exact)"),
+    block: Optional[str] = Query(None, description="Block (exact, case-insensitive)"),
+    q: Optional[str] = Query(None, description="Words that must all appear in the address or notes"),
+    limit: int = Query(50, ge=1, le=PLOT_STORE_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Lots from documents extracted before, without another extraction.
+    Newest first; best text matches first when q is given.
+    """
+    if not extractor:
+        raise HTTPException(status_code=503, detail="Service is starting.")
+    if not extractor.plot_store:
+        raise HTTPException(status_code=503, detail="Plot store unavailable.")
+    return await asyncio.to_thread(extractor.plot_store.search, lot_no, block, q, limit, offset)
+
+@app.get("/plots/stats")
+async def plot_store_stats():
+    if not extractor or not extractor.plot_store:
+        return {"enabled": False}
+    stats = await asyncio.to_thread(extractor.plot_store.stats)
+    return {"enabled": True, **stats}
+
+@app.get("/providers")
+async def provider_stats():
+    if not extractor:
+        raise HTTPException(status_code=503, detail="Service is starting.")
+    stats = getattr(extractor.ai, "stats", None)
+    return stats() if stats else {"provider": extractor.ai.provider_name}
+
+@app.get("/http/stats")
+async def http_stats():
+    """Shared provider connection pool: occupancy, reuse and transport errors."""
+    return HTTP_CLIENTS.stats()
+
+@app.get("/prompts")
+async def prompt_stats():
+    """Prompt templates with their token counts and the A/B split in effect."""
+    return await asyncio.to_thread(PROMPTS.stats)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    if not extractor or not extractor.cache:
+        return {"enabled": False}
+    stats = {"enabled": True, **extractor.cache.stats()}
+    if extractor.near_dups is not None:
+        stats["near_duplicates"] = extractor.near_dups.stats()
+    return stats
+
+@app.get("/render/stats")
+async def render_stats():
+    """Render pool size, pages in flight and time pages waited for a process."""
+    if not extractor or not extractor.render_pool:
+        return {"enabled": False}
+    return {"enabled": True, **extractor.render_pool.stats()}
+
 # if __name__ == "__main__":
 #     uvicorn.run("app.main:app",port=2026, reload=False)
@@ -0,0 +1,95 @@
+import os
+import json
+import asyncio
+import zipfile
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
+from app.infrastructure import metrics
+from app.services.upload import MAX_UPLOAD_BYTES, DocumentSource, spool_stream, spool_upload
+
+# Files of one batch that are in flight at once (the extractor's own
+# MAX_CONCURRENT_EXTRACTIONS cap still applies across all requests).
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "1000"))
+
+# (filename, coroutine factory returning the spooled document)
+BatchSource = Tuple[str, Callable[[], Awaitable[DocumentSource]]]
+
+
+def is_zip(filename: str, head: bytes) -> bool:
+    return filename.lower().endswith(".zip") or head.startswith(b"PK\x03\x04")
+
+
+def upload_source(upload) -> Callable[[], Awaitable[DocumentSource]]:
+    async def load():
+        return await spool_upload(upload)
+    return load
+
+
+def zip_sources(archive: zipfile.ZipFile) -> List[BatchSource]:
+    """
+    One source per regular file in the archive; entries are decompressed
+    straight to a spool file on demand, so each is bounded by MAX_UPLOAD_BYTES
+    no matter what the archive claims.
+    """
+    lock = asyncio.Lock()
+    sources = []
+
+    for info in archive.infolist():
+        name = info.filename
+        base = os.path.basename(name)
+        if info.is_dir() or not base or base.startswith(".") or name.startswith("__MACOSX/"):
+            continue
+
+        async def load(info=info):
+            # ZipFile reads share one file handle
+            async with lock:
+                return await asyncio.to_thread(_spool_entry, archive, info)
+
+        sources.append((name, load))
+
+    if len(sources) > BATCH_MAX_FILES:
+        raise ValueError(f"Batch has {len(sources)} files; the limit is {BATCH_MAX_FILES}.")
+
+    return sources
+
+
+def _spool_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> DocumentSource:
+    if info.file_size > MAX_UPLOAD_BYTES:
+        raise ValueError(f"'{info.filename}' exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit.")
+    with archive.open(info) as entry:
+        return spool_stream(entry, info.filename, MAX_UPLOAD_BYTES)
+
+
+async def stream_batch(extractor, sources: List[BatchSource], concurrency: int = BATCH_CONCURRENCY, **process_kwargs) -> AsyncIterator[str]:
+    """
+    Run every source through extractor.aprocess and yield one NDJSON line per
+    file as soon as it finishes (completion order, not upload order).
+    A failing file yields an error line; the rest of the batch carries on.
+    """
+    gate = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(filename: str, load):
+        async with gate:
+            # Each task runs in its own context copy, so this timer is per file
+            metrics.begin_request(filename)
+            try:
+                with metrics.stage("upload_read"):
+                    document = await load()
+                with document:
+                    if not document.size:
+                        raise ValueError("Empty file uploaded.")
+                    result = await extractor.aprocess(document, filename, **process_kwargs)
+                return {"filename": filename, "status": "ok", "result": result.model_dump()}
+            except Exception as e:
+                print(f"Batch error for {filename}: {e}")
+                return {"filename": filename, "status": "error", "error": str(e)}
+
+    tasks = [asyncio.ensure_future(run(name, load)) for name, load in sources]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            yield json.dumps(line) + "\n"
+    finally:
+        # Client went away: don't keep spending provider calls
+        for task in tasks:
+            task.cancel()
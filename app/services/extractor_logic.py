@@ -78,103 +78,683 @@
 #             return PlotData(optional_notes=f"Processing failed: {str(e)}")
 
 
-import io
-import base64
-from PIL import Image
-import pymupdf
-from app.domain.schemas import DocumentExtraction, PlotData
+import os
+import time
+import asyncio
+import threading
+from contextlib import aclosing, nullcontext
+from typing import AsyncIterator, List, NamedTuple, Optional, Union
+from PIL import Image, ImageOps
+from app.domain.schemas import (
+    DocumentExtraction, PlotData, ExtractionResult, ExtractionMeta, PayloadStats, RulePage, PageTier,
+)
+from app.infrastructure.base_provider import ProviderError
+from app.infrastructure.result_cache import ExtractionCache
+from app.infrastructure.near_duplicate_index import NearDuplicateIndex
+from app.infrastructure.plot_store import PlotStore
+from app.infrastructure import metrics, model_tiers
+from app.infrastructure.prompt_registry import PROMPTS
+from app.services.page_merge import parse_page_range, merge_page_extractions, merge_numbered_pages
+from app.services.image_payload import PayloadShaper
+from app.services.page_raster import RENDER_DPI, RENDER_TRIM, PageRaster, parse_quality, render_page
+from app.services.render_pool import RenderPool, image_units
+from app.services import plot_stream
+from app.services.plot_stream import PlotStream, PlotStreamParser
+from app.services.upload import DocumentSource
+from app.services.near_duplicates import PageReuse
+from app.services.rule_extractor import RuleExtractor
+from app.services.lot_retry import LotRetrier
+from app.services.page_complexity import image_page_tier, text_page_tier
+from app.services.text_layer import TEXT_LAYER_ENABLED, extract_page_layout, text_layer_content
+from app.services.lot_segmentation import (
+    LOT_SEGMENTATION, LOT_FANOUT, LOT_SECTION_PROMPT,
+    segment_text_layer, page_lot_headers, lot_text_content,
+)
+
+# Upper bound on extractions running at once in this worker (render + LLM call).
+MAX_CONCURRENT_EXTRACTIONS = int(os.getenv("MAX_CONCURRENT_EXTRACTIONS", "8"))
+# Pages of one PDF that are rendered / sent to the provider at the same time.
+PAGE_FANOUT = int(os.getenv("PAGE_FANOUT", "4"))
+
+
+class PreparedPage(NamedTuple):
+    units: list
+    # Near-duplicate fingerprint (None when the index is off)
+    fingerprint: Optional[int] = None
+    # Result obtained without the provider (near-duplicate page or rule-based
+    # read); units is empty then
+    result: Optional[DocumentExtraction] = None
+    # What the rule-based pre-extractor found on a text-layer page
+    rules: Optional[RulePage] = None
+    # Per unit, its rect on the page (PDF points / image pixels; None for the whole page)
+    regions: Optional[list] = None
+    # Resolution a scanned PDF page was rendered at
+    dpi: Optional[float] = None
+    # Complexity score and the model tier it selects (None: tiering off)
+    tier: Optional[PageTier] = None
 
 
 class DocumentExtractor:
-    def __init__(self):
-        from app.infrastructure.gemini_service import GeminiService
-        self.ai = GeminiService()
-        # from app.infrastructure.openai_service import OpenAIService
-        # self.ai = OpenAIService()
-        # from app.infrastructure.huggingface_service import HuggingFaceService
-        # self.ai = HuggingFaceService()
-
-    def _pil_to_base64_content(self, img: Image.Image):
-        buffered = io.BytesIO()
-
-        if img.mode != "RGB":
-            img = img.convert("RGB")
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_EXTRACTIONS, page_fanout: int = PAGE_FANOUT, provider=None):
+        if provider is None:
+            # Ordered provider list comes from LLM_PROVIDERS (default: gemini);
+            # the providers themselves are loaded by warm_up / ensure_ready
+            from app.infrastructure.provider_router import ProviderRouter
+            provider = ProviderRouter.from_env()
+        self.ai = provider
+
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.page_fanout = max(1, page_fanout)
+        self.cache = ExtractionCache.from_env()
+        # Page results are stored in the cache, so the index needs it
+        self.near_dups = NearDuplicateIndex.from_env() if self.cache else None
+        # Extracted plots, queryable by lot / block / text (GET /plots)
+        self.plot_store = PlotStore.from_env()
+        self.prompts = PROMPTS
+        self.shaper = PayloadShaper.from_env()
+        self.use_text_layer = TEXT_LAYER_ENABLED
+        self.rules = RuleExtractor.from_env()
+        self.segmentation = LOT_SEGMENTATION
+        self.lot_fanout = max(1, LOT_FANOUT)
+        # Scanned pages are rasterized / encoded in processes on multi-core machines (RENDER_PROCESSES)
+        self.render_pool = RenderPool.from_env(self.shaper, self.segmentation)
+
+    def _cache_key(self, source: DocumentSource, prompt_version: str, pages: Optional[str] = None,
+                   quality: str = "standard") -> str:
+        key = ExtractionCache.make_key(
+            source.sha256,
+            self.ai.provider_name,
+            self.ai.model_name,
+            prompt_version,
+        )
+        return f"{key}:pages={pages or 'all'}:{self._pipeline_key(quality)}"
+
+    def _pipeline_key(self, quality: str = "standard") -> str:
+        return (
+            f"text={int(self.use_text_layer)}:seg={self.segmentation}:rules={int(self.rules is not None)}"
+            f":render={RENDER_DPI}/{quality}/trim={int(RENDER_TRIM)}:tiers={model_tiers.pipeline_key()}"
+        )
+
+    def _page_reuse(self, prompt_version: str, use_cache: bool, quality: str = "standard") -> Optional[PageReuse]:
+        if self.near_dups is None:
+            return None
+        # Everything that shapes a page's result except the page itself
+        namespace = f"{self.ai.provider_name}:{self.ai.model_name}:{prompt_version}:{self._pipeline_key(quality)}"
+        return PageReuse(self.near_dups, self.cache, namespace, lookup=use_cache)
+
+    # ---------------- input preparation (CPU-bound) ----------------
+
+    def _open_pdf(self, source: DocumentSource):
+        try:
+            with metrics.stage("pdf_open"):
+                return source.open_pdf()
+        except Exception as e:
+            print(f"Error converting PDF: {e}")
+            raise ValueError("Failed to process PDF file.")
+
+    # A "unit" is one provider call: (content blocks, instructions or None
+    # for the default full-document prompt). A page becomes one unit, or one
+    # unit per lot section when it can be segmented.
+
+    def _segment_text(self, page):
+        if self.segmentation not in ("auto", "text"):
+            return None
+        with metrics.stage("segment"):
+            return segment_text_layer(page)
+
+    def _text_units(self, segmentation, layout: str, page_number: int, payload_stats: List[PayloadStats],
+                    rule_sections=None, regions: Optional[list] = None):
+        if regions is None:
+            regions = []
+        if segmentation is None:
+            units = [([text_layer_content(layout, page_number)], None)]
+            regions.append(None)
+        else:
+            units = [
+                ([lot_text_content(segmentation, lot, page_number)], LOT_SECTION_PROMPT)
+                for lot in segmentation.lots
+            ]
+            regions.extend(lot.rect for lot in segmentation.lots)
+
+        if rule_sections is not None:
+            # Partial rule results ride along as hints for the model
+            for (parts, _), plots in zip(units, rule_sections):
+                hint = self.rules.hint_content(plots)
+                if hint is not None:
+                    parts.append(hint)
+
+        for parts, _ in units:
+            text_bytes = sum(len(part["text"].encode("utf-8")) for part in parts)
+            payload_stats.append(PayloadStats(
+                page=page_number,
+                source_bytes=text_bytes,
+                payload_bytes=text_bytes,
+                format="text",
+            ))
+        return units
+
+    def _image_units(self, img: Image.Image, source_bytes: int, page_number: Optional[int], payload_stats: List[PayloadStats],
+                     regions: Optional[list] = None, raster: Optional[PageRaster] = None, lot_headers: int = 0):
+        return image_units(
+            img, source_bytes, page_number, payload_stats, self.shaper, self.segmentation, regions, raster,
+            lot_headers,
+        )
+
+    def _prepare_page(self, doc, page_index: int, doc_lock: threading.Lock, payload_stats: List[PayloadStats],
+                      reuse: Optional[PageReuse] = None, rasterize: bool = True,
+                      quality: str = "standard") -> Optional[PreparedPage]:
+        """
+        Turn one PDF page into provider call units.
+
+        Born-digital pages with a usable text layer are sent as compact
+        positioned text; everything else is rasterized. PyMuPDF documents are
+        not thread-safe, so only page access holds the lock; segmentation,
+        shaping and encoding run in parallel across pages.
+        Text-layer pages are first read by the rule-based pre-extractor; when
+        it finds every lot complete the page needs no provider call.
+        With the near-duplicate index on, a page matching one extracted
+        before is not shaped at all and carries that page's result instead.
+        rasterize=False returns None for pages that need rasterizing (the
+        render pool does them). Rasterized pages are cropped to their content
+        at a DPI chosen per page and `quality` (page_raster.plan_render).
+        """
+        page_number = page_index + 1
+        try:
+            with doc_lock:
+                page = doc.load_page(page_index)
+
+                layout = None
+                if self.use_text_layer:
+                    with metrics.stage("text_layer"):
+                        layout = extract_page_layout(page)
+                if layout is not None:
+                    segmentation = self._segment_text(page)
+                    return self._prepared_text(segmentation, layout, page_number, payload_stats, reuse)
+                if not rasterize:
+                    return None
+
+                lot_headers = page_lot_headers(page) if self.segmentation == "auto" else 0
+                raster = render_page(page, self.shaper, quality)
 
-        img.save(buffered, format="JPEG", quality=90)
+        except Exception as e:
+            print(f"Error converting PDF page {page_number}: {e}")
+            raise ValueError("Failed to process PDF file.")
+
+        return self._prepared_image(
+            raster.image, raster.source_bytes, page_number, payload_stats, reuse, raster, lot_headers
+        )
+
+    def _prepared_text(self, segmentation, layout: str, page_number: int, payload_stats: List[PayloadStats],
+                       reuse: Optional[PageReuse]) -> PreparedPage:
+        rule_sections, rule_page = None, None
+        if self.rules is not None:
+            with metrics.stage("rules"):
+                rule_sections = self.rules.extract_sections(layout, segmentation)
+            if rule_sections is not None:
+                plots = [plot for section in rule_sections for plot in section]
+                context = self.rules.page_context(layout, segmentation)
+                # Only the lots were read; context that may carry values still needs the model
+                confident = self.rules.confident(rule_sections) and not self.rules.substantive(context)
+                rule_page = RulePage(
+                    page=page_number,
+                    llm_skipped=confident,
+                    confidence=[plot.confidence for plot in plots],
+                    context=(context or None) if confident else None,
+                )
+                metrics.record_rule_page("skipped_llm" if confident else ("hinted" if plots else "no_match"))
+                if confident:
+                    return PreparedPage([], None, DocumentExtraction(plots=[plot.to_plot() for plot in plots]), rule_page)
+
+        fingerprint = None
+        if reuse is not None:
+            fingerprint = reuse.text_fingerprint(layout)
+            reused = reuse.reuse(fingerprint, page_number)
+            if reused is not None:
+                return PreparedPage([], fingerprint, reused, rule_page)
+
+        regions = []
+        units = self._text_units(segmentation, layout, page_number, payload_stats, rule_sections, regions)
+        tier = text_page_tier(layout, len(segmentation.lots) if segmentation else 1, page_number)
+        return PreparedPage(units, fingerprint, None, rule_page, regions, tier=tier)
+
+    def _prepared_image(self, img: Image.Image, source_bytes: int, page_number: Optional[int],
+                        payload_stats: List[PayloadStats], reuse: Optional[PageReuse],
+                        raster: Optional[PageRaster] = None, lot_headers: int = 0) -> PreparedPage:
+        fingerprint = None
+        if reuse is not None:
+            fingerprint = reuse.image_fingerprint(img)
+            reused = reuse.reuse(fingerprint, page_number)
+            if reused is not None:
+                return PreparedPage([], fingerprint, reused)
+        regions = []
+        units = self._image_units(img, source_bytes, page_number, payload_stats, regions, raster, lot_headers)
+        tier = image_page_tier(img, len(units), page_number)
+        return PreparedPage(units, fingerprint, regions=regions, dpi=raster.dpi if raster else None, tier=tier)
+
+    def _load_image(self, source: DocumentSource, payload_stats: List[PayloadStats],
+                    reuse: Optional[PageReuse] = None) -> PreparedPage:
+        try:
+            with metrics.stage("image_decode"):
+                img = source.open_image()
+                img.load()
+                ImageOps.exif_transpose(img, in_place=True)
 
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        except Exception as e:
+            print(f"Error opening image: {e}")
+            raise ValueError("Invalid image file.")
 
-        return {
-            "type": "image_url",
-            "image_url": {"url": f"data:image/jpeg;base64,{img_str}"}
-        }
+        return self._prepared_image(img, source.size, None, payload_stats, reuse)
 
-    def process(self, file_bytes: bytes, filename: str) -> DocumentExtraction:
+    async def _prepare_pooled(self, shared, page_index: Optional[int], payload_stats: List[PayloadStats],
+                              reuse: Optional[PageReuse] = None, quality: str = "standard") -> PreparedPage:
+        """Rasterize / encode a scanned page (or an image upload) in the render pool."""
+        page_number = page_index + 1 if page_index is not None else None
+        try:
+            units, stats, fingerprint, regions, tier = await self.render_pool.render(
+                shared, page_index, reuse is not None, quality
+            )
+        except Exception as e:
+            if page_index is None:
+                print(f"Error opening image: {e}")
+                raise ValueError("Invalid image file.")
+            print(f"Error converting PDF page {page_number}: {e}")
+            raise ValueError("Failed to process PDF file.")
+        return await asyncio.to_thread(
+            self._pooled_page, units, stats, fingerprint, regions, tier, page_number, payload_stats, reuse
+        )
+
+    def _pooled_page(self, units, stats: List[PayloadStats], fingerprint: Optional[int], regions: list,
+                     tier: Optional[PageTier], page_number: Optional[int], payload_stats: List[PayloadStats],
+                     reuse: Optional[PageReuse]) -> PreparedPage:
+        if fingerprint is not None:
+            reused = reuse.reuse(fingerprint, page_number)
+            if reused is not None:
+                # Already encoded in the pool; only the base64 step is saved
+                self.render_pool.release(units)
+                return PreparedPage([], fingerprint, reused)
+
+        payload_stats.extend(stats)
+        dpi = stats[0].dpi if stats else None
+        return PreparedPage(self.render_pool.attach(units), fingerprint, regions=regions, dpi=dpi, tier=tier)
+
+    def _select_pages(self, doc, pages: Optional[str]):
+        if len(doc) == 0:
+            raise ValueError("No valid content found to process.")
+        return parse_page_range(pages, len(doc))
+
+    # ---------------- post-processing ----------------
+
+    def _normalize_plot(self, plot: PlotData) -> PlotData:
+        if plot.garage_swing:
+            swing = plot.garage_swing.strip().upper()
+            if swing.startswith("R"):
+                plot.garage_swing = "Right"
+            elif swing.startswith("L"):
+                plot.garage_swing = "Left"
+            elif swing.startswith("S"):
+                plot.garage_swing = "Straight"
+
+        if plot.lot_no:
+            plot.lot_no = plot.lot_no.strip()
+
+        return plot
+
+    def _normalize(self, extraction: DocumentExtraction) -> DocumentExtraction:
+        # -------- NORMALIZE PER-LOT FIELDS SAFELY --------
+        for plot in extraction.plots:
+            self._normalize_plot(plot)
+
+        return extraction
+
+    def _failed(self, e: Exception) -> DocumentExtraction:
+        print(f"Extraction error: {e}")
+
+        # Return valid empty structure — NEVER PlotData
+        return DocumentExtraction(
+            global_elevation=None,
+            global_notes=None,
+            plots=[
+                PlotData(optional_notes=f"Processing failed: {str(e)}")
+            ]
+        )
+
+    def _finalize(self, extraction: DocumentExtraction, payload_stats: List[PayloadStats], prompt_version: str,
+                  complete: bool = True, reuse: Optional[PageReuse] = None,
+                  rule_pages: Optional[List[RulePage]] = None,
+                  retrier: Optional[LotRetrier] = None,
+                  plot_pages: Optional[List[int]] = None,
+                  page_tiers: Optional[List[PageTier]] = None) -> ExtractionResult:
+        payload_stats = sorted(payload_stats, key=lambda s: s.page or 0)
+        meta = ExtractionMeta(
+            complete=complete,
+            source_bytes=sum(s.source_bytes for s in payload_stats),
+            payload_bytes=sum(s.payload_bytes for s in payload_stats),
+            prompt_version=prompt_version,
+            images=payload_stats,
+            near_duplicates=sorted(reuse.matches, key=lambda m: m.page or 0) if reuse else [],
+            rules=sorted(rule_pages or [], key=lambda r: r.page),
+            retries=sorted(retrier.records, key=lambda r: r.page or 0) if retrier else [],
+            pages=plot_pages or [],
+            tiers=sorted(page_tiers or [], key=lambda t: t.page or 0),
+        )
+        print(f"--- Payload: {meta.source_bytes} -> {meta.payload_bytes} bytes over {len(payload_stats)} part(s) ---")
+        return ExtractionResult(plots=extraction.plots, meta=meta)
+
+    def _store_plots(self, source: DocumentSource, filename: str, pages: Optional[str], result: ExtractionResult,
+                     prompt_version: str, replace: bool = True):
+        self.plot_store.save(
+            source.sha256, pages, filename, result,
+            self.ai.provider_name, self.ai.model_name, prompt_version, replace=replace,
+        )
+
+    def _merge_pages(self, page_results, page_indexes):
         """
-        Determines file type, prepares inputs, and queries Gemini.
-        ALWAYS returns DocumentExtraction.
+        page_results holds a DocumentExtraction or an Exception per page.
+        Returns (extraction, complete, plot_pages); a partially failed
+        document keeps its good pages but is flagged so it is not cached.
+        plot_pages is the 1-based page each plot starts on.
         """
+        errors = [(i, r) for i, r in zip(page_indexes, page_results) if isinstance(r, Exception)]
+        if len(errors) == len(page_results):
+            return self._failed(errors[0][1]), False, [errors[0][0] + 1]
+
+        extraction, plot_pages = merge_numbered_pages(
+            [r for r in page_results if not isinstance(r, Exception)],
+            [i + 1 for i, r in zip(page_indexes, page_results) if not isinstance(r, Exception)],
+        )
+        for page_index, e in errors:
+            print(f"Extraction error on page {page_index + 1}: {e}")
+            extraction.plots.append(
+                PlotData(optional_notes=f"Processing failed on page {page_index + 1}: {str(e)}")
+            )
+            plot_pages.append(page_index + 1)
+
+        return extraction, not errors, plot_pages
+
+    # ---------------- pipelines ----------------
+
+    async def _aquery(self, parts, instructions):
+        page_stream = plot_stream.current()
+        with metrics.stage("provider_call", self.ai.provider_name):
+            if page_stream is None:
+                return await self.ai.aquery_document(parts, instructions)
+            return await self._astream_query(page_stream, parts, instructions)
+
+    async def _astream_query(self, page_stream, parts, instructions) -> DocumentExtraction:
+        """Provider call on the streamed path: each plot is sent on as soon as its JSON object closes."""
+        parser = PlotStreamParser()
+        async with aclosing(self.ai.astream_document(parts, instructions)) as stream:
+            async for text in stream:
+                for value in parser.feed(text):
+                    try:
+                        plot = PlotData.model_validate(value)
+                    except ValueError:
+                        # Reported with the whole document below
+                        continue
+                    page_stream.send_plot(self._normalize_plot(plot))
 
-        images_to_process = []
-        is_pdf = filename.lower().endswith(".pdf")
+        try:
+            return parser.result()
+        except ValueError as e:
+            raise ProviderError(self.ai.provider_name, e) from e
+
+    async def _aquery_prepared(self, prepared: PreparedPage, reuse: Optional[PageReuse],
+                               default_instructions: Optional[str] = None, retrier: Optional[LotRetrier] = None,
+                               page_index: Optional[int] = None) -> DocumentExtraction:
+        if prepared.result is not None:
+            page_stream = plot_stream.current()
+            if page_stream is not None:
+                page_stream.send_extraction(self._normalize(prepared.result))
+            return prepared.result
+
+        tier = prepared.tier.tier if prepared.tier else None
+        if tier is not None:
+            metrics.record_page_tier(tier)
+        # Providers pick the tier's model; lot sections and retries run inside this context
+        with model_tiers.using(tier):
+            extraction = await self._aquery_units(
+                prepared.units, default_instructions, retrier, page_index, prepared.regions, prepared.dpi
+            )
+        if prepared.fingerprint is not None:
+            await asyncio.to_thread(reuse.remember, prepared.fingerprint, extraction)
+        return extraction
 
-        if is_pdf:
+    async def _aquery_units(self, units, default_instructions: Optional[str] = None,
+                            retrier: Optional[LotRetrier] = None, page_index: Optional[int] = None,
+                            regions: Optional[list] = None, dpi: Optional[float] = None) -> DocumentExtraction:
+        """
+        default_instructions replaces the provider prompt for whole-page units (A/B arm).
+        With a retrier, units with incomplete / invalid lots or a failed call are re-read.
+        """
+        units = [(parts, instructions or default_instructions) for parts, instructions in units]
+        if len(units) == 1:
+            parts, instructions = units[0]
             try:
-                doc = pymupdf.open(stream=file_bytes, filetype="pdf")
-
-                # For now only first page (you can remove limit later)
-                page = doc.load_page(0)
-                pix = page.get_pixmap()
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                images_to_process.append(img)
-
+                results = [await self._aquery(parts, instructions)]
             except Exception as e:
-                print(f"Error converting PDF: {e}")
-                raise ValueError("Failed to process PDF file.")
-
+                if retrier is None:
+                    raise
+                results = [e]
         else:
-            try:
-                img = Image.open(io.BytesIO(file_bytes))
-                images_to_process.append(img)
+            # One small call per lot section, in parallel
+            fanout = asyncio.Semaphore(self.lot_fanout)
 
-            except Exception as e:
-                print(f"Error opening image: {e}")
-                raise ValueError("Invalid image file.")
+            async def run(parts, instructions):
+                async with fanout:
+                    return await self._aquery(parts, instructions)
 
-        if not images_to_process:
-            raise ValueError("No valid content found to process.")
+            results = await asyncio.gather(
+                *(run(parts, instructions) for parts, instructions in units), return_exceptions=True
+            )
 
-        formatted_images = [
-            self._pil_to_base64_content(img) for img in images_to_process
-        ]
+        if retrier is not None:
+            results = await retrier.retry(page_index, units, regions, results, dpi)
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+
+        if len(results) == 1:
+            return results[0]
+        # Raster bands without a lot header fold into the lot above them
+        return merge_page_extractions(results)
+
+    async def _aextract_pdf(self, source: DocumentSource, pages: Optional[str], payload_stats: List[PayloadStats],
+                            default_instructions: Optional[str] = None, reuse: Optional[PageReuse] = None,
+                            rule_pages: Optional[List[RulePage]] = None, shared=None,
+                            retrier: Optional[LotRetrier] = None, quality: str = "standard",
+                            page_tiers: Optional[List[PageTier]] = None):
+        doc = await asyncio.to_thread(self._open_pdf, source)
+        page_indexes = self._select_pages(doc, pages)
+        if retrier is not None:
+            retrier.first_page = page_indexes[0]
+        doc_lock = threading.Lock()
+        fanout = asyncio.Semaphore(self.page_fanout)
+        render_errors: List[Exception] = []
+
+        async def run_page(page_index: int):
+            # Render lazily inside the fan-out window so at most
+            # page_fanout page images are alive at once.
+            async with fanout:
+                # One page failing to render fails the document: the rest stop here
+                if render_errors:
+                    return None
+                plot_stream.for_page(page_index + 1)
+                # Rendering errors (ValueError) are a bad upload and propagate;
+                # provider errors are collected per page.
+                try:
+                    prepared = await asyncio.to_thread(
+                        self._prepare_page, doc, page_index, doc_lock, payload_stats, reuse, shared is None, quality
+                    )
+                    if prepared is None:
+                        prepared = await self._prepare_pooled(shared, page_index, payload_stats, reuse, quality)
+                except Exception as e:
+                    render_errors.append(e)
+                    return None
+                if render_errors:
+                    return None
+                if prepared.rules is not None and rule_pages is not None:
+                    rule_pages.append(prepared.rules)
+                if prepared.tier is not None and page_tiers is not None:
+                    page_tiers.append(prepared.tier)
+                try:
+                    return await self._aquery_prepared(prepared, reuse, default_instructions, retrier, page_index)
+                except Exception as e:
+                    return e
 
         try:
-            extraction: DocumentExtraction = self.ai.query_document(formatted_images)
-
-            # -------- NORMALIZE PER-LOT FIELDS SAFELY --------
-            for plot in extraction.plots:
-                if plot.garage_swing:
-                    swing = plot.garage_swing.strip().upper()
-                    if swing.startswith("R"):
-                        plot.garage_swing = "Right"
-                    elif swing.startswith("L"):
-                        plot.garage_swing = "Left"
-                    elif swing.startswith("S"):
-                        plot.garage_swing = "Straight"
-
-                if plot.lot_no:
-                    plot.lot_no = plot.lot_no.strip()
+            # run_page does not raise, so the page threads are done with doc here;
+            # the lock covers a cancelled request's stragglers
+            page_results = await asyncio.gather(*(run_page(i) for i in page_indexes))
+        finally:
+            with doc_lock:
+                doc.close()
+        if render_errors:
+            raise render_errors[0]
+
+        return self._merge_pages(page_results, page_indexes)
+
+    async def aprocess(
+        self,
+        file_bytes: Union[bytes, DocumentSource],
+        filename: str,
+        use_cache: bool = True,
+        pages: Optional[str] = None,
+        quality: Optional[str] = None,
+    ) -> ExtractionResult:
+        """
+        Determines file type, prepares inputs, and queries the provider router.
+        ALWAYS returns ExtractionResult (DocumentExtraction + request meta).
+
+        Rendering and encoding run off the event loop (worker threads or the
+        render pool); at most MAX_CONCURRENT_EXTRACTIONS run at once, and
+        cache hits never take a slot. PDF pages run concurrently (PAGE_FANOUT)
+        and are merged into one plots list. pages is a 1-based range such as
+        "1-3,5"; quality (low | standard | high) scales the render resolution.
+        use_cache=False forces a fresh extraction. file_bytes may be a spooled
+        DocumentSource, which the caller keeps and closes.
+        """
 
-            return extraction
+        started = time.perf_counter()
+        quality = parse_quality(quality)
+        timer = metrics.ensure_request(filename)
+        # Providers load in the background after startup; wait for the first one
+        ensure_ready = getattr(self.ai, "ensure_ready", None)
+        if ensure_ready is not None:
+            await ensure_ready()
+        source = file_bytes if isinstance(file_bytes, DocumentSource) else DocumentSource.from_bytes(file_bytes, filename)
+        metrics.set_file_type(source.is_pdf)
+
+        # A/B arm by content hash; None means the provider's default prompt
+        variant = None
+        if self.prompts.ab_variant is not None:
+            variant = self.prompts.choose(await asyncio.to_thread(lambda: source.sha256))
+        prompt_version = variant.id if variant else self.ai.prompt_version
+        default_instructions = variant.text if variant else None
+        metrics.set_prompt(prompt_version)
+
+        cache_key = None
+        if self.cache:
+            cache_key = await asyncio.to_thread(self._cache_key, source, prompt_version, pages, quality)
+            if use_cache:
+                cached = await asyncio.to_thread(self.cache.get, cache_key)
+                if cached is not None:
+                    metrics.record_document(
+                        timer.file_type, "cached", time.perf_counter() - started,
+                        len(cached.plots), 0, 0, prompt=prompt_version,
+                    )
+                    if self.plot_store is not None:
+                        await asyncio.to_thread(
+                            self._store_plots, source, filename, pages, cached, prompt_version, False
+                        )
+                    return cached
+
+        payload_stats: List[PayloadStats] = []
+        rule_pages: List[RulePage] = []
+        page_tiers: List[PageTier] = []
+        reuse = self._page_reuse(prompt_version, use_cache, quality)
+        retrier = LotRetrier.from_env(self.ai, source, self.shaper, self._normalize, payload_stats)
+
+        async with self._slots:
+            with self.render_pool.share(source) if self.render_pool else nullcontext() as shared:
+                if source.is_pdf:
+                    extraction, complete, plot_pages = await self._aextract_pdf(
+                        source, pages, payload_stats, default_instructions, reuse, rule_pages, shared, retrier,
+                        quality, page_tiers,
+                    )
+                elif shared is not None:
+                    prepared = await self._prepare_pooled(shared, None, payload_stats, reuse)
+                else:
+                    prepared = await asyncio.to_thread(self._load_image, source, payload_stats, reuse)
+
+            if not source.is_pdf:
+                plot_pages = None
+                if prepared.tier is not None:
+                    page_tiers.append(prepared.tier)
+                try:
+                    extraction = await self._aquery_prepared(prepared, reuse, default_instructions, retrier)
+                    complete = True
+                except Exception as e:
+                    extraction, complete = self._failed(e), False
+
+        with metrics.stage("normalize"):
+            result = self._finalize(
+                self._normalize(extraction), payload_stats, prompt_version, complete, reuse, rule_pages, retrier,
+                plot_pages, page_tiers,
+            )
 
-        except Exception as e:
-            print(f"Gemini extraction error: {e}")
-
-            # Return valid empty structure — NEVER PlotData
-            return DocumentExtraction(
-                global_elevation=None,
-                global_notes=None,
-                plots=[
-                    PlotData(optional_notes=f"Processing failed: {str(e)}")
-                ]
+        metrics.record_document(
+            timer.file_type, "ok" if complete else "failed", time.perf_counter() - started,
+            len(result.plots), result.meta.source_bytes, result.meta.payload_bytes,
+            prompt=prompt_version,
+        )
+
+        if cache_key and complete:
+            await asyncio.to_thread(self.cache.set, cache_key, result)
+        if self.plot_store is not None and complete:
+            await asyncio.to_thread(self._store_plots, source, filename, pages, result, prompt_version)
+
+        return result
+
+    async def astream(
+        self,
+        file_bytes: Union[bytes, DocumentSource],
+        filename: str,
+        use_cache: bool = True,
+        pages: Optional[str] = None,
+        quality: Optional[str] = None,
+    ) -> AsyncIterator[tuple]:
+        """
+        aprocess as a stream of (event, data): a "plot" ({"page", "plot"})
+        for every lot as soon as the provider has written it, then "done"
+        with the ExtractionResult or "error". Plots are per page and per
+        call, before lots split across a page break are merged; "done"
+        carries the merged document. A cached document is replayed from the
+        result. Closing the stream cancels the extraction.
+        """
+        stream = PlotStream()
+        token = plot_stream.begin(stream)
+        try:
+            # The task runs in a copy of this context, stream included
+            task = asyncio.ensure_future(
+                self.aprocess(file_bytes, filename, use_cache=use_cache, pages=pages, quality=quality)
             )
+        finally:
+            plot_stream.end(token)
+
+        async with aclosing(stream.events(task)) as events:
+            async for event in events:
+                yield event
+
+    def process(
+        self,
+        file_bytes: Union[bytes, DocumentSource],
+        filename: str,
+        use_cache: bool = True,
+        pages: Optional[str] = None,
+        quality: Optional[str] = None,
+    ) -> ExtractionResult:
+        """
+        Blocking wrapper around `aprocess` for scripts. Must not be called
+        from inside a running event loop; the API uses `aprocess` directly.
+        """
+        return asyncio.run(self.aprocess(file_bytes, filename, use_cache=use_cache, pages=pages, quality=quality))
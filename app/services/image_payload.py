@@ -0,0 +1,190 @@
+import io
+import os
+import base64
+from PIL import Image, ImageOps
+from app.domain.schemas import PayloadStats
+from app.infrastructure import metrics
+
+# Quality ladder tried (in order) while the image is over the byte budget.
+_QUALITY_STEPS = (85, 75, 65, 55, 45)
+# Never shrink below this longest edge while chasing the byte budget.
+_MIN_EDGE = 1000
+# Binarizing low-resolution renders eats thin strokes; only do it for real scans.
+_MIN_BINARIZE_EDGE = 1500
+
+
+def pixmap_image(pix) -> Image.Image:
+    """
+    Zero-copy PIL view of an alpha-free RGB / gray PyMuPDF pixmap, so a
+    rendered page is resized / encoded straight from MuPDF's buffer instead
+    of being copied by Image.frombytes(pix.samples) first.
+    The view reads the pixmap's memory: keep `pix` alive while it is used.
+    """
+    mode = "L" if pix.n == 1 else "RGB"
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+
+
+class PayloadShaper:
+    """
+    Turns a PIL image into the smallest model-ready payload that keeps
+    forms legible:
+
+    - caps the longest edge (IMAGE_MAX_EDGE)
+    - drops colour for grayscale content, binarizes clean monochrome scans
+    - picks the encoder from the content (PNG for bilevel, JPEG/WebP otherwise)
+    - steps quality / size down until the image fits IMAGE_TARGET_BYTES
+
+    IMAGE_COLOR_MODE (auto | rgb | gray | binary) and IMAGE_FORMAT
+    (auto | jpeg | png | webp) override the heuristics.
+    """
+
+    def __init__(
+        self,
+        max_edge: int = 2000,
+        target_bytes: int = 800_000,
+        color_mode: str = "auto",
+        image_format: str = "auto",
+        quality: int = 85,
+    ):
+        self.max_edge = max_edge
+        self.target_bytes = target_bytes
+        self.color_mode = color_mode.lower()
+        self.image_format = image_format.lower()
+        self.quality = quality
+
+    @classmethod
+    def from_env(cls) -> "PayloadShaper":
+        return cls(
+            max_edge=int(os.getenv("IMAGE_MAX_EDGE", "2000")),
+            target_bytes=int(os.getenv("IMAGE_TARGET_BYTES", "800000")),
+            color_mode=os.getenv("IMAGE_COLOR_MODE", "auto"),
+            image_format=os.getenv("IMAGE_FORMAT", "auto"),
+            quality=int(os.getenv("IMAGE_QUALITY", "85")),
+        )
+
+    # ---------------- heuristics ----------------
+
+    def _detect_color_mode(self, img: Image.Image) -> str:
+        """Classify content as 'rgb', 'gray' or 'binary' from a small thumbnail."""
+        # Shrink before converting so no full-size copy is made
+        factor = max(1, max(img.size) // 96)
+        if factor > 1 and img.mode in ("L", "RGB", "RGBA"):
+            img_small = img.reduce(factor)
+        else:
+            img_small = img
+        thumb = img_small.convert("RGB")
+        thumb.thumbnail((96, 96))
+
+        pixels = list(thumb.getdata())
+        if not pixels:
+            return "rgb"
+
+        # Mean channel spread; scans and printed forms sit close to 0
+        spread = sum(max(p) - min(p) for p in pixels) / len(pixels)
+        if spread > 12:
+            return "rgb"
+
+        histogram = thumb.convert("L").histogram()
+        extremes = sum(histogram[:48]) + sum(histogram[208:])
+        if extremes / len(pixels) > 0.97 and max(img.size) >= _MIN_BINARIZE_EDGE:
+            return "binary"
+
+        return "gray"
+
+    def _pick_format(self, mode: str) -> str:
+        if self.image_format != "auto":
+            return self.image_format
+        # Bilevel images compress far better losslessly
+        return "png" if mode == "binary" else "jpeg"
+
+    # ---------------- encoding ----------------
+
+    def _convert(self, img: Image.Image, mode: str) -> Image.Image:
+        if mode == "binary":
+            return img.convert("L").point(lambda v: 255 if v > 160 else 0, mode="1")
+        if mode == "gray":
+            return img if img.mode == "L" else img.convert("L")
+        return img if img.mode == "RGB" else img.convert("RGB")
+
+    def _encode(self, img: Image.Image, fmt: str, quality: int) -> bytes:
+        with metrics.stage("encode"):
+            return self._encode_unmetered(img, fmt, quality)
+
+    def _encode_unmetered(self, img: Image.Image, fmt: str, quality: int) -> bytes:
+        buffered = io.BytesIO()
+        if fmt == "png":
+            img.save(buffered, format="PNG", optimize=True)
+        elif fmt == "webp":
+            img.save(buffered, format="WEBP", quality=quality, method=4)
+        else:
+            if img.mode == "1":
+                img = img.convert("L")
+            img.save(buffered, format="JPEG", quality=quality, optimize=True)
+        # View of the encoder output; getvalue() would copy it
+        return buffered.getbuffer()
+
+    def _fit_budget(self, img: Image.Image, fmt: str):
+        """Encode, then lower quality and finally resolution until under budget."""
+        while True:
+            qualities = (self.quality,) if fmt == "png" else (
+                [self.quality] + [q for q in _QUALITY_STEPS if q < self.quality]
+            )
+            for quality in qualities:
+                data = self._encode(img, fmt, quality)
+                if len(data) <= self.target_bytes:
+                    return img, fmt, data
+
+            if fmt == "png":
+                # Lossless did not fit; fall back to a lossy encoder
+                fmt = "jpeg"
+                continue
+
+            if max(img.size) <= _MIN_EDGE:
+                return img, fmt, data
+
+            scale = 0.75
+            img = img.resize(
+                (max(1, int(img.width * scale)), max(1, int(img.height * scale))),
+                Image.LANCZOS,
+            )
+
+    def _content(self, data, fmt: str):
+        with metrics.stage("base64"):
+            # Encoder output is never copied; base64 bytes -> str -> url is the minimum
+            encoded = base64.b64encode(data)
+            url = f"data:image/{fmt};base64," + encoded.decode("ascii")
+            del encoded
+        return {"type": "image_url", "image_url": {"url": url}}
+
+    # ---------------- public API ----------------
+
+    def shape(self, img: Image.Image, source_bytes: int, page: int = None):
+        """
+        Returns (LangChain image content block, PayloadStats).
+        source_bytes is the size of what we started from (upload or raw pixmap).
+        """
+        # in_place avoids the full copy exif_transpose makes even when there is nothing to rotate
+        ImageOps.exif_transpose(img, in_place=True)
+
+        if max(img.size) > self.max_edge:
+            scale = self.max_edge / max(img.size)
+            img = img.resize(
+                (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                Image.LANCZOS,
+            )
+
+        mode = self.color_mode if self.color_mode != "auto" else self._detect_color_mode(img)
+        img = self._convert(img, mode)
+        img, fmt, data = self._fit_budget(img, self._pick_format(mode))
+
+        content = self._content(data, fmt)
+        stats = PayloadStats(
+            page=page,
+            source_bytes=source_bytes,
+            payload_bytes=len(data),
+            format=fmt,
+            color_mode=mode,
+            width=img.width,
+            height=img.height,
+        )
+        return content, stats
@@ -0,0 +1,150 @@
+import os
+import time
+import random
+import asyncio
+from typing import List
+from app.infrastructure import metrics
+from app.infrastructure.job_queue import JobQueue
+from app.services.upload import DocumentSource
+
+# Extraction workers draining the queue in this process (0: enqueue only)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Attempts per job before it is marked failed (provider errors only; bad input fails at once)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+# POST /jobs answers 429 beyond this many queued jobs
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "10000"))
+# Idle workers re-check the queue this often (other processes may enqueue)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+
+_PURGE_INTERVAL_SECONDS = 3600
+
+
+class JobWorkerPool:
+    """
+    Asyncio workers that claim jobs from the JobQueue and run them through
+    extractor.aprocess. The extractor's MAX_CONCURRENT_EXTRACTIONS still
+    bounds the work shared with synchronous /extract requests.
+
+    A job whose result is incomplete (provider failure on some page / lot)
+    or whose call raised is retried with exponential backoff; invalid
+    uploads (ValueError) fail immediately.
+    """
+
+    def __init__(self, extractor, queue: JobQueue, workers: int = JOB_WORKERS,
+                 retry_base_seconds: float = JOB_RETRY_BASE_SECONDS):
+        self.extractor = extractor
+        self.queue = queue
+        self.workers = workers
+        self.retry_base_seconds = retry_base_seconds
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.workers:
+            self._tasks.append(asyncio.create_task(self._housekeeping()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake an idle worker right after an enqueue."""
+        self._wakeup.set()
+
+    async def _worker(self):
+        while True:
+            if not getattr(self.extractor.ai, "ready", True):
+                # Providers still warming up: leave jobs queued rather than burn attempts
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+
+            try:
+                job = await asyncio.to_thread(self.queue.claim)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._run(job)
+            except Exception as e:
+                # A locked database or failed bookkeeping must not end the worker;
+                # a claimed job comes back when its lease runs out
+                print(f"Job worker error: {e}")
+                await asyncio.sleep(JOB_POLL_SECONDS)
+
+    async def _housekeeping(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.queue.purge)
+            except Exception as e:
+                print(f"Job purge error: {e}")
+            await asyncio.sleep(_PURGE_INTERVAL_SECONDS)
+
+    async def _heartbeat(self, job_id: str):
+        # Keep the lease ahead of long extractions so no other worker takes the job over
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            await asyncio.to_thread(self.queue.extend_lease, job_id)
+
+    async def _run(self, job):
+        job_id, filename = job["id"], job["filename"]
+        if job["attempts"] == 1:
+            metrics.record_job("started", time.time() - job["created_at"])
+
+        if job["attempts"] > job["max_attempts"]:
+            # Lease ran out on the last attempt (worker died mid-job)
+            await asyncio.to_thread(self.queue.fail, job_id, job["error"] or "Job abandoned by its worker.")
+            metrics.record_job("failed")
+            return
+
+        if not job["path"] or not os.path.exists(job["path"]):
+            await asyncio.to_thread(self.queue.fail, job_id, "Stored upload is missing.")
+            metrics.record_job("failed")
+            return
+
+        # Not closed here: the queue deletes the stored file once the job is settled
+        source = DocumentSource(filename, path=job["path"], size=job["size"], sha256=job["sha256"], kind=job["kind"])
+        metrics.begin_request(filename)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+
+        try:
+            result = await self.extractor.aprocess(
+                source, filename, use_cache=bool(job["use_cache"]), pages=job["pages"], quality=job["quality"]
+            )
+        except asyncio.CancelledError:
+            await asyncio.shield(asyncio.to_thread(self.queue.release, job_id))
+            raise
+        except ValueError as e:
+            await asyncio.to_thread(self.queue.fail, job_id, str(e))
+            metrics.record_job("failed")
+            return
+        except Exception as e:
+            print(f"Job {job_id} error: {e}")
+            await self._retry_or_fail(job, str(e))
+            return
+        finally:
+            heartbeat.cancel()
+
+        if result.meta.complete:
+            await asyncio.to_thread(self.queue.complete, job_id, result.model_dump_json())
+            metrics.record_job("done")
+        else:
+            await self._retry_or_fail(job, "Provider failed on part of the document.", result.model_dump_json())
+
+    async def _retry_or_fail(self, job, error: str, result_json: str = None):
+        if job["attempts"] >= job["max_attempts"]:
+            await asyncio.to_thread(self.queue.fail, job["id"], error, result_json)
+            metrics.record_job("failed")
+            return
+
+        delay = self.retry_base_seconds * 2 ** (job["attempts"] - 1) * random.uniform(0.8, 1.2)
+        print(f"Job {job['id']} attempt {job['attempts']} failed ({error}); retrying in {delay:.1f}s")
+        await asyncio.to_thread(self.queue.retry, job["id"], error, delay)
+        metrics.record_job("retried")
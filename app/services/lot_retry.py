@@ -0,0 +1,244 @@
+import os
+import re
+import asyncio
+from typing import Callable, Dict, List, Optional
+from PIL import Image, ImageOps
+from app.domain.schemas import DocumentExtraction, LotRetry, PayloadStats, PlotData
+from app.infrastructure import metrics, model_tiers
+from app.infrastructure.prompt_registry import PROMPTS
+from app.services.image_payload import PayloadShaper, pixmap_image
+from app.services.page_raster import RENDER_MAX_MEGAPIXELS
+from app.services.upload import DocumentSource
+
+# Re-read lots that come back incomplete or invalid
+LOT_RETRY_ENABLED = os.getenv("LOT_RETRY_ENABLED", "true").lower() in ("1", "true", "yes")
+# Re-reads (provider calls) per document
+LOT_RETRY_BUDGET = int(os.getenv("LOT_RETRY_BUDGET", "4"))
+# Resolution of a re-read relative to the first call
+LOT_RETRY_ZOOM = float(os.getenv("LOT_RETRY_ZOOM", "2"))
+# Fields every lot must have
+LOT_REQUIRED_FIELDS = tuple(
+    f.strip() for f in os.getenv("LOT_REQUIRED_FIELDS", "lot_no").split(",") if f.strip()
+)
+
+# Re-read prompt (app/prompts/lot_retry.*.txt), passed as `instructions`
+LOT_RETRY_PROMPT = PROMPTS.get("lot_retry").text
+
+_NUMERIC = re.compile(r"^\d+$")
+_GARAGE_SWINGS = ("Left", "Right", "Straight")
+
+
+def field_problem(field: str, value: Optional[str]) -> Optional[str]:
+    """Why a normalized field value is invalid, or None."""
+    if not value:
+        return None
+    if field == "lot_no" and not _NUMERIC.match(value.strip()):
+        return f"lot_no {value!r} is not numeric"
+    if field == "garage_swing" and value not in _GARAGE_SWINGS:
+        return f"garage_swing {value!r} is not Left, Right or Straight"
+    return None
+
+
+def plot_problems(plot: PlotData, required=LOT_REQUIRED_FIELDS, continuation: bool = False) -> Dict[str, str]:
+    """
+    field -> problem for a normalized plot. A continuation plot (first of a
+    lot section or page, no lot_no) is the tail of the lot above it and
+    merged into it, so it is not expected to have the required fields.
+    """
+    problems = {}
+    if not (continuation and not plot.lot_no):
+        for field in required:
+            if not getattr(plot, field, None):
+                problems[field] = f"{field} missing"
+    for field in ("lot_no", "garage_swing"):
+        problem = field_problem(field, getattr(plot, field))
+        if problem:
+            problems[field] = problem
+    return problems
+
+
+class LotRetrier:
+    """
+    Second, closer look at lots whose first reading is incomplete or invalid.
+
+    After a page's provider calls, each plot is checked for missing required
+    fields (LOT_REQUIRED_FIELDS) and invalid values (non-numeric lot_no,
+    garage_swing outside Left / Right / Straight). Only the call units (lot
+    sections, or the page when it was sent whole) holding such a lot, or
+    whose call failed, are rendered again at LOT_RETRY_ZOOM times the
+    resolution and re-read with the lot_retry prompt, by the next model tier
+    up when tiering is on. The re-read fills the lot's flagged and empty
+    fields; fields that were fine are kept. One instance serves one
+    document, with LOT_RETRY_BUDGET re-reads shared by its pages; `records`
+    ends up in meta.retries.
+    """
+
+    def __init__(self, ai, source: DocumentSource, shaper: PayloadShaper,
+                 normalize: Callable[[DocumentExtraction], DocumentExtraction], payload_stats: List[PayloadStats],
+                 budget: int = LOT_RETRY_BUDGET, zoom: float = LOT_RETRY_ZOOM, required=LOT_REQUIRED_FIELDS):
+        self.ai = ai
+        self.source = source
+        self.normalize = normalize
+        self.payload_stats = payload_stats
+        self.budget = budget
+        self.zoom = max(1.0, zoom)
+        self.required = required
+        # Higher resolution also needs a larger edge cap than the first call's
+        self.shaper = PayloadShaper(
+            max_edge=int(shaper.max_edge * self.zoom),
+            target_bytes=shaper.target_bytes,
+            color_mode=shaper.color_mode,
+            image_format=shaper.image_format,
+            quality=shaper.quality,
+        )
+        # Page index of the document's first extracted page; its first lot cannot be a continuation
+        self.first_page: Optional[int] = None
+        self.records: List[LotRetry] = []
+
+    @classmethod
+    def from_env(cls, ai, source: DocumentSource, shaper: PayloadShaper, normalize,
+                 payload_stats: List[PayloadStats]) -> Optional["LotRetrier"]:
+        if not LOT_RETRY_ENABLED or LOT_RETRY_BUDGET <= 0:
+            return None
+        return cls(ai, source, shaper, normalize, payload_stats)
+
+    async def retry(self, page_index: Optional[int], units, regions: Optional[list], results: list,
+                    dpi: Optional[float] = None) -> list:
+        """
+        results holds one DocumentExtraction or Exception per unit of the
+        page; returns it with the re-read units' results corrected.
+        regions holds each unit's rect (None: the whole page); dpi is the
+        resolution the page was first rendered at (text-layer pages: none).
+        """
+        page_number = page_index + 1 if page_index is not None else None
+        retries = []
+        for j, result in enumerate(results):
+            if isinstance(result, Exception):
+                flagged = {None: ({"call": f"call failed: {result}"}, False)}
+            else:
+                self.normalize(result)
+                flagged = {}
+                for i, plot in enumerate(result.plots):
+                    continuation = i == 0 and (j > 0 or page_index != self.first_page)
+                    problems = plot_problems(plot, self.required, continuation)
+                    if problems:
+                        flagged[i] = (problems, continuation)
+            if not flagged:
+                continue
+
+            if self.budget <= 0:
+                self._record(page_number, result, flagged, retried=False)
+                metrics.record_lot_retry("over_budget")
+                continue
+            self.budget -= 1
+            region = regions[j] if regions else None
+            retries.append(self._retry_unit(page_index, units[j], region, dpi, results, j, flagged))
+
+        if retries:
+            await asyncio.gather(*retries)
+        return results
+
+    def _render_region(self, page_index: Optional[int], region, dpi: Optional[float]) -> Image.Image:
+        if page_index is None:
+            img = self.source.open_image()
+            img.load()
+            ImageOps.exif_transpose(img, in_place=True)
+            return img.crop(tuple(int(v) for v in region)) if region is not None else img
+
+        import pymupdf
+        doc = self.source.open_pdf()
+        try:
+            page = doc.load_page(page_index)
+            clip = pymupdf.Rect(region) if region is not None else page.rect
+            scale = self.zoom * (dpi or 72.0) / 72.0
+            # A whole page re-read stays within the renderer's pixel bound
+            scale = min(scale, (RENDER_MAX_MEGAPIXELS * 1e6 / max(1.0, abs(clip))) ** 0.5)
+            pix = page.get_pixmap(matrix=pymupdf.Matrix(scale, scale), clip=clip)
+            # Own copy: the pixmap goes away with the document
+            return pixmap_image(pix).copy()
+        finally:
+            doc.close()
+
+    def _shaped_region(self, page_index: Optional[int], region, dpi: Optional[float], page_number: Optional[int]):
+        with metrics.stage("lot_retry_render"):
+            img = self._render_region(page_index, region, dpi)
+            return self.shaper.shape(img, img.width * img.height * len(img.getbands()), page=page_number)
+
+    async def _retry_unit(self, page_index: Optional[int], unit, region, dpi: Optional[float], results: list, j: int,
+                          flagged: dict):
+        parts, _ = unit
+        page_number = page_index + 1 if page_index is not None else None
+        original = results[j]
+        listing = "; ".join(p for problems, _ in flagged.values() for p in problems.values())
+
+        try:
+            content, stats = await asyncio.to_thread(self._shaped_region, page_index, region, dpi, page_number)
+            self.payload_stats.append(stats)
+
+            retry_parts = [{"type": "text", "text": "LOT SECTION (higher resolution):"}, content]
+            if all(part.get("type") == "text" for part in parts):
+                # Text-layer unit: its text stays alongside the image
+                retry_parts.extend(parts)
+            retry_parts.append({"type": "text", "text": f"Problems with the earlier reading: {listing}"})
+
+            tier = model_tiers.current()
+            if model_tiers.enabled():
+                # The page's first model got this lot wrong: re-read it one tier up
+                tier = model_tiers.escalated(tier)
+            with metrics.stage("lot_retry", self.ai.provider_name), model_tiers.using(tier):
+                reread = await self.ai.aquery_document(retry_parts, LOT_RETRY_PROMPT)
+        except Exception as e:
+            print(f"Lot retry failed on page {page_number}: {e}")
+            self._record(page_number, original, flagged, retried=True)
+            metrics.record_lot_retry("failed")
+            return
+
+        self.normalize(reread)
+        if isinstance(original, Exception):
+            results[j] = reread
+            resolved = not any(plot_problems(plot, self.required) for plot in reread.plots)
+            lot_no = reread.plots[0].lot_no if reread.plots else None
+            self.records.append(LotRetry(
+                page=page_number, lot_no=lot_no, problems=[listing], retried=True, resolved=resolved,
+            ))
+            metrics.record_lot_retry("resolved" if resolved else "unresolved")
+            return
+
+        for i, (problems, continuation) in flagged.items():
+            plot = original.plots[i]
+            candidate = self._match(plot, i, original.plots, reread.plots)
+            if candidate is not None:
+                self._fill(plot, candidate, problems)
+            resolved = not plot_problems(plot, self.required, continuation)
+            self.records.append(LotRetry(
+                page=page_number, lot_no=plot.lot_no, problems=list(problems.values()), retried=True,
+                resolved=resolved,
+            ))
+            metrics.record_lot_retry("resolved" if resolved else "unresolved")
+
+    def _match(self, plot: PlotData, index: int, originals: List[PlotData], candidates: List[PlotData]):
+        """The re-read plot for `plot`: same lot number, else the same position."""
+        if plot.lot_no and not field_problem("lot_no", plot.lot_no):
+            for candidate in candidates:
+                if candidate.lot_no == plot.lot_no:
+                    return candidate
+        if len(candidates) == len(originals):
+            return candidates[index]
+        if len(candidates) == 1:
+            return candidates[0]
+        return None
+
+    def _fill(self, plot: PlotData, candidate: PlotData, problems: Dict[str, str]):
+        for field in PlotData.model_fields:
+            value = getattr(candidate, field)
+            if not value or field_problem(field, value):
+                continue
+            if field in problems or not getattr(plot, field):
+                setattr(plot, field, value)
+
+    def _record(self, page_number: Optional[int], result, flagged: dict, retried: bool):
+        for i, (problems, _) in flagged.items():
+            lot_no = result.plots[i].lot_no if i is not None and not isinstance(result, Exception) else None
+            self.records.append(LotRetry(
+                page=page_number, lot_no=lot_no, problems=list(problems.values()), retried=retried,
+            ))
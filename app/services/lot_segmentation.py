@@ -0,0 +1,175 @@
+import os
+import re
+from typing import List, Optional, Tuple
+from PIL import Image
+from app.infrastructure.prompt_registry import PROMPTS
+
+# auto: text layer when present; a scan is cut at whitespace only when its own
+# text (an OCR layer) names enough lot headers, otherwise it is sent whole
+# text: text layer only | off
+LOT_SEGMENTATION = os.getenv("LOT_SEGMENTATION", "auto").lower()
+# Fewer lot headers than this and the page is sent whole
+SEGMENT_MIN_LOTS = int(os.getenv("SEGMENT_MIN_LOTS", "2"))
+SEGMENT_MAX_LOTS = int(os.getenv("SEGMENT_MAX_LOTS", "24"))
+# Per-lot provider calls of one page in flight at once
+LOT_FANOUT = int(os.getenv("LOT_FANOUT", "6"))
+
+# "Lot 116 - 1685", "Lot 117:", "Lot #119", "Homesite 118" at the start of a line
+LOT_HEADER = re.compile(r"^\s*(?:lot|homesite)\s*(?:no\.?|#)?\s*:?\s*(\d+)\b", re.IGNORECASE)
+
+# Lines whose top edges are this close (points) are the same header row
+_ROW_TOLERANCE = 6.0
+
+# Per-lot prompt (app/prompts/lot_section.*.txt), passed as `instructions`
+LOT_SECTION_PROMPT = PROMPTS.get("lot_section").text
+
+
+class LotSegment:
+    """One lot section of a page; rect is (x0, y0, x1, y1) in the page's own units."""
+
+    def __init__(self, rect: Tuple[float, float, float, float], label: Optional[str] = None, text: Optional[str] = None):
+        self.rect = rect
+        self.label = label
+        self.text = text
+
+
+class PageSegmentation:
+    def __init__(self, header: Optional[LotSegment], lots: List[LotSegment]):
+        self.header = header
+        self.lots = lots
+
+
+def _format_lines(lines) -> str:
+    return "\n".join(f"[{int(x0)},{int(y0)}] {text}" for x0, y0, text in lines)
+
+
+def segment_text_layer(page) -> Optional[PageSegmentation]:
+    """
+    Split a born-digital page into lot sections using lot-header lines.
+    Headers on the same row (side-by-side lots) split that row into columns.
+    """
+    lines = []
+    for block in page.get_text("dict")["blocks"]:
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                x0, y0, x1, y1 = line["bbox"]
+                lines.append((x0, y0, x1, y1, text))
+
+    headers = sorted(
+        ((y0, x0, LOT_HEADER.match(text).group(1)) for x0, y0, x1, y1, text in lines if LOT_HEADER.match(text)),
+    )
+    if not (SEGMENT_MIN_LOTS <= len(headers) <= SEGMENT_MAX_LOTS):
+        return None
+
+    # Group header lines into rows
+    rows = []
+    for y0, x0, label in headers:
+        if rows and abs(rows[-1][0][0] - y0) <= _ROW_TOLERANCE:
+            rows[-1].append((y0, x0, label))
+        else:
+            rows.append([(y0, x0, label)])
+
+    width, height = page.rect.width, page.rect.height
+    segments = []
+    for r, row in enumerate(rows):
+        top = min(y0 for y0, _, _ in row)
+        bottom = min(y0 for y0, _, _ in rows[r + 1]) if r + 1 < len(rows) else height
+        row = sorted(row, key=lambda h: h[1])
+        for c, (_, x0, label) in enumerate(row):
+            left = 0.0 if c == 0 else x0
+            right = row[c + 1][1] if c + 1 < len(row) else width
+            segments.append(LotSegment((left, top, right, bottom), label=label))
+
+    def lines_in(rect):
+        left, top, right, bottom = rect
+        picked = []
+        for x0, y0, x1, y1, text in lines:
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+            if left <= cx < right and top - 1 <= cy < bottom:
+                picked.append((x0, y0, text))
+        return sorted(picked, key=lambda l: (round(l[1]), l[0]))
+
+    for segment in segments:
+        segment.text = _format_lines(lines_in(segment.rect))
+
+    header = None
+    first_top = min(s.rect[1] for s in segments)
+    header_lines = sorted(
+        ((x0, y0, text) for x0, y0, x1, y1, text in lines if (y0 + y1) / 2 < first_top - 1),
+        key=lambda l: (round(l[1]), l[0]),
+    )
+    if header_lines:
+        header = LotSegment((0.0, 0.0, width, first_top), text=_format_lines(header_lines))
+
+    return PageSegmentation(header, segments)
+
+
+def page_lot_headers(page) -> int:
+    """Lot-header lines in a page's own text, e.g. the OCR layer of a scanned PDF."""
+    return sum(1 for line in page.get_text().splitlines() if LOT_HEADER.match(line))
+
+
+def segment_raster(img: Image.Image, lot_headers: int = 0) -> Optional[PageSegmentation]:
+    """
+    Whitespace analysis for scans: collapse the page to one column of mean row
+    intensities and cut at the widest blank horizontal gaps. A short band at
+    the top is kept as the page header.
+
+    Blank gaps alone also separate the parts of a single lot's form, so this
+    only runs on pages known to hold several lots (lot_headers, counted from
+    the page's text) and gives up when it finds more sections than that.
+    """
+    if not (SEGMENT_MIN_LOTS <= lot_headers <= SEGMENT_MAX_LOTS):
+        return None
+
+    gray = img.convert("L")
+    height = gray.height
+    # Mean intensity per row in a single resize; ~255 means a blank row
+    profile = list(gray.resize((1, height), Image.BOX).getdata())
+
+    min_gap = max(4, int(height * 0.015))
+    gaps = []
+    start = None
+    for y, value in enumerate(profile + [0]):
+        if value >= 250:
+            if start is None:
+                start = y
+        elif start is not None:
+            if y - start >= min_gap and start > 0 and y < height:
+                gaps.append((start, y))
+            start = None
+
+    if not gaps:
+        return None
+
+    # Only gaps comparable to the widest ones separate sections; paragraph
+    # spacing inside a section stays put. The single widest gap is ignored as
+    # a reference so one huge blank area does not hide the others.
+    widths = sorted(end - begin for begin, end in gaps)
+    reference = widths[-2] if len(widths) > 1 else widths[-1]
+    cutoff = max(min_gap, int(reference * 0.6))
+    cuts = [(begin + end) // 2 for begin, end in gaps if end - begin >= cutoff]
+
+    bounds = [0] + cuts + [height]
+    bands = [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i + 1] - bounds[i] > min_gap]
+
+    header = None
+    if len(bands) > SEGMENT_MIN_LOTS and bands[0][1] - bands[0][0] < height * 0.15:
+        top, bottom = bands.pop(0)
+        header = LotSegment((0, top, gray.width, bottom))
+
+    if not (SEGMENT_MIN_LOTS <= len(bands) <= lot_headers):
+        return None
+
+    return PageSegmentation(header, [LotSegment((0, top, gray.width, bottom)) for top, bottom in bands])
+
+
+def lot_text_content(segmentation: PageSegmentation, segment: LotSegment, page_number: int):
+    parts = []
+    if segmentation.header is not None:
+        parts.append(f"--- PAGE {page_number} HEADER (global context) ---\n{segmentation.header.text}")
+    parts.append(f"--- LOT SECTION ---\n{segment.text}")
+    return {"type": "text", "text": "\n\n".join(parts)}
@@ -0,0 +1,108 @@
+import math
+import hashlib
+import statistics
+from operator import mul
+from typing import List, Optional
+from PIL import Image, ImageFilter, ImageOps
+from app.domain.schemas import DocumentExtraction, ExtractionResult, NearDuplicateMatch
+from app.infrastructure import metrics
+
+# The page is shrunk to _SAMPLE x _SAMPLE and the lowest _KEEP x _KEEP DCT
+# coefficients give the 256 hash bits.
+_SAMPLE = 64
+_NORMALIZED = _SAMPLE * 4
+_KEEP = 16
+_COS = [
+    [math.cos(math.pi * (2 * x + 1) * u / (2 * _SAMPLE)) for x in range(_SAMPLE)]
+    for u in range(_KEEP)
+]
+
+
+def perceptual_hash(img: Image.Image) -> int:
+    """
+    256-bit DCT hash (pHash) of a page image.
+
+    Blur, autocontrast and the coarse 64x64 grid absorb what changes between
+    two scans of the same paper (brightness, DPI, JPEG noise, a few pixels of
+    shift); 256 bits rather than the usual 64 keep same-template forms that
+    differ only in their handwritten entries apart.
+    """
+    # Shrink before converting so no full-size copy is made
+    factor = max(1, min(img.size) // _NORMALIZED)
+    if factor > 1 and img.mode in ("L", "RGB", "RGBA"):
+        img = img.reduce(factor)
+    # Fixed-size, blurred intermediate: a 72 DPI render and a 300 DPI scan of
+    # the same page hash alike once thin strokes are smoothed out
+    img = img.convert("L").resize((_NORMALIZED, _NORMALIZED), Image.BOX).filter(ImageFilter.GaussianBlur(2))
+    small = ImageOps.autocontrast(img.resize((_SAMPLE, _SAMPLE), Image.BOX))
+
+    pixels = small.tobytes()
+    # Separable 2-D DCT-II, low-frequency corner only: rows, then columns
+    rows = [[sum(map(mul, basis, pixels[y * _SAMPLE:(y + 1) * _SAMPLE])) for basis in _COS] for y in range(_SAMPLE)]
+    columns = list(zip(*rows))
+    coefficients = [sum(map(mul, basis, column)) for basis in _COS for column in columns]
+
+    # The DC term is the mean brightness; leave it out of the median
+    median = statistics.median(coefficients[1:])
+    fingerprint = 0
+    for c in coefficients:
+        fingerprint = (fingerprint << 1) | (c > median)
+    return fingerprint
+
+
+def text_hash(text: str) -> int:
+    """Text-layer pages: a 256-bit content hash, so only identical text matches."""
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest(), "big")
+
+
+class PageReuse:
+    """
+    One document's view of the near-duplicate index.
+
+    Pages whose fingerprint is within the index's max distance of a page
+    extracted before (same provider, model, prompt and pipeline settings)
+    reuse that page's result from the extraction cache instead of calling
+    the provider. Page results live in the cache under their own keys, so
+    they expire with it; an index entry whose result is gone is dropped.
+    """
+
+    def __init__(self, index, cache, namespace: str, lookup: bool = True):
+        self.index = index
+        self.cache = cache
+        self.namespace = namespace
+        # False on refresh: extract every page, but still index the results
+        self.lookup = lookup
+        self.matches: List[NearDuplicateMatch] = []
+
+    def image_fingerprint(self, img: Image.Image) -> int:
+        with metrics.stage("phash"):
+            return perceptual_hash(img)
+
+    def text_fingerprint(self, layout: str) -> int:
+        return text_hash(layout)
+
+    def reuse(self, fingerprint: int, page_number: Optional[int]) -> Optional[DocumentExtraction]:
+        if not self.lookup:
+            return None
+
+        with metrics.stage("near_dup_lookup"):
+            match = self.index.lookup(self.namespace, fingerprint)
+        if match is None:
+            metrics.record_near_duplicate("miss")
+            return None
+
+        matched, key, distance = match
+        previous = self.cache.get(key)
+        if previous is None:
+            self.index.discard(self.namespace, matched)
+            metrics.record_near_duplicate("expired")
+            return None
+
+        metrics.record_near_duplicate("hit")
+        self.matches.append(NearDuplicateMatch(page=page_number, distance=distance))
+        return DocumentExtraction(plots=previous.plots)
+
+    def remember(self, fingerprint: int, extraction: DocumentExtraction):
+        key = f"page:{fingerprint:064x}:{self.namespace}"
+        self.cache.set(key, ExtractionResult(plots=extraction.plots))
+        self.index.add(self.namespace, fingerprint, key)
@@ -0,0 +1,111 @@
+import math
+from typing import Dict, Optional
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+from app.domain.schemas import PageTier
+from app.infrastructure import metrics, model_tiers
+from app.services.lot_segmentation import LOT_HEADER
+
+# Pages are measured at no more than this edge (pixels); larger ones are
+# reduced, which blurs the thinnest strokes, so it stays close to native
+_SAMPLE_EDGE = 2048
+# Gray levels: below _DARK is solid ink, up to _LIGHT gray ink, above is paper
+_DARK = 96
+_LIGHT = 200
+# A pixel this far from its 3x3 median is speckle (scan noise, pen texture)
+_SPECKLE_LEVEL = 64
+# Mean saturation above which a page has colour content (photo, coloured ink)
+_COLOUR_SATURATION = 24
+
+
+def _clip(value: float) -> float:
+    return max(0.0, min(1.0, value))
+
+
+def _lots_score(lots_per_call: int) -> float:
+    # Every lot beyond the first in one call adds work, up to 3 more
+    return 0.1 * min(3, max(0, lots_per_call - 1))
+
+
+def _tier(page: Optional[int], score: float, signals: Dict[str, float]) -> Optional[PageTier]:
+    tier = model_tiers.tier_for(score)
+    if tier is None:
+        return None
+    return PageTier(page=page, tier=tier, score=round(score, 3), signals=signals)
+
+
+def text_page_tier(layout: str, sections: int, page: Optional[int]) -> Optional[PageTier]:
+    """
+    Text-layer page: typed by definition, so the score is how many lots and
+    how much text (a dense page of notes) each of its lot sections (1: sent
+    whole) has to read.
+    """
+    if not model_tiers.enabled():
+        return None
+    calls = max(1, sections)
+    # Layout lines are "[x,y] text"
+    lots = max(1, sum(1 for line in layout.splitlines() if LOT_HEADER.match(line.split("] ", 1)[-1])))
+    chars = len(layout)
+    score = _lots_score(math.ceil(lots / calls)) + 0.2 * _clip((chars / calls - 1500) / 3000)
+    signals = {"text_layer": 1.0, "lots": float(lots), "calls": float(calls), "chars": float(chars)}
+    return _tier(page, score, signals)
+
+
+def image_page_tier(img: Image.Image, calls: int, page: Optional[int]) -> Optional[PageTier]:
+    """
+    Raster page (scan, photo, image upload), from cheap pixel statistics:
+
+    - ink: share of non-paper pixels; dense pages carry more per lot
+    - faint: share of ink that is gray with no solid ink next to it
+      (pencil, light handwriting, washed-out scans); anti-aliased print
+      always has a dark core
+    - speckle: pixels far from their 3x3 median (scan noise, pen texture)
+    - colour photos and low-resolution images (under 1 MP) add a little
+
+    Lot sections found on the page are sent as separate calls (calls), so
+    they do not add to the score. A clean typed scan stays under
+    MODEL_TIER_FAST_MAX.
+    """
+    if not model_tiers.enabled():
+        return None
+
+    with metrics.stage("complexity"):
+        megapixels = img.width * img.height / 1e6
+        # Shrink before converting so no full-size copy is made
+        factor = math.ceil(max(img.size) / _SAMPLE_EDGE)
+        sample = img.reduce(factor) if factor > 1 and img.mode in ("L", "RGB", "RGBA") else img
+        colour = False
+        if sample.mode not in ("L", "1", "LA"):
+            saturation = sample.convert("RGB").convert("HSV").getchannel("S")
+            colour = ImageStat.Stat(saturation).mean[0] > _COLOUR_SATURATION
+        sample = sample.convert("L")
+        pixels = max(1, sample.width * sample.height)
+
+        histogram = sample.histogram()
+        ink_pixels = sum(histogram[:_LIGHT])
+        ink = ink_pixels / pixels
+
+        gray = sample.point(lambda v: 255 if _DARK <= v < _LIGHT else 0)
+        no_dark_neighbour = sample.filter(ImageFilter.MinFilter(3)).point(lambda v: 255 if v >= _DARK else 0)
+        faint = ImageChops.multiply(gray, no_dark_neighbour).histogram()[255] / max(1, ink_pixels)
+
+        deviation = ImageChops.difference(sample, sample.filter(ImageFilter.MedianFilter(3)))
+        speckle = sum(deviation.histogram()[_SPECKLE_LEVEL:]) / pixels
+
+    score = (
+        0.15
+        + 0.3 * _clip((ink - 0.005) / 0.03)
+        + 0.4 * _clip((faint - 0.2) / 0.5)
+        + 0.2 * _clip(speckle / 0.02)
+        + (0.1 if colour else 0.0)
+        + (0.1 if megapixels < 1.0 else 0.0)
+    )
+    signals = {
+        "text_layer": 0.0,
+        "calls": float(calls),
+        "megapixels": round(megapixels, 2),
+        "ink": round(ink, 4),
+        "faint": round(faint, 4),
+        "speckle": round(speckle, 4),
+        "colour": float(colour),
+    }
+    return _tier(page, _clip(score), signals)
@@ -0,0 +1,102 @@
+from typing import List, Optional, Tuple
+from app.domain.schemas import DocumentExtraction, PlotData
+
+
+def parse_page_range(spec: Optional[str], page_count: int) -> List[int]:
+    """
+    Turn a 1-based page spec like "1-3,5" into sorted 0-based page indexes.
+    None / "" / "all" selects every page.
+    """
+    if not spec or spec.strip().lower() == "all":
+        return list(range(page_count))
+
+    selected = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+
+        try:
+            if "-" in part:
+                start_str, end_str = part.split("-", 1)
+                start = int(start_str) if start_str.strip() else 1
+                end = int(end_str) if end_str.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range: '{spec}'")
+
+        if start < 1 or end < start:
+            raise ValueError(f"Invalid page range: '{spec}'")
+
+        selected.update(range(start - 1, min(end, page_count)))
+
+    if not selected:
+        raise ValueError(f"Page range '{spec}' selects no pages (document has {page_count}).")
+
+    return sorted(selected)
+
+
+def _lot_key(plot: PlotData):
+    if not plot.lot_no:
+        return None
+    return (plot.lot_no.strip().lower(), (plot.block or "").strip().lower())
+
+
+def _absorb(target: PlotData, other: PlotData):
+    """Fill target's empty fields from other; notes from both sides are kept."""
+    for field in PlotData.model_fields:
+        if field == "optional_notes":
+            continue
+        if not getattr(target, field) and getattr(other, field):
+            setattr(target, field, getattr(other, field))
+
+    if other.optional_notes and other.optional_notes != target.optional_notes:
+        if target.optional_notes:
+            target.optional_notes = f"{target.optional_notes}; {other.optional_notes}"
+        else:
+            target.optional_notes = other.optional_notes
+
+
+def merge_page_extractions(pages: List[DocumentExtraction]) -> DocumentExtraction:
+    """
+    Combine per-page results (in page order) into one DocumentExtraction.
+
+    Only a lot block that ran over a page break is folded together: when a
+    page's first plot has no lot_no, or the same lot_no/block as the
+    previous page's last plot, it is merged into that plot. Lots elsewhere
+    that share a number are kept apart (another phase of the community).
+    """
+    return merge_numbered_pages(pages)[0]
+
+
+def merge_numbered_pages(pages: List[DocumentExtraction], page_numbers: Optional[List[int]] = None
+                         ) -> Tuple[DocumentExtraction, List[Optional[int]]]:
+    """
+    merge_page_extractions, plus the page each merged plot starts on.
+    With page_numbers, a page is only a continuation when it directly
+    follows the previous one: after a failed or unselected page, the lot it
+    continues is unknown.
+    """
+    merged: List[PlotData] = []
+    plot_pages: List[Optional[int]] = []
+    # Last plot of the previous page, which a lot may continue from
+    previous: Optional[PlotData] = None
+
+    for n, page in enumerate(pages):
+        adjacent = not page_numbers or (n > 0 and page_numbers[n] == page_numbers[n - 1] + 1)
+        last = None
+        for i, plot in enumerate(page.plots):
+            if i == 0 and previous is not None and adjacent:
+                key = _lot_key(plot)
+                if key is None or key == _lot_key(previous):
+                    _absorb(previous, plot)
+                    last = previous
+                    continue
+
+            last = plot = plot.model_copy()
+            merged.append(plot)
+            plot_pages.append(page_numbers[n] if page_numbers else None)
+        previous = last
+
+    return DocumentExtraction(plots=merged), plot_pages
@@ -0,0 +1,190 @@
+import os
+import math
+from typing import NamedTuple, Optional, Tuple
+from PIL import Image
+from app.infrastructure import metrics
+from app.services.image_payload import PayloadShaper, pixmap_image
+
+# auto: chosen per page (see plan_render) | a number: fixed DPI (72 renders like get_pixmap())
+RENDER_DPI = os.getenv("RENDER_DPI", "auto").strip().lower()
+if RENDER_DPI != "auto":
+    try:
+        if not 0 < float(RENDER_DPI) < math.inf:
+            raise ValueError(RENDER_DPI)
+    except ValueError:
+        print(f"Invalid RENDER_DPI '{RENDER_DPI}'; using auto")
+        RENDER_DPI = "auto"
+# DPI of a page with ordinary content at quality=standard
+RENDER_BASE_DPI = float(os.getenv("RENDER_BASE_DPI", "110"))
+RENDER_MIN_DPI = float(os.getenv("RENDER_MIN_DPI", "72"))
+RENDER_MAX_DPI = float(os.getenv("RENDER_MAX_DPI", "300"))
+# Upper bound on a rendered page, whatever the DPI
+RENDER_MAX_MEGAPIXELS = float(os.getenv("RENDER_MAX_MEGAPIXELS", "12"))
+# Smallest text on the page gets at least this many pixels of font size
+RENDER_MIN_GLYPH_PX = float(os.getenv("RENDER_MIN_GLYPH_PX", "14"))
+# Crop to the content bounding box, keeping this much margin (points)
+RENDER_TRIM = os.getenv("RENDER_TRIM", "true").lower() in ("1", "true", "yes")
+RENDER_TRIM_MARGIN = float(os.getenv("RENDER_TRIM_MARGIN", "12"))
+# auto: gray pixmaps for pages without colour content | always | never
+RENDER_GRAYSCALE = os.getenv("RENDER_GRAYSCALE", "auto").strip().lower()
+RENDER_GRAYSCALE = {"true": "always", "1": "always", "false": "never", "0": "never"}.get(
+    RENDER_GRAYSCALE, RENDER_GRAYSCALE
+)
+if RENDER_GRAYSCALE not in ("auto", "always", "never"):
+    print(f"Unknown RENDER_GRAYSCALE '{RENDER_GRAYSCALE}'; using auto")
+    RENDER_GRAYSCALE = "auto"
+
+# Per-request quality level -> DPI factor
+QUALITY_LEVELS = {"low": 0.6, "standard": 1.0, "high": 1.6}
+
+# Preview used to find the content box and colour
+_PREVIEW_DPI = 24
+# Preview pixels darker than this are content
+_INK_LEVEL = 235
+# Scans cover at least this share of the page
+_SCAN_COVERAGE = 0.5
+
+Rect = Tuple[float, float, float, float]
+
+
+def parse_quality(value: Optional[str]) -> str:
+    quality = (value or "standard").strip().lower()
+    if quality not in QUALITY_LEVELS:
+        raise ValueError(f"Unknown quality '{value}'. Choose from: {', '.join(QUALITY_LEVELS)}")
+    return quality
+
+
+class RenderPlan(NamedTuple):
+    clip: Rect
+    dpi: float
+    gray: bool
+
+
+class PageRaster(NamedTuple):
+    # image is a zero-copy view over pix: keep the PageRaster alive while it is used.
+    # pix comes first so the view is released before the pixmap (tuples free last to first).
+    pix: object
+    image: Image.Image
+    # Rendered part of the page (points) and its resolution
+    clip: Rect
+    dpi: float
+
+    @property
+    def source_bytes(self) -> int:
+        return self.pix.stride * self.pix.height
+
+    def page_rect(self, rect: Optional[Rect] = None) -> Rect:
+        """An image-pixel rect in page points; None is the whole rendered clip."""
+        if rect is None:
+            return self.clip
+        scale = 72.0 / self.dpi
+        x0, y0 = self.clip[0], self.clip[1]
+        return (x0 + rect[0] * scale, y0 + rect[1] * scale, x0 + rect[2] * scale, y0 + rect[3] * scale)
+
+
+def _content_box(preview: Image.Image, page_rect) -> Optional[Rect]:
+    """Bounding box (points) of non-background preview pixels, with the trim margin."""
+    ink = preview.convert("L").point(lambda v: 255 if v < _INK_LEVEL else 0)
+    box = ink.getbbox()
+    if box is None:
+        return None
+    scale = 72.0 / _PREVIEW_DPI
+    margin = RENDER_TRIM_MARGIN
+    return (
+        max(page_rect.x0, page_rect.x0 + box[0] * scale - margin),
+        max(page_rect.y0, page_rect.y0 + box[1] * scale - margin),
+        min(page_rect.x1, page_rect.x0 + box[2] * scale + margin),
+        min(page_rect.y1, page_rect.y0 + box[3] * scale + margin),
+    )
+
+
+def _scan_dpi(page) -> Optional[float]:
+    """Native resolution of the image a scanned page is made of; rendering above it only upsamples."""
+    page_area = abs(page.rect)
+    best = None
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        if (x1 - x0) * (y1 - y0) < _SCAN_COVERAGE * page_area or x1 <= x0:
+            continue
+        dpi = info["width"] / ((x1 - x0) / 72.0)
+        best = dpi if best is None else max(best, dpi)
+    return best
+
+
+def _smallest_text(page) -> Optional[float]:
+    sizes = [
+        span["size"]
+        for block in page.get_text("dict")["blocks"]
+        for line in block.get("lines", ())
+        for span in line["spans"]
+        if span["text"].strip()
+    ]
+    return min(sizes) if sizes else None
+
+
+def plan_render(page, shaper: PayloadShaper, quality: str = "standard") -> RenderPlan:
+    """
+    Clip, DPI and colorspace for one page.
+
+    A 24 DPI preview gives the content bounding box (margins are cut,
+    scans included) and whether the page has colour. DPI starts at
+    RENDER_BASE_DPI times the quality factor, goes up until the smallest
+    text is RENDER_MIN_GLYPH_PX tall (small print, notes), never exceeds the
+    native resolution of a scanned page, and is held within
+    RENDER_MIN/MAX_DPI and RENDER_MAX_MEGAPIXELS.
+    """
+    import pymupdf
+
+    rect = page.rect
+    clip = (rect.x0, rect.y0, rect.x1, rect.y1)
+    preview = None
+    if RENDER_TRIM or RENDER_GRAYSCALE == "auto":
+        pix = page.get_pixmap(dpi=_PREVIEW_DPI, colorspace=pymupdf.csRGB, alpha=False)
+        preview = pixmap_image(pix).copy()
+        if RENDER_TRIM:
+            clip = _content_box(preview, rect) or clip
+
+    if RENDER_GRAYSCALE == "always":
+        gray = True
+    elif RENDER_GRAYSCALE == "never":
+        gray = False
+    elif shaper.color_mode != "auto":
+        gray = shaper.color_mode != "rgb"
+    else:
+        gray = shaper._detect_color_mode(preview) != "rgb"
+
+    factor = QUALITY_LEVELS[quality]
+    if RENDER_DPI != "auto":
+        dpi = float(RENDER_DPI) * factor
+    else:
+        dpi = RENDER_BASE_DPI * factor
+        smallest = _smallest_text(page)
+        if smallest:
+            dpi = max(dpi, RENDER_MIN_GLYPH_PX * 72.0 / smallest * factor)
+        native = _scan_dpi(page)
+        if native:
+            dpi = min(dpi, native)
+
+    width_in, height_in = (clip[2] - clip[0]) / 72.0, (clip[3] - clip[1]) / 72.0
+    if width_in > 0 and height_in > 0:
+        dpi = min(dpi, (RENDER_MAX_MEGAPIXELS * 1e6 / (width_in * height_in)) ** 0.5)
+    dpi = max(RENDER_MIN_DPI, min(RENDER_MAX_DPI, dpi))
+    return RenderPlan(clip, dpi, gray)
+
+
+def render_page(page, shaper: PayloadShaper, quality: str = "standard") -> PageRaster:
+    import pymupdf
+
+    with metrics.stage("render_plan"):
+        plan = plan_render(page, shaper, quality)
+    with metrics.stage("rasterize"):
+        scale = plan.dpi / 72.0
+        pix = page.get_pixmap(
+            matrix=pymupdf.Matrix(scale, scale),
+            clip=pymupdf.Rect(plan.clip),
+            colorspace=pymupdf.csGRAY if plan.gray else pymupdf.csRGB,
+            alpha=False,
+        )
+    with metrics.stage("pil_convert"):
+        img = pixmap_image(pix)
+    return PageRaster(pix, img, plan.clip, plan.dpi)
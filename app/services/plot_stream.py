@@ -0,0 +1,188 @@
+import json
+import asyncio
+from contextlib import aclosing
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+from app.domain.schemas import DocumentExtraction, ExtractionResult, PlotData
+
+
+class PlotStreamParser:
+    """
+    Incremental parser for a DocumentExtraction JSON text that arrives in
+    chunks ({"plots": [{...}, {...}], ...}).
+
+    feed() returns the plot objects (dicts) the chunk completed. Text
+    before the first "{" (a ```json fence) and after the closing "}" is
+    ignored. result() parses the whole text.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+        self._done = False
+
+        self._expect_key = False
+        self._string_start = None
+        self._key = None
+        self._plot_start = None
+
+    def feed(self, chunk: str) -> list:
+        plots = []
+        self.text += chunk
+        text = self.text
+
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._done:
+                break
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._key = json.loads(text[self._string_start:i + 1])
+                continue
+
+            if not self._started:
+                if c == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._expect_key = True
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":" and self._depth == 1:
+                self._expect_key = False
+            elif c == "," and self._depth == 1:
+                self._expect_key = True
+            elif c in "{[":
+                if self._depth == 2 and self._key == "plots" and c == "{":
+                    self._plot_start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 2 and self._key == "plots" and c == "}" and self._plot_start is not None:
+                    plots.append(json.loads(text[self._plot_start:i + 1]))
+                    self._plot_start = None
+                elif self._depth == 0:
+                    self._done = True
+
+        self._pos = len(text)
+        return plots
+
+    def result(self) -> DocumentExtraction:
+        if not self._started:
+            raise ValueError("Model returned no JSON object")
+        start = self.text.index("{")
+        end = self.text.rindex("}") + 1
+        return DocumentExtraction.model_validate_json(self.text[start:end])
+
+
+class PlotStream:
+    """
+    Server-sent events of one streamed extraction, fed from inside the
+    pipeline: ("plot", {"page", "plot"}) as lots complete, then
+    ("done", ExtractionResult) or ("error", detail).
+    Plots are sent as extracted per page; the "done" result is the merged
+    document (lots split over a page break folded together).
+    """
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.plots_sent = 0
+
+    def send_plot(self, plot: PlotData, page: Optional[int]):
+        self.plots_sent += 1
+        self.queue.put_nowait(("plot", {"page": page, "plot": plot.model_dump()}))
+
+    def send_extraction(self, extraction: DocumentExtraction, page: Optional[int]):
+        """A unit whose result came whole (rules, near-duplicate, non-streaming provider)."""
+        for plot in extraction.plots:
+            self.send_plot(plot, page)
+
+    async def events(self, task: asyncio.Task):
+        """Yields events until the extraction task ends; cancels it if the consumer goes away."""
+        try:
+            while True:
+                getter = asyncio.ensure_future(self.queue.get())
+                await asyncio.wait([getter, task], return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                    continue
+                getter.cancel()
+                break
+
+            while not self.queue.empty():
+                yield self.queue.get_nowait()
+
+            try:
+                result: ExtractionResult = task.result()
+            except Exception as e:
+                yield ("error", {"detail": str(e)})
+                return
+
+            if not self.plots_sent:
+                # Served from the cache: nothing was streamed
+                self.send_extraction(result, None)
+                while not self.queue.empty():
+                    yield self.queue.get_nowait()
+            yield ("done", result.model_dump())
+        finally:
+            if not task.done():
+                task.cancel()
+                # Let it unwind before the caller closes the upload it reads
+                await asyncio.gather(task, return_exceptions=True)
+
+
+class _PageStream:
+    """PlotStream as seen by one page's task."""
+
+    def __init__(self, stream: PlotStream, page: Optional[int]):
+        self.stream = stream
+        self.page = page
+
+    def send_plot(self, plot: PlotData):
+        self.stream.send_plot(plot, self.page)
+
+    def send_extraction(self, extraction: DocumentExtraction):
+        self.stream.send_extraction(extraction, self.page)
+
+
+# Set around a streamed extraction; tasks created inside it (pages) inherit it
+_current: ContextVar[Optional[_PageStream]] = ContextVar("plot_stream", default=None)
+
+
+def begin(stream: PlotStream):
+    return _current.set(_PageStream(stream, None))
+
+
+def end(token):
+    _current.reset(token)
+
+
+def for_page(page: Optional[int]):
+    """Called at the start of a page's task: later events carry its page number."""
+    current = _current.get()
+    if current is not None:
+        _current.set(_PageStream(current.stream, page))
+
+
+def current() -> Optional[_PageStream]:
+    return _current.get()
+
+
+async def sse(events: AsyncIterator[tuple]) -> AsyncIterator[str]:
+    """Server-sent event frames for PlotStream events."""
+    async with aclosing(events):
+        async for kind, data in events:
+            yield f"event: {kind}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,404 @@
+import io
+import os
+import time
+import signal
+import asyncio
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import List, Optional, Tuple
+from PIL import Image, ImageOps
+from app.domain.schemas import PayloadStats
+from app.infrastructure import metrics
+from app.services.image_payload import PayloadShaper
+from app.services.page_raster import PageRaster, render_page
+from app.services.near_duplicates import perceptual_hash
+from app.services.page_complexity import image_page_tier
+from app.services.lot_segmentation import LOT_SECTION_PROMPT, page_lot_headers, segment_raster
+
+# Processes that rasterize / encode pages: 0 keeps it in threads, "auto" is one per
+# core but one (left to the event loop and provider calls), and threads below 2 of them.
+# Created once per API worker, so with several uvicorn workers size it per worker.
+RENDER_PROCESSES = os.getenv("RENDER_PROCESSES", "auto").strip().lower()
+# spawn is safe in a threaded parent; forkserver starts faster where available. Either
+# re-imports the main module, so scripts turning the pool on need an `if __name__ == "__main__"` guard.
+RENDER_START_METHOD = os.getenv("RENDER_START_METHOD", "spawn")
+
+# Content block standing in for an encoded image parked in shared memory
+_SHM_IMAGE = "shm_image"
+
+# Shared (source) reference handed to pool processes: ("path" | "shm", name, size)
+SharedSource = Tuple[str, str, int]
+
+
+def image_units(img: Image.Image, source_bytes: int, page_number: Optional[int], payload_stats: List[PayloadStats],
+                shaper: PayloadShaper, segmentation: str, regions: Optional[list] = None,
+                raster: Optional[PageRaster] = None, lot_headers: int = 0):
+    """
+    Provider call units for one raster page: the whole page, or a header
+    crop plus one crop per lot section when whitespace analysis finds them
+    (only tried on pages whose text names lot_headers lots).
+    regions, when given, receives each unit's rect: in image pixels (None
+    for the whole image), or in page points for a rendered PDF page (raster).
+    """
+    if regions is None:
+        regions = []
+    if raster is not None:
+        first_region, first_stats = len(regions), len(payload_stats)
+        units = image_units(img, source_bytes, page_number, payload_stats, shaper, segmentation, regions,
+                            lot_headers=lot_headers)
+        regions[first_region:] = [raster.page_rect(rect) for rect in regions[first_region:]]
+        for stats in payload_stats[first_stats:]:
+            stats.dpi = round(raster.dpi)
+        return units
+
+    sections = None
+    if segmentation == "auto" and lot_headers:
+        with metrics.stage("segment"):
+            sections = segment_raster(img, lot_headers)
+
+    if sections is None:
+        content, stats = shaper.shape(img, source_bytes, page=page_number)
+        payload_stats.append(stats)
+        regions.append(None)
+        return [([content], None)]
+
+    def shaped_crop(rect):
+        crop = img.crop(tuple(int(v) for v in rect))
+        content, stats = shaper.shape(
+            crop, crop.width * crop.height * len(crop.getbands()), page=page_number
+        )
+        payload_stats.append(stats)
+        return content
+
+    header_parts = []
+    if sections.header is not None:
+        header_parts = [
+            {"type": "text", "text": "PAGE HEADER (global context):"},
+            shaped_crop(sections.header.rect),
+        ]
+
+    regions.extend(lot.rect for lot in sections.lots)
+    return [
+        (header_parts + [{"type": "text", "text": "LOT SECTION:"}, shaped_crop(lot.rect)], LOT_SECTION_PROMPT)
+        for lot in sections.lots
+    ]
+
+
+def _image_blocks(units):
+    for parts, _ in units:
+        for i, part in enumerate(parts):
+            if part.get("type") == _SHM_IMAGE:
+                yield parts, i, part
+
+
+def _unlink(name: str):
+    try:
+        block = SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+# ---------------- pool processes ----------------
+
+class _SharedMemoryShaper(PayloadShaper):
+    """Leaves each encoded image in a shared memory block; the parent base64-encodes it from there."""
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.blocks: List[str] = []
+
+    def _content(self, data, fmt: str):
+        block = SharedMemory(create=True, size=max(1, len(data)))
+        try:
+            block.buf[:len(data)] = data
+            self.blocks.append(block.name)
+        finally:
+            block.close()
+        return {"type": _SHM_IMAGE, "shm": self.blocks[-1], "size": len(data), "format": fmt}
+
+
+_worker_settings = {}
+
+
+def _init_worker(shaper_settings: dict, segmentation: str):
+    # Ctrl-C reaches the whole process group; the parent shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    metrics.collect_stages_only()
+    _worker_settings.update(shaper=shaper_settings, segmentation=segmentation)
+    import pymupdf  # noqa: F401  loaded once per process, not on the first page
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+@contextmanager
+def _opened(shared: SharedSource, page_index: Optional[int]):
+    """The page's document (PDF) or image, opened from the spool file or the shared block."""
+    kind, name, size = shared
+    block = SharedMemory(name=name) if kind == "shm" else None
+    view = block.buf[:size] if block is not None else None
+    try:
+        if page_index is not None:
+            import pymupdf
+            doc = pymupdf.open(name, filetype="pdf") if view is None else pymupdf.open(stream=view, filetype="pdf")
+            try:
+                yield doc
+            finally:
+                doc.close()
+        else:
+            img = Image.open(name if view is None else io.BytesIO(view))
+            try:
+                yield img
+            finally:
+                img.close()
+    finally:
+        if block is not None:
+            # MuPDF must let go of the buffer before the block can be closed
+            view.release()
+            block.close()
+
+
+def _render(shared: SharedSource, page_index: Optional[int], fingerprint: bool, quality: str):
+    """
+    Pool task: rasterize (or decode) one page, then segment, shape and encode
+    it. Returns (start time, units, payload stats, fingerprint, unit regions,
+    page tier, stage seconds); images in units are shared memory blocks the
+    caller attaches and unlinks.
+    """
+    started = time.time()
+    # Stages are timed here and merged into the request's timer by the parent
+    timer = metrics.begin_request("")
+    shaper = _SharedMemoryShaper(**_worker_settings["shaper"])
+    page_number = page_index + 1 if page_index is not None else None
+    payload_stats: List[PayloadStats] = []
+    regions = []
+
+    try:
+        with _opened(shared, page_index) as opened:
+            raster = None
+            lot_headers = 0
+            if page_index is not None:
+                page = opened.load_page(page_index)
+                if _worker_settings["segmentation"] == "auto":
+                    lot_headers = page_lot_headers(page)
+                raster = render_page(page, shaper, quality)
+                del page
+                img, source_bytes = raster.image, raster.source_bytes
+            else:
+                with metrics.stage("image_decode"):
+                    opened.load()
+                    ImageOps.exif_transpose(opened, in_place=True)
+                img = opened
+                source_bytes = shared[2]
+
+            page_fingerprint = None
+            if fingerprint:
+                with metrics.stage("phash"):
+                    page_fingerprint = perceptual_hash(img)
+
+            units = image_units(
+                img, source_bytes, page_number, payload_stats, shaper, _worker_settings["segmentation"], regions, raster,
+                lot_headers,
+            )
+            tier = image_page_tier(img, len(units), page_number)
+            del img, raster
+    except BaseException:
+        for name in shaper.blocks:
+            _unlink(name)
+        raise
+
+    return started, units, payload_stats, page_fingerprint, regions, tier, dict(timer.durations)
+
+
+# ---------------- parent side ----------------
+
+class RenderPool:
+    """
+    Process pool for the CPU-bound part of scanned pages: rasterizing,
+    segmentation, resizing and JPEG/PNG encoding.
+
+    In threads these hold the GIL for much of their runtime, so pages of
+    concurrent requests queue behind each other on one core; a pool process
+    per core renders them in parallel. Nothing image-sized is pickled: pool
+    processes open the page from the spool file (or from one shared memory
+    copy of an in-memory document) and leave each encoded image in a shared
+    memory block, which the parent base64-encodes and unlinks.
+    Time a page waits for a free process is recorded as the pool_wait stage
+    and in render_pool_wait_seconds. A crashed process (MuPDF on a hostile
+    file) fails that page and the pool is rebuilt.
+    """
+
+    def __init__(self, processes: int, shaper: PayloadShaper, segmentation: str,
+                 start_method: str = RENDER_START_METHOD):
+        self.processes = processes
+        self.shaper = shaper
+        self.segmentation = segmentation
+        self.start_method = start_method
+
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+        self.tasks = 0
+        self.in_flight = 0
+        self.failures = 0
+        self.restarts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, shaper: PayloadShaper, segmentation: str) -> Optional["RenderPool"]:
+        if RENDER_PROCESSES == "auto":
+            processes = (os.cpu_count() or 1) - 1
+            # One process gains nothing over threads and pays for the hand-off
+            if processes < 2:
+                return None
+        else:
+            processes = int(RENDER_PROCESSES or 0)
+        if processes <= 0:
+            return None
+        return cls(processes, shaper, segmentation)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        settings = {
+            "max_edge": self.shaper.max_edge,
+            "target_bytes": self.shaper.target_bytes,
+            "color_mode": self.shaper.color_mode,
+            "image_format": self.shaper.image_format,
+            "quality": self.shaper.quality,
+        }
+        return ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_init_worker,
+            initargs=(settings, self.segmentation),
+        )
+
+    async def warm_up(self):
+        """Start every process now rather than on the first scanned pages."""
+        await asyncio.gather(*(asyncio.wrap_future(self._executor.submit(_warm)) for _ in range(self.processes)))
+
+    @contextmanager
+    def share(self, source):
+        """Reference to a DocumentSource the pool processes can open; in-memory bytes get one shared copy."""
+        if source.path is not None:
+            yield ("path", source.path, source.size)
+            return
+
+        block = SharedMemory(create=True, size=max(1, len(source.data)))
+        try:
+            block.buf[:len(source.data)] = source.data
+            yield ("shm", block.name, len(source.data))
+        finally:
+            block.close()
+            block.unlink()
+
+    async def render(self, shared: SharedSource, page_index: Optional[int], fingerprint: bool = False,
+                     quality: str = "standard"):
+        """
+        Rasterize and encode one page (page_index None: an image upload) in a
+        pool process. Returns (units, payload stats, fingerprint, regions, tier);
+        the units still point at shared memory, so pass them to attach() or
+        release().
+        """
+        with self._lock:
+            self.tasks += 1
+            self.in_flight += 1
+
+        executor = self._executor
+        submitted = time.time()
+        try:
+            executor, future = self._submit(shared, page_index, fingerprint, quality)
+            try:
+                started, units, payload_stats, page_fingerprint, regions, tier, stages = await asyncio.wrap_future(
+                    future
+                )
+            except asyncio.CancelledError:
+                # A page that was already rendering still produces blocks; free them when it does
+                future.add_done_callback(self._release_abandoned)
+                raise
+        except BrokenProcessPool:
+            with self._lock:
+                self.failures += 1
+            self._restart(executor)
+            raise
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        waited = max(0.0, started - submitted)
+        with self._lock:
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        metrics.record_render_wait(waited)
+        metrics.merge_stages(stages)
+        return units, payload_stats, page_fingerprint, regions, tier
+
+    def _submit(self, *args):
+        executor = self._executor
+        try:
+            return executor, executor.submit(_render, *args)
+        except BrokenProcessPool:
+            # Broken by a crash on an earlier page, not by this one
+            executor = self._restart(executor)
+            return executor, executor.submit(_render, *args)
+
+    def _restart(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = self._new_executor()
+                self.restarts += 1
+            executor = self._executor
+        broken.shutdown(wait=False)
+        return executor
+
+    def attach(self, units):
+        """Replace shared memory image blocks with data-URL content blocks (and free the blocks)."""
+        # The page header crop is one block shared by every lot unit of the page
+        contents = {}
+        for parts, i, block in list(_image_blocks(units)):
+            name = block["shm"]
+            if name not in contents:
+                shm = SharedMemory(name=name)
+                try:
+                    contents[name] = self.shaper._content(shm.buf[:block["size"]], block["format"])
+                finally:
+                    shm.close()
+                    shm.unlink()
+            parts[i] = contents[name]
+        return units
+
+    def release(self, units):
+        """Free the image blocks of units that will not be sent."""
+        for name in {block["shm"] for _, _, block in _image_blocks(units)}:
+            _unlink(name)
+
+    def _release_abandoned(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.release(future.result()[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "start_method": self.start_method,
+                "tasks": self.tasks,
+                "in_flight": self.in_flight,
+                "failures": self.failures,
+                "restarts": self.restarts,
+                "wait_seconds_total": round(self.wait_seconds, 3),
+                "wait_seconds_max": round(self.max_wait_seconds, 3),
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,227 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional
+from app.domain.schemas import PlotData
+from app.services.lot_segmentation import LOT_HEADER, PageSegmentation
+
+RULES_ENABLED = os.getenv("RULES_ENABLED", "true").lower() not in ("0", "false", "no")
+# A page skips the provider only when every lot has all of these at or above RULES_MIN_CONFIDENCE
+RULES_REQUIRED_FIELDS = [
+    f.strip() for f in os.getenv(
+        "RULES_REQUIRED_FIELDS", "lot_no,block,model_selected,elevation,garage_swing"
+    ).split(",") if f.strip()
+]
+RULES_MIN_CONFIDENCE = float(os.getenv("RULES_MIN_CONFIDENCE", "0.9"))
+# Page text outside the lot sections longer than this (a title) may hold
+# document-wide values, so the page goes to the provider
+RULES_CONTEXT_MAX_CHARS = int(os.getenv("RULES_CONTEXT_MAX_CHARS", "120"))
+
+# Labels of machine-generated forms. Free-text fields need a colon after the
+# label so prose ("Elevation B all lots") is never read as a field; lot and
+# block take a bare number ("Lot 116 - 1685   Block 3").
+_LABELS = {
+    "lot_no": r"(?:lot|homesite)\s*(?:no\.?|#)?\s*:?(?=\s*\d)",
+    "block": r"(?:block|blk)\s*(?:no\.?|#)?\s*:?(?=\s*\d)",
+    "address": r"(?:address|street\s+address)\s*:",
+    "model_selected": r"(?:model\s*/\s*plan|model|plan)\s*(?:name)?\s*:",
+    "elevation": r"(?:elevation|elev\.?)\s*:",
+    "garage_swing": r"garage\s*(?:swing|side|orientation)?\s*:",
+    "external_structure": r"(?:exterior(?:\s+materials?)?|external\s+structure|materials?)\s*:",
+    "optional_notes": r"(?:notes?|options?|lot\s+notes)\s*:",
+}
+_LABEL = re.compile(
+    "|".join(rf"(?P<{field}>(?<![\w/]){pattern})" for field, pattern in _LABELS.items()),
+    re.IGNORECASE,
+)
+_POSITIONED = re.compile(r"^\[(-?\d+),(-?\d+)\]\s?(.*)$")
+_BULLET = re.compile(r"(?:^|\s)[-•*]\s+")
+_NUMBER = re.compile(r"^\s*(\d+[A-Za-z]?)\b")
+_ELEVATION_CODE = re.compile(r"^[A-Za-z]{1,2}\d?$")
+_SWING = re.compile(r"^(left|right|straight|l|r|s|lh|rh|lft|rt)\b", re.IGNORECASE)
+_SEPARATORS = " \t-–|,;"
+# Field words in page context ("Elevation B all lots", "Notes apply to every lot")
+_CONTEXT_FIELD = re.compile(
+    r"\b(?:elevations?|elev|models?|plans?|garages?|swing|notes?|options?|exteriors?|materials?)\b", re.IGNORECASE
+)
+
+# Header lines this close (points) are side by side, which a top-to-bottom read would interleave
+_ROW_TOLERANCE = 6.0
+
+_HIGH, _MEDIUM, _LOW = 0.95, 0.9, 0.5
+
+
+class RulePlot:
+    """A lot read by the rules, with a 0..1 confidence per field that was found."""
+
+    def __init__(self):
+        self.values: Dict[str, str] = {}
+        self.confidence: Dict[str, float] = {}
+        self._notes: List[str] = []
+
+    def set(self, field: str, value: str, confidence: float):
+        if field in self.values and self.values[field].lower() != value.lower():
+            # Two different values under one label: let the model decide
+            confidence = min(confidence, self.confidence[field], 0.4)
+        self.values[field] = value
+        self.confidence[field] = confidence
+
+    def note(self, text: str):
+        self._notes.append(text)
+
+    def finish(self):
+        if self._notes and "optional_notes" not in self.values:
+            self.values["optional_notes"] = "; ".join(self._notes)
+            self.confidence["optional_notes"] = 0.8
+
+    def to_plot(self) -> PlotData:
+        return PlotData(**self.values)
+
+
+def _score(field: str, value: str):
+    """(normalized value, confidence) for one labeled value, or None when empty."""
+    value = value.strip(_SEPARATORS)
+    if not value:
+        return None
+
+    if field in ("lot_no", "block"):
+        match = _NUMBER.match(value)
+        return (match.group(1), _HIGH) if match else (value, _LOW)
+
+    if field == "elevation":
+        return value, _HIGH if _ELEVATION_CODE.match(value) else 0.6
+
+    if field == "garage_swing":
+        return value, _HIGH if _SWING.match(value) else _LOW
+
+    if field == "address":
+        has_number = any(c.isdigit() for c in value)
+        return value, _MEDIUM if has_number and len(value) <= 120 else _LOW
+
+    if field == "optional_notes":
+        return value, 0.8
+
+    # model_selected, external_structure
+    return value, _MEDIUM if len(value) <= 80 and any(c.isalpha() for c in value) else _LOW
+
+
+def _lines(text: str):
+    """(x, y, text) per line of a positioned layout ("[x,y] a | b")."""
+    for raw in text.splitlines():
+        match = _POSITIONED.match(raw)
+        if match is None:
+            if raw.strip():
+                yield None, None, raw.strip()
+            continue
+        x, y, body = int(match.group(1)), int(match.group(2)), match.group(3)
+        for part in body.split(" | "):
+            if part.strip():
+                yield x, y, part.strip()
+
+
+class RuleExtractor:
+    """
+    Deterministic pre-extraction from the PDF text layer.
+
+    Machine-generated forms carry fixed labels ("Lot 116", "Block: 3",
+    "Elevation: B", "Garage Swing: Left"); precompiled patterns read them
+    into PlotData with a per-field confidence. A page whose every lot has all
+    required fields at high confidence needs no provider call; otherwise the
+    partial result is handed to the model as hints. Page context outside
+    the lot sections is not read by the rules, so a page whose context names
+    a field or is more than a title goes to the provider as well.
+    Scans have no text layer and always go to the provider.
+    """
+
+    def __init__(self, required_fields: List[str] = None, min_confidence: float = RULES_MIN_CONFIDENCE):
+        self.required_fields = required_fields or list(RULES_REQUIRED_FIELDS)
+        self.min_confidence = min_confidence
+
+    @classmethod
+    def from_env(cls) -> Optional["RuleExtractor"]:
+        if not RULES_ENABLED:
+            return None
+        return cls(RULES_REQUIRED_FIELDS, RULES_MIN_CONFIDENCE)
+
+    def extract(self, text: str) -> Optional[List[RulePlot]]:
+        """
+        Lots in one positioned text, read top to bottom. Lines above the first
+        lot header are page context and are left to the model. None when lot
+        headers sit side by side (columns would be interleaved).
+        """
+        lines = list(_lines(text))
+        headers = [(x, y) for x, y, line in lines if LOT_HEADER.match(line)]
+        for (x0, y0), (x1, y1) in zip(headers, headers[1:]):
+            if y0 is not None and y1 is not None and abs(y1 - y0) <= _ROW_TOLERANCE and x0 != x1:
+                return None
+
+        plots: List[RulePlot] = []
+        for _, _, line in lines:
+            if LOT_HEADER.match(line):
+                plots.append(RulePlot())
+            if not plots:
+                continue
+            current = plots[-1]
+
+            labels = list(_LABEL.finditer(line))
+            if not labels:
+                items = [item.strip() for item in _BULLET.split(line) if item.strip()]
+                for item in items:
+                    current.note(item)
+                continue
+
+            for i, match in enumerate(labels):
+                end = labels[i + 1].start() if i + 1 < len(labels) else len(line)
+                scored = _score(match.lastgroup, line[match.end():end])
+                if scored is not None:
+                    current.set(match.lastgroup, *scored)
+
+        for plot in plots:
+            plot.finish()
+        return plots
+
+    def extract_sections(self, layout: str, segmentation: Optional[PageSegmentation]) -> Optional[List[List[RulePlot]]]:
+        """Rule results per provider unit: one list per lot section, or one for the whole page."""
+        if segmentation is None:
+            plots = self.extract(layout)
+            return None if plots is None else [plots]
+        return [self.extract(lot.text) or [] for lot in segmentation.lots]
+
+    def page_context(self, layout: str, segmentation: Optional[PageSegmentation]) -> str:
+        """Page text outside the lot sections: the header band, or the lines above the first lot."""
+        if segmentation is not None:
+            text = segmentation.header.text if segmentation.header is not None else ""
+            return "\n".join(line for _, _, line in _lines(text))
+        context = []
+        for _, _, line in _lines(layout):
+            if LOT_HEADER.match(line):
+                break
+            context.append(line)
+        return "\n".join(context)
+
+    def substantive(self, context: str) -> bool:
+        return len(context) > RULES_CONTEXT_MAX_CHARS or _CONTEXT_FIELD.search(context) is not None
+
+    def is_complete(self, plot: RulePlot) -> bool:
+        return all(plot.confidence.get(field, 0.0) >= self.min_confidence for field in self.required_fields)
+
+    def confident(self, sections: List[List[RulePlot]]) -> bool:
+        plots = [plot for section in sections for plot in section]
+        return bool(plots) and all(self.is_complete(plot) for plot in plots)
+
+    def hint_content(self, plots: List[RulePlot]) -> Optional[dict]:
+        """Text block with the partial result, appended to the unit sent to the provider."""
+        hints = [
+            {field: {"value": plot.values[field], "confidence": plot.confidence[field]} for field in plot.values}
+            for plot in plots if plot.values
+        ]
+        if not hints:
+            return None
+        return {
+            "type": "text",
+            "text": (
+                "--- PRE-EXTRACTED FIELDS (deterministic parser, confidence 0-1) ---\n"
+                "Keep values the text confirms, correct any that are wrong and fill in the rest.\n"
+                + json.dumps(hints, ensure_ascii=False)
+            ),
+        }
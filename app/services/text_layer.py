@@ -0,0 +1,78 @@
+import os
+import re
+from typing import Optional
+
+TEXT_LAYER_ENABLED = os.getenv("TEXT_LAYER_ENABLED", "true").lower() not in ("0", "false", "no")
+# Below this many characters the page is treated as having no usable text layer
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", "80"))
+# Pages whose embedded images cover more than this share of the page are scans
+TEXT_LAYER_MAX_IMAGE_COVERAGE = float(os.getenv("TEXT_LAYER_MAX_IMAGE_COVERAGE", "0.5"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+TEXT_LAYER_PREAMBLE = (
+    "The document page is provided below as its extracted PDF text layer instead of an image. "
+    "Each line is one text block, prefixed with its [x,y] position in points from the top-left "
+    "corner; ' | ' separates the lines inside a block. Blocks are ordered top to bottom, left "
+    "to right. Use the positions to tell which values belong to which lot section.\n\n"
+)
+
+
+def _image_coverage(page) -> float:
+    page_area = abs(page.rect.width * page.rect.height) or 1.0
+    covered = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        covered += abs((x1 - x0) * (y1 - y0))
+    return min(1.0, covered / page_area)
+
+
+def _looks_like_text(text: str) -> bool:
+    """Reject garbage text layers (bad font encodings, OCR noise)."""
+    if "�" in text:
+        return False
+    visible = [c for c in text if not c.isspace()]
+    if not visible:
+        return False
+    readable = sum(1 for c in visible if c.isalnum() or c in ".,:;#-/()&'\"$%")
+    return readable / len(visible) >= 0.8
+
+
+def extract_page_layout(page) -> Optional[str]:
+    """
+    Returns a compact "[x,y] text" listing of the page's text blocks, or None
+    when the page has no usable text layer and must go down the image path.
+    """
+    if _image_coverage(page) > TEXT_LAYER_MAX_IMAGE_COVERAGE:
+        return None
+
+    lines = []
+    texts = []
+    # blocks: (x0, y0, x1, y1, text, block_no, block_type); type 0 is text
+    for x0, y0, x1, y1, text, _, block_type in sorted(
+        page.get_text("blocks"), key=lambda b: (round(b[1]), b[0])
+    ):
+        if block_type != 0:
+            continue
+        # Keep the block's line breaks visible; they separate label/value rows
+        text = " | ".join(
+            line for line in (_WHITESPACE.sub(" ", raw).strip() for raw in text.splitlines()) if line
+        )
+        if not text:
+            continue
+        texts.append(text)
+        lines.append(f"[{int(x0)},{int(y0)}] {text}")
+
+    raw_text = " ".join(texts)
+    if len(raw_text) < TEXT_LAYER_MIN_CHARS or not _looks_like_text(raw_text):
+        return None
+
+    return "\n".join(lines)
+
+
+def text_layer_content(layout: str, page_number: int):
+    """Wrap a page layout as a LangChain text content block."""
+    return {
+        "type": "text",
+        "text": f"{TEXT_LAYER_PREAMBLE}--- PAGE {page_number} TEXT LAYER ---\n{layout}",
+    }
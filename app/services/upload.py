@@ -0,0 +1,213 @@
+import io
+import os
+import json
+import asyncio
+import hashlib
+import tempfile
+from typing import BinaryIO, Optional
+from PIL import Image
+
+# Largest single document accepted (spooled size, after multipart decoding).
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+# Whole request body cap for /extract/batch (many files / ZIPs per request).
+MAX_BATCH_UPLOAD_BYTES = int(float(os.getenv("MAX_BATCH_UPLOAD_MB", "500")) * 1024 * 1024)
+# Where uploads are spooled; default is the system temp dir.
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+CHUNK_BYTES = 1024 * 1024
+# Multipart boundaries and part headers on top of the file itself
+MULTIPART_SLACK_BYTES = 64 * 1024
+
+_MAGIC = (
+    (b"%PDF-", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+    (b"PK\x03\x04", "zip"),
+)
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        self.limit = limit
+        super().__init__(f"Upload exceeds the {limit // (1024 * 1024)} MB limit.")
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """File type from its leading bytes; None when unrecognised."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    # PDFs may carry a little junk before the header
+    if b"%PDF-" in head[:1024]:
+        return "pdf"
+    for magic, kind in _MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+class DocumentSource:
+    """
+    One document to extract: either a file spooled to disk (API uploads) or
+    bytes already in memory (scripts, benchmarks).
+
+    Spooled documents are opened straight from their path, so PyMuPDF and PIL
+    read pages / pixels on demand instead of holding another full copy of
+    the upload. Call close() (or use `with`) to delete the spool file.
+    """
+
+    def __init__(self, filename: str, path: Optional[str] = None, data: Optional[bytes] = None,
+                 size: int = 0, sha256: Optional[str] = None, kind: Optional[str] = None):
+        self.filename = filename or ""
+        self.path = path
+        self.data = data
+        self.size = size
+        self._sha256 = sha256
+        self.kind = kind
+
+    @classmethod
+    def from_bytes(cls, data: bytes, filename: str) -> "DocumentSource":
+        return cls(filename, data=data, size=len(data), kind=sniff_type(data[:1024]))
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    @property
+    def is_pdf(self) -> bool:
+        if self.kind is not None:
+            return self.kind == "pdf"
+        return self.filename.lower().endswith(".pdf")
+
+    def open_pdf(self):
+        # Imported on first use (the app warms it up in the background) to keep startup fast
+        import pymupdf
+        if self.path is not None:
+            return pymupdf.open(self.path, filetype="pdf")
+        return pymupdf.open(stream=self.data, filetype="pdf")
+
+    def open_image(self) -> Image.Image:
+        if self.path is not None:
+            return Image.open(self.path)
+        return Image.open(io.BytesIO(self.data))
+
+    def read_bytes(self) -> bytes:
+        if self.path is None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spool_stream(stream: BinaryIO, filename: str, max_bytes: int = MAX_UPLOAD_BYTES) -> DocumentSource:
+    """
+    Copy a file-like object to a temp file in CHUNK_BYTES pieces, hashing and
+    sniffing the type on the way. Memory use is one chunk regardless of size;
+    raises UploadTooLarge as soon as max_bytes is passed.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+
+    fd, path = tempfile.mkstemp(prefix="upload-", dir=UPLOAD_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                if len(head) < 1024:
+                    head += chunk[:1024 - len(head)]
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+
+    return DocumentSource(filename, path=path, size=size, sha256=digest.hexdigest(), kind=sniff_type(head))
+
+
+async def spool_upload(upload, max_bytes: int = MAX_UPLOAD_BYTES) -> DocumentSource:
+    """Spool a FastAPI UploadFile to disk off the event loop."""
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    await upload.seek(0)
+    return await asyncio.to_thread(spool_stream, upload.file, upload.filename, max_bytes)
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects oversized request bodies with 413 before they are parsed.
+
+    A declared Content-Length over the limit is refused without reading the
+    body. Chunked uploads are counted as they arrive; once over the limit
+    the body is cut off and whatever error response the app produces is
+    replaced by the 413.
+    """
+
+    def __init__(self, app, limits: dict):
+        self.app = app
+        self.limits = limits  # path -> max request body bytes
+
+    async def _reject(self, send, limit: int):
+        body = json.dumps({"detail": str(UploadTooLarge(limit))}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None or scope.get("method") != "POST":
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await self._reject(send, limit)
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def limited_send(message):
+            if not exceeded:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                await self._reject(send, limit)
+
+        await self.app(scope, limited_receive, limited_send)
@@ -0,0 +1,59 @@
+"""
+Compare two benchmark result files written by benchmarks.run:
+
+    python -m benchmarks.compare baseline.json candidate.json
+"""
+import sys
+import json
+
+
+def _delta(old, new):
+    if old in (None, 0) or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def _row(label, old, new, fmt="{:.4f}"):
+    old_s = fmt.format(old) if old is not None else "-"
+    new_s = fmt.format(new) if new is not None else "-"
+    print(f"  {label:<28} {old_s:>14} {new_s:>14} {_delta(old, new):>9}")
+
+
+def compare(base, cand):
+    print(f"baseline:  {base['meta'].get('git_commit')}  {base['meta']['timestamp']}")
+    print(f"candidate: {cand['meta'].get('git_commit')}  {cand['meta']['timestamp']}")
+
+    for name in sorted(set(base["documents"]) | set(cand["documents"])):
+        old, new = base["documents"].get(name), cand["documents"].get(name)
+        print(f"\n{name}")
+        if not old or not new:
+            print("  (only in one run)")
+            continue
+        _row("wall median (s)", old["wall_seconds"]["median"], new["wall_seconds"]["median"])
+        _row("wall p95 (s)", old["wall_seconds"]["p95"], new["wall_seconds"]["p95"])
+        _row("cpu median (s)", old["cpu_seconds"]["median"], new["cpu_seconds"]["median"])
+        _row("payload bytes", old["payload_bytes"], new["payload_bytes"], "{:.0f}")
+        _row("peak python MB", old.get("peak_python_mb"), new.get("peak_python_mb"), "{:.1f}")
+        for stage in sorted(set(old["stage_seconds"]) | set(new["stage_seconds"])):
+            _row(f"stage {stage} (s)", old["stage_seconds"].get(stage), new["stage_seconds"].get(stage))
+
+    for section in ("library_throughput", "http_throughput"):
+        old, new = base.get(section), cand.get(section)
+        if old and new:
+            print(f"\n{section}")
+            _row("requests/s", old["requests_per_second"], new["requests_per_second"], "{:.2f}")
+            _row("latency p95 (s)", old["latency_seconds"]["p95"], new["latency_seconds"]["p95"])
+
+    print()
+    _row("max RSS MB", base.get("max_rss_mb"), cand.get("max_rss_mb"), "{:.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(2)
+    with open(sys.argv[1]) as f:
+        baseline = json.load(f)
+    with open(sys.argv[2]) as f:
+        candidate = json.load(f)
+    compare(baseline, candidate)
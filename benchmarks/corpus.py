@@ -0,0 +1,97 @@
+import io
+import random
+from typing import Dict, Tuple
+import pymupdf
+from PIL import Image, ImageDraw, ImageFilter
+
+# name -> (filename, bytes)
+Corpus = Dict[str, Tuple[str, bytes]]
+
+
+def _lot_lines(lot: int):
+    return [
+        f"Lot {lot} - 1685   Block 3",
+        "Model: Aspen II    Elevation: B",
+        "Garage Swing: Left",
+        "Exterior: Brick / Stone",
+        "- Dual sinks  - Shower in lieu of tub  - Patio slab",
+    ]
+
+
+def text_pdf(pages: int = 1, lots_per_page: int = 1) -> bytes:
+    """Born-digital PDF with a real text layer."""
+    doc = pymupdf.open()
+    lot = 100
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 48), "Sunrise Ridge - Lot Specific Order Form - Elevation B all lots")
+        y = 90
+        for _ in range(lots_per_page):
+            for line in _lot_lines(lot):
+                page.insert_text((72, y), line, fontsize=10)
+                y += 13
+            y += 22
+            lot += 1
+    return doc.tobytes()
+
+
+def _scan_image(width: int, height: int, lots: int, seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    img = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    draw.text((width // 20, height // 40), "SUNRISE RIDGE - SPEC REQUEST FORM", fill=0)
+
+    band = (height - height // 10) // max(1, lots)
+    for i in range(lots):
+        top = height // 10 + i * band
+        for k, line in enumerate(_lot_lines(100 + i)):
+            draw.text((width // 20, top + k * (band // 8)), line, fill=0)
+        # a few handwriting-like strokes
+        for _ in range(4):
+            x, y = rng.randrange(width // 2, width - 50), top + rng.randrange(0, band // 2)
+            draw.line((x, y, x + rng.randrange(20, 120), y + rng.randrange(-15, 15)), fill=40, width=3)
+    return img
+
+
+def scanned_pdf(pages: int = 1, lots_per_page: int = 1, seed: int = 0) -> bytes:
+    """Image-only PDF (no text layer), like a scanner produces."""
+    doc = pymupdf.open()
+    for p in range(pages):
+        img = _scan_image(1275, 1650, lots_per_page, seed + p)
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        page = doc.new_page(width=612, height=792)
+        page.insert_image(page.rect, stream=buf.getvalue())
+    return doc.tobytes()
+
+
+def photo_jpeg(width: int = 4032, height: int = 3024, seed: int = 0) -> bytes:
+    """Phone-photo-like colour JPEG of a form on a desk."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", (width, height), (122, 96, 70))
+    paper = _scan_image(int(width * 0.7), int(height * 0.9), 3, seed).convert("RGB")
+    img.paste(paper, (int(width * 0.15), int(height * 0.05)))
+    noise = Image.effect_noise((width // 4, height // 4), 30).resize((width, height)).convert("RGB")
+    img = Image.blend(img, noise, 0.08).filter(ImageFilter.GaussianBlur(1))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=rng.choice((92, 95)))
+    return buf.getvalue()
+
+
+def scan_png(lots: int = 6, seed: int = 0) -> bytes:
+    """300 DPI letter-size monochrome scan as PNG."""
+    buf = io.BytesIO()
+    _scan_image(2550, 3300, lots, seed).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def build_corpus(seed: int = 0) -> Corpus:
+    return {
+        "pdf_text_1p": ("text_1p.pdf", text_pdf(pages=1, lots_per_page=1)),
+        "pdf_text_multilot": ("text_multilot.pdf", text_pdf(pages=1, lots_per_page=8)),
+        "pdf_text_10p": ("text_10p.pdf", text_pdf(pages=10, lots_per_page=2)),
+        "pdf_scan_1p": ("scan_1p.pdf", scanned_pdf(pages=1, lots_per_page=1, seed=seed)),
+        "pdf_scan_5p": ("scan_5p.pdf", scanned_pdf(pages=5, lots_per_page=4, seed=seed)),
+        "jpeg_photo_12mp": ("photo.jpg", photo_jpeg(seed=seed)),
+        "png_scan_multilot": ("scan.png", scan_png(lots=6, seed=seed)),
+    }
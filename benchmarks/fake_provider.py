@@ -0,0 +1,64 @@
+import re
+import time
+import random
+import asyncio
+from collections import Counter
+from typing import Optional
+from app.domain.schemas import DocumentExtraction, PlotData
+from app.infrastructure import model_tiers
+from app.infrastructure.base_provider import BaseProvider
+
+_LOT = re.compile(r"(?:lot|homesite)\s*#?\s*(\d+)", re.IGNORECASE)
+# Latency of each model tier relative to `latency` (roughly flash-lite / flash / pro)
+TIER_LATENCY = {"fast": 0.5, "standard": 1.0, "strong": 2.0}
+
+
+class FakeProvider(BaseProvider):
+    """
+    Deterministic stand-in for the LLM providers; never touches the network.
+
+    Text parts yield one plot per lot header they contain; image-only calls
+    yield `plots_per_image` plots. Each call sleeps `latency` seconds
+    (± `jitter`, from a seeded RNG) scaled by the model tier's TIER_LATENCY
+    to simulate provider time; `tier_calls` counts calls per tier.
+    """
+
+    provider_name = "fake"
+    model_name = "fake-model"
+    prompt_version = "bench"
+
+    def __init__(self, latency: float = 0.2, jitter: float = 0.0, plots_per_image: int = 1, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.plots_per_image = plots_per_image
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.tier_calls = Counter()
+
+    def _delay(self) -> float:
+        tier = model_tiers.current() or "standard"
+        self.tier_calls[tier] += 1
+        latency = self.latency * TIER_LATENCY.get(tier, 1.0)
+        if not self.jitter:
+            return latency
+        return max(0.0, latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _result(self, image_parts) -> DocumentExtraction:
+        self.calls += 1
+        text = " ".join(p.get("text", "") for p in image_parts if p.get("type") == "text")
+        lots = list(dict.fromkeys(_LOT.findall(text)))
+
+        if lots:
+            plots = [PlotData(lot_no=lot, garage_swing="L", elevation="B") for lot in lots]
+        else:
+            plots = [PlotData(lot_no=str(100 + i), garage_swing="R") for i in range(self.plots_per_image)]
+
+        return DocumentExtraction(plots=plots)
+
+    def query_document(self, image_parts, instructions: Optional[str] = None) -> DocumentExtraction:
+        time.sleep(self._delay())
+        return self._result(image_parts)
+
+    async def aquery_document(self, image_parts, instructions: Optional[str] = None) -> DocumentExtraction:
+        await asyncio.sleep(self._delay())
+        return self._result(image_parts)
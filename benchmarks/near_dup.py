@@ -0,0 +1,89 @@
+"""
+Near-duplicate index lookup latency as the index grows.
+
+    python -m benchmarks.near_dup [--entries 200000] [--lookups 2000]
+
+The index is filled with templates-and-variants fingerprints (groups of
+pages that share most bits, like forms printed from one template), then
+queried with rescans of indexed pages (hits) and unseen pages (misses).
+Also times perceptual_hash on a letter-size 300 DPI scan.
+"""
+import time
+import random
+import argparse
+import statistics
+from app.infrastructure.near_duplicate_index import NearDuplicateIndex, HASH_BITS
+from app.services.near_duplicates import perceptual_hash
+from benchmarks.corpus import _scan_image
+
+NAMESPACE = "fake:fake-model:bench:text=1:seg=auto"
+
+
+def flip(rng, fingerprint: int, bits: int) -> int:
+    for bit in rng.sample(range(HASH_BITS), bits):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+def fill(index, rng, entries: int, per_template: int = 50):
+    pages = []
+    template = 0
+    for i in range(entries):
+        if i % per_template == 0:
+            template = rng.getrandbits(HASH_BITS)
+        # Same template, different entries: ~60 bits apart from each other
+        page = flip(rng, template, 30)
+        index.add(NAMESPACE, page, f"page:{i}")
+        pages.append(page)
+    return pages
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def time_lookups(index, queries):
+    timings = []
+    found = 0
+    for fingerprint in queries:
+        start = time.perf_counter()
+        found += index.lookup(NAMESPACE, fingerprint) is not None
+        timings.append((time.perf_counter() - start) * 1000)
+    return found, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=200_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--max-distance", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    index = NearDuplicateIndex(max_distance=args.max_distance, max_entries=args.entries)
+
+    start = time.perf_counter()
+    pages = fill(index, rng, args.entries)
+    print(f"indexed {args.entries} pages in {time.perf_counter() - start:.1f}s")
+
+    hits = [flip(rng, rng.choice(pages), rng.randint(0, args.max_distance)) for _ in range(args.lookups)]
+    misses = [flip(rng, rng.getrandbits(HASH_BITS), 0) for _ in range(args.lookups)]
+
+    print(f"{'query':<8} {'found':>7} {'p50_ms':>8} {'p99_ms':>8} {'max_ms':>8}")
+    for name, queries in (("rescan", hits), ("unseen", misses)):
+        found, timings = time_lookups(index, queries)
+        print(
+            f"{name:<8} {found:>7} {statistics.median(timings):>8.3f}"
+            f" {percentile(timings, 0.99):>8.3f} {max(timings):>8.3f}"
+        )
+
+    scan = _scan_image(2550, 3300, 6, 0)
+    start = time.perf_counter()
+    for _ in range(10):
+        perceptual_hash(scan)
+    print(f"perceptual_hash (2550x3300 scan): {(time.perf_counter() - start) * 100:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Per-page allocation cost of turning a rendered PDF page into a data URL.
+
+    python -m benchmarks.page_alloc [--pages 5]
+
+Paths compared (rendering happens before measuring, so only the payload
+path is counted):
+
+  baseline   original code: pix.samples -> Image.frombytes -> JPEG -> getvalue
+             -> b64encode -> decode -> f-string, no shaping
+  frombytes  Image.frombytes(pix.samples) copy fed to PayloadShaper.shape
+  view       pixmap_image(pix) zero-copy view fed to PayloadShaper.shape
+
+python_peak_kb is the tracemalloc peak (bytes / str objects). rss_peak_kb is
+the process high-water mark above the starting RSS, which also covers Pillow
+and MuPDF buffers (Linux only; resets VmHWM through /proc/self/clear_refs).
+"""
+import io
+import gc
+import ctypes
+import time
+import base64
+import argparse
+import statistics
+import tracemalloc
+from PIL import Image
+import pymupdf
+from app.services.image_payload import PayloadShaper, pixmap_image
+from benchmarks.corpus import text_pdf, scanned_pdf
+
+
+def legacy_payload(pix):
+    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG")
+    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_str}"}}
+
+
+def frombytes_payload(shaper, pix):
+    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    content, _ = shaper.shape(img, pix.stride * pix.height)
+    return content
+
+
+def view_payload(shaper, pix):
+    content, _ = shaper.shape(pixmap_image(pix), pix.stride * pix.height)
+    return content
+
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+
+def _pin_mmap_threshold():
+    # Serve every large buffer from its own mmap (returned to the OS on free),
+    # so VmHWM reflects the buffers of one call instead of heap reuse.
+    try:
+        ctypes.CDLL("libc.so.6").mallopt(-3, 128 * 1024)  # M_MMAP_THRESHOLD
+    except OSError:
+        pass
+
+
+def _reset_rss_peak() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(fn, pix):
+    gc.collect()
+    has_rss = _reset_rss_peak()
+    rss_start = _status_kb("VmRSS:") if has_rss else None
+
+    content = fn(pix)
+    rss_peak = (_status_kb("VmHWM:") - rss_start) if has_rss else float("nan")
+
+    # tracemalloc slows Python-heavy code, so time an untraced run separately
+    start = time.perf_counter()
+    fn(pix)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(pix)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "python_peak_kb": peak / 1024,
+        "rss_peak_kb": rss_peak,
+        "ms": elapsed * 1000,
+        "url_kb": len(content["image_url"]["url"]) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=5)
+    args = parser.parse_args()
+
+    _pin_mmap_threshold()
+    shaper = PayloadShaper.from_env()
+    documents = {
+        "text_pdf": text_pdf(pages=args.pages, lots_per_page=3),
+        "scanned_pdf": scanned_pdf(pages=args.pages, lots_per_page=3),
+    }
+    paths = {
+        "baseline": legacy_payload,
+        "frombytes": lambda pix: frombytes_payload(shaper, pix),
+        "view": lambda pix: view_payload(shaper, pix),
+    }
+
+    print(f"{'document':<12} {'path':<10} {'python_peak_kb':>15} {'rss_peak_kb':>12} {'ms':>8} {'url_kb':>8}")
+    for name, data in documents.items():
+        doc = pymupdf.open(stream=data, filetype="pdf")
+        pixmaps = [page.get_pixmap() for page in doc]
+        for path, fn in paths.items():
+            rows = [measure(fn, pix) for pix in pixmaps]
+            median = {k: statistics.median(r[k] for r in rows) for k in rows[0]}
+            print(
+                f"{name:<12} {path:<10} {median['python_peak_kb']:>15.0f} {median['rss_peak_kb']:>12.0f}"
+                f" {median['ms']:>8.1f} {median['url_kb']:>8.0f}"
+            )
+        doc.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Image preparation throughput: worker threads vs the render process pool.
+
+    python -m benchmarks.render_pool [--processes 16] [--documents 32]
+
+Concurrent extractions of scanned documents (image-only PDFs and 12 MP
+photos) against a zero-latency FakeProvider, so the time measured is
+rasterizing, segmenting, shaping and encoding. The thread run is what
+RENDER_PROCESSES=0 does; the pool run reports how long pages waited for a
+free process.
+"""
+import os
+import time
+import asyncio
+import argparse
+
+# Never hit the shared cache or write to the plot store
+os.environ["EXTRACTION_CACHE_ENABLED"] = "false"
+os.environ["PLOT_STORE_ENABLED"] = "false"
+
+from app.services.extractor_logic import DocumentExtractor
+from app.services.render_pool import RenderPool
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_provider import FakeProvider
+
+DOCUMENTS = ("pdf_scan_5p", "jpeg_photo_12mp", "png_scan_multilot")
+
+
+async def run(extractor, documents):
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(extractor.aprocess(data, filename, use_cache=False) for filename, data in documents))
+    return time.perf_counter() - start_wall, time.process_time() - start_cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--documents", type=int, default=32)
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    documents = [corpus[DOCUMENTS[i % len(DOCUMENTS)]] for i in range(args.documents)]
+
+    extractor = DocumentExtractor(max_concurrency=args.documents, provider=FakeProvider(latency=0.0))
+    extractor.cache = None
+    extractor.plot_store = None
+
+    print(f"{'mode':<16} {'wall_s':>8} {'docs/s':>8} {'parent_cpu_s':>13}")
+    extractor.render_pool = None
+    wall, cpu = asyncio.run(run(extractor, documents))
+    print(f"{'threads':<16} {wall:>8.2f} {len(documents) / wall:>8.1f} {cpu:>13.2f}")
+
+    pool = RenderPool(args.processes, extractor.shaper, extractor.segmentation)
+    extractor.render_pool = pool
+
+    async def pooled():
+        await pool.warm_up()
+        return await run(extractor, documents)
+
+    wall, cpu = asyncio.run(pooled())
+    print(f"{f'{args.processes} processes':<16} {wall:>8.2f} {len(documents) / wall:>8.1f} {cpu:>13.2f}")
+    stats = pool.stats()
+    print(f"pool: {stats['tasks']} pages, waited {stats['wait_seconds_total']:.2f}s in total, max {stats['wait_seconds_max']:.3f}s")
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
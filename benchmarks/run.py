@@ -0,0 +1,226 @@
+"""
+Offline benchmark of the extraction pipeline.
+
+Runs DocumentExtractor and the FastAPI app against a FakeProvider (no network)
+and a generated corpus, and writes machine-readable results:
+
+    python -m benchmarks.run --latency 0.2 --iterations 5 --output bench.json
+    python -m benchmarks.compare baseline.json bench.json
+
+Measured per corpus document (library call, sequential, cache disabled):
+wall time, process CPU time, per-stage time (from app.infrastructure.metrics),
+peak traced Python memory and payload bytes. Throughput is measured for
+concurrent library calls and for POST /extract through an in-process ASGI client.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+
+# Benchmarks must never hit the shared cache or write to the plot store
+os.environ["EXTRACTION_CACHE_ENABLED"] = "false"
+os.environ["PLOT_STORE_ENABLED"] = "false"
+
+from app.infrastructure import metrics
+from app.services.extractor_logic import DocumentExtractor
+from benchmarks.corpus import build_corpus
+from benchmarks.fake_provider import FakeProvider
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def _summary(values):
+    return {
+        "median": statistics.median(values),
+        "p95": _percentile(values, 95),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def _max_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+async def bench_document(extractor, filename, data, iterations, trace_memory):
+    walls, cpus, peaks = [], [], []
+    stages = {}
+    result = None
+
+    for _ in range(iterations):
+        gc.collect()
+        if trace_memory:
+            tracemalloc.start()
+
+        timer = metrics.begin_request(filename)
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        result = await extractor.aprocess(data, filename, use_cache=False)
+        walls.append(time.perf_counter() - wall_start)
+        cpus.append(time.process_time() - cpu_start)
+
+        if trace_memory:
+            peaks.append(tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+            tracemalloc.stop()
+
+        for name, seconds in timer.durations.items():
+            stages.setdefault(name, []).append(seconds)
+
+    return {
+        "filename": filename,
+        "input_bytes": len(data),
+        "wall_seconds": _summary(walls),
+        "cpu_seconds": _summary(cpus),
+        "stage_seconds": {name: statistics.median(v) for name, v in stages.items()},
+        "peak_python_mb": max(peaks) if peaks else None,
+        "payload_bytes": result.meta.payload_bytes,
+        "plots": len(result.plots),
+        "tiers": [tier.tier for tier in result.meta.tiers],
+    }
+
+
+async def bench_throughput(extractor, corpus, requests, concurrency):
+    items = list(corpus.values())
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        filename, data = items[i % len(items)]
+        async with gate:
+            start = time.perf_counter()
+            await extractor.aprocess(data, filename, use_cache=False)
+            latencies.append(time.perf_counter() - start)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - wall_start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "cpu_seconds": time.process_time() - cpu_start,
+        "requests_per_second": requests / wall,
+        "latency_seconds": _summary(latencies),
+    }
+
+
+async def bench_http(extractor, corpus, requests, concurrency):
+    import httpx
+    import app.main as api
+
+    api.extractor = extractor
+    items = list(corpus.values())
+    gate = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one(i):
+            filename, data = items[i % len(items)]
+            async with gate:
+                start = time.perf_counter()
+                response = await client.post("/extract", params={"refresh": "true"}, files={"file": (filename, data)})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - wall_start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "requests_per_second": requests / wall,
+        "latency_seconds": _summary(latencies),
+        "status_codes": statuses,
+    }
+
+
+async def main(args):
+    corpus = build_corpus(seed=args.seed)
+    if args.only:
+        corpus = {k: v for k, v in corpus.items() if k in args.only.split(",")}
+
+    provider = FakeProvider(latency=args.latency, jitter=args.jitter, seed=args.seed)
+    extractor = DocumentExtractor(provider=provider)
+    extractor.cache = None
+    extractor.plot_store = None
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": vars(args),
+        },
+        "documents": {},
+    }
+
+    for name, (filename, data) in corpus.items():
+        print(f"--- Benchmarking {name} ({len(data)} bytes) ---", file=sys.stderr)
+        results["documents"][name] = await bench_document(
+            extractor, filename, data, args.iterations, args.trace_memory
+        )
+
+    print("--- Benchmarking library throughput ---", file=sys.stderr)
+    results["library_throughput"] = await bench_throughput(extractor, corpus, args.requests, args.concurrency)
+
+    if not args.skip_http:
+        print("--- Benchmarking HTTP throughput ---", file=sys.stderr)
+        results["http_throughput"] = await bench_http(extractor, corpus, args.requests, args.concurrency)
+
+    results["max_rss_mb"] = _max_rss_mb()
+    results["provider_calls"] = provider.calls
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline extraction pipeline benchmark")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated provider latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="± random latency (s)")
+    parser.add_argument("--iterations", type=int, default=3, help="Runs per corpus document")
+    parser.add_argument("--requests", type=int, default=50, help="Requests for the throughput runs")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent requests for the throughput runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="Comma-separated corpus names to run")
+    parser.add_argument("--trace-memory", action="store_true", help="Track peak Python allocations (slower)")
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(main(args))
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload)
+        print(f"--- Results written to {args.output} ---", file=sys.stderr)
+    else:
+        print(payload)